@@ -7,11 +7,24 @@ coverage.start()
 
 import asp_selftest.plugins.clingo_main_plugin
 
+# plugins load lazily; import them before their users, so their tests run first
+import asp_selftest.plugins
+asp_selftest.plugins.import_all()
+
 import asp_selftest.session2
 import asp_selftest.integration
+import asp_selftest.aio
 import asp_selftest.arguments
 import asp_selftest.moretests
 import asp_selftest.lib
+import asp_selftest.startup
+import asp_selftest.server
+try:
+    import pytest
+except ImportError:  # optional dependency
+    pass
+else:
+    import asp_selftest.pytest_plugin
 
 
 coverage.stop()
@@ -7,6 +7,7 @@
     Tests are in moretests.py to keep to module importable with choice of running tests or not
 """
 
+import os
 import sys
 
 
@@ -15,16 +16,100 @@ def clingo_plus():
 
     from .arguments import maybe_silence_tester
     remaining = maybe_silence_tester()
+    return run_plus(remaining)
+
+
+def run_plus(argv, discovery_cache=None):
+    """ Runs clingo+ with argv, after maybe_silence_tester(). """
 
     from .arguments import parse_plus_arguments
-    args, remaining = parse_plus_arguments(remaining)
+    args, remaining = parse_plus_arguments(argv)
+
+    if args.serve is not None:
+        from .server import serve
+        return serve(args.serve)
+
+    timings_path = args.timings
+    if timings_path == '':
+        from .plugins.misc import cache_dir
+        timings_path = os.path.join(cache_dir(), 'test-timings.json')
+
+    if args.merge_results:
+        from .plugins.sharding import Timings, merge_results
+        report, failed = merge_results(args.merge_results, timings_path and Timings(timings_path))
+        print(report)
+        sys.exit(1 if failed else 0)
+
+    results = []
+    timings = schedule = None
+    if timings_path:
+        from .plugins.sharding import Timings
+        timings = Timings(timings_path)
+    found = []
+    if args.shard or timings or args.results:
+        from .plugins.sharding import shard_units, order_units
+        def schedule(units):
+            found.append(len(units))
+            if args.shard:
+                units = shard_units(units, *args.shard, timings)
+            return order_units(units, timings) if timings else units
+
+    ground_cache = None
+    if args.ground_cache:
+        from .plugins.misc import cache_dir
+        from .plugins.groundcache import GroundCache
+        ground_cache = GroundCache(os.path.join(cache_dir(), 'passed-ground-programs'))
+
+    context_stats = None
+    if args.context_stats:
+        from .plugins.compound_context_plugin import ContextStats
+        context_stats = ContextStats()
+
+    script_cache = None
+    if args.cache_scripts:
+        from .plugins.script_cache_plugin import ScriptCache
+        script_cache = ScriptCache()
 
     from .session2 import clingo_main_session
-    clingo_main_session(run_tests=args.run_asp_tests, arguments=remaining)
-    
-    #import cProfile
-    #with cProfile.Profile() as p:
-    #    try:
-    #        main_clingo_plus(clingo_options, programs=plus_options.programs)
-    #    finally:
-    #        p.dump_stats('profile.prof') # use snakeviz to view
+    from .plugins.python_profile import python_profile
+    from .plugins.tracing import trace_file
+    try:
+        with trace_file(args.trace_file), python_profile(args.profile_python, args.profile_phase):
+            clingo_main_session(
+                run_tests=args.run_asp_tests,
+                ground_cache=ground_cache,
+                script_cache=script_cache,
+                profile_grounding=args.profile_grounding,
+                model_output=args.model_output,
+                model_format=args.model_format,
+                fact_files=args.cached_facts,
+                context_stats=context_stats,
+                discovery_cache=discovery_cache,
+                jobs=args.jobs,
+                schedule=schedule,
+                keep_going=args.keep_going,
+                on_test=results.append if timings or args.results else None,
+                arguments=remaining + args.cached_facts)
+    finally:
+        if args.results:
+            from .plugins.sharding import write_results
+            write_results(args.results, results, args.shard or (1, 1), sum(found) if found else None)
+        if timings and not args.shard:  # shards must split alike; --merge-results updates
+            timings.update(results)
+            timings.save()
+    if context_stats:
+        print(context_stats.report(), file=sys.stderr)
+
+
+# entry point of clingo+client, see pyproject.toml
+def clingo_plus_client():
+    """ Lets a clingo+ --serve run the arguments, or runs them here when none is running. """
+    from .testing import defer
+    defer()
+    from .server import request, socket_path
+    argv = sys.argv[1:]
+    try:
+        return request(socket_path(), argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        from .arguments import maybe_silence_tester
+        return run_plus(maybe_silence_tester(argv))
@@ -0,0 +1,141 @@
+""" Awaitable sessions, for programs running on an asyncio event loop.
+
+    Loading, running the tests and grounding happen in ground_exc(), in an
+    executor thread; include paths are per session, so sessions can share the
+    process. Solving uses control.solve(async_=True): Clingo calls back from
+    its own thread when a model is found or the search is done, so the loop
+    is never blocked while waiting. A Model is only valid during its callback,
+    hence models are yielded as SolvedModel copies.
+"""
+
+import asyncio
+import functools
+import clingo
+
+from .integration import ground_exc
+
+from .testing import get_tester
+test = get_tester(__name__)
+
+
+class SolvedModel:
+    """ Copy of a clingo.Model: what it shows, its number and its cost. """
+
+    def __init__(self, model):
+        self.symbols = model.symbols(shown=True)
+        self.number = model.number
+        self.cost = model.cost
+        self.optimality_proven = model.optimality_proven
+
+    def __str__(self):
+        return ' '.join(map(str, self.symbols))
+
+    def __repr__(self):
+        return f"SolvedModel({self.number}, {str(self)!r})"
+
+
+async def ground_async(executor=None, on_test=None, **etc):
+    """ Runs ground_exc(**etc) in executor (default: the loop's); returns the Control.
+        on_test, when given, is called on the loop for each test that ran.
+    """
+    loop = asyncio.get_running_loop()
+    if on_test:
+        etc['on_test'] = lambda result: loop.call_soon_threadsafe(on_test, result)
+    return await loop.run_in_executor(executor, functools.partial(ground_exc, **etc))
+
+
+async def solve_async(control, **kw):
+    """ Solves without blocking the loop; yields a SolvedModel for each model and
+        finally the clingo.SolveResult. Stopping early interrupts the search.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    def on_model(model):
+        loop.call_soon_threadsafe(queue.put_nowait, SolvedModel(model))
+    def on_finish(result):
+        loop.call_soon_threadsafe(queue.put_nowait, result)
+    item = None
+    with control.solve(on_model=on_model, on_finish=on_finish, async_=True, **kw):
+        try:
+            while not isinstance(item := await queue.get(), clingo.SolveResult):
+                yield item
+            yield item
+        finally:
+            if not isinstance(item, clingo.SolveResult):
+                control.interrupt()
+                while not isinstance(await queue.get(), clingo.SolveResult):
+                    pass
+
+
+async def session_async(executor=None, assumptions=(), **etc):
+    """ Grounds like ground_exc(**etc) and solves; yields a TestResult for each test
+        as it finishes, then a SolvedModel for each model and finally the clingo.SolveResult.
+    """
+    queue = asyncio.Queue()
+    grounding = asyncio.ensure_future(ground_async(executor=executor, on_test=queue.put_nowait, **etc))
+    try:
+        while not grounding.done() or not queue.empty():
+            getting = asyncio.ensure_future(queue.get())
+            await asyncio.wait((getting, grounding), return_when=asyncio.FIRST_COMPLETED)
+            if getting.done():
+                yield getting.result()
+            else:
+                getting.cancel()
+        control = grounding.result()
+    finally:
+        if not grounding.done():
+            await asyncio.wait((grounding,))  # a thread cannot be stopped
+    async for item in solve_async(control, assumptions=assumptions):
+        yield item
+
+
+@test
+def solve_without_blocking_the_loop():
+    control = clingo.Control(['0'])
+    control.add("{a; b}. c.")
+    control.ground()
+    async def main():
+        return [str(item) async for item in solve_async(control)]
+    results = asyncio.run(main())
+    test.eq(['a b c', 'a c', 'b c', 'c'], sorted(results[:-1]))
+    test.eq('SAT', results[-1])
+
+
+@test
+def stop_solving_early():
+    control = clingo.Control(['0'])
+    control.add("{a(1..20)}.")
+    control.ground()
+    async def main():
+        async for model in solve_async(control):
+            return model
+    model = asyncio.run(main())
+    test.eq(1, model.number)
+    test.startswith(repr(model), "SolvedModel(1, ")
+    with control.solve(yield_=True) as models:  # control can be used again
+        test.truth(any(models))
+
+
+@test
+def sessions_on_one_loop(stdout):
+    from .plugins.testrunner_plugin import TestResult
+    async def run(n):
+        source = f"p({n}). #program test_p(base). cannot(p) :- not p({n})."
+        return [item async for item in session_async(source=source, arguments=['0'])]
+    async def main():
+        return await asyncio.gather(*(run(n) for n in range(8)))
+    for n, (test_p, base, model, result) in enumerate(asyncio.run(main())):
+        test.isinstance(test_p, TestResult)
+        test.eq('test_p(base)', test_p.name)
+        test.eq('base', base.name)
+        test.eq(f'p({n})', str(model))
+        test.truth(result.satisfiable)
+
+
+@test
+def session_raises_failing_test(stdout):
+    from .plugins.testrunner_plugin import ConstraintError
+    async def main():
+        return [item async for item in session_async(source='#program test_a. cannot("a fails").')]
+    with test.raises(ConstraintError, 'cannot("a fails")'):
+        asyncio.run(main())
@@ -3,7 +3,8 @@
 
 import argparse
 import sys
-import selftest
+
+from .testing import defer
 
 
 silent = argparse.ArgumentParser(add_help=False, exit_on_error=False)
@@ -13,6 +14,9 @@ silent.add_argument('--run-python-tests', help="Also run in-source Python tests.
 def maybe_silence_tester(argv=None):
     args, unknown = silent.parse_known_args(argv)
     if not args.run_python_tests:
+        if defer():
+            return unknown  # selftest is not even imported
+        import selftest
         try:
             # must be called first and can only be called once, but, when
             # we are imported from another app that also uses --silent, 
@@ -24,9 +28,23 @@ def maybe_silence_tester(argv=None):
             CR = '\n'
             assert not root.option_get('run'), "In order to NOT run Python tests, " \
                 f"Tester {root}{CR} must have been configured to NOT run tests."
+    else:
+        from .plugins import import_all
+        import_all()
     return unknown
 
 
+def shard(text):
+    """ I/N: shard I of N, counting from 1 """
+    try:
+        index, count = map(int, text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not I/N") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"{text!r}: I must be between 1 and N")
+    return index, count
+
+
 def parse_plus_arguments(argv=None):
     argparser = argparse.ArgumentParser(
             parents=[silent],
@@ -35,6 +53,23 @@ def parse_plus_arguments(argv=None):
             description='Runs in-source ASP tests in given logic programs, on top of standard clingo.',
             epilog="Clingo options below.\n")
     argparser.add_argument('--run-asp-tests', help="Run all selftests in ASP code.", action='store_true')
+    argparser.add_argument('--profile-grounding', help="Print the N rules with most ground instances (default 10), for the main program and each test.", metavar='N', type=int, nargs='?', const=10, default=0)
+    argparser.add_argument('--profile-python', help="Profile Python code to FILE (pstats) and FILE.collapsed (flame graphs).", metavar='FILE', nargs='?', const='profile.prof')
+    argparser.add_argument('--profile-phase', help="Phase for --profile-python: run, discovery, reify, solve or test:NAME.", metavar='PHASE', default='run')
+    argparser.add_argument('--trace-file', help="Write a timeline of the run to FILE (Chrome trace event format).", metavar='FILE')
+    argparser.add_argument('--context-stats', help="Report calls and time per context @function.", action='store_true')
+    argparser.add_argument('--cache-scripts', help="Execute each #script (python) block once per run, not once per test.", action='store_true')
+    argparser.add_argument('--jobs', help="Run up to N tests at the same time.", metavar='N', type=int, default=1)
+    argparser.add_argument('--keep-going', help="Run all tests, also after one failed; the first failure is raised at the end.", action='store_true')
+    argparser.add_argument('--shard', help="Run only shard I of N of the tests, balanced by --timings.", metavar='I/N', type=shard)
+    argparser.add_argument('--timings', help="Durations and failures of tests in earlier runs, to balance --shard and to start recently failed and slow tests first; updated after each run, except --shard runs. Without FILE, a history kept in the cache directory.", metavar='FILE', nargs='?', const='')
+    argparser.add_argument('--results', help="Write the result of each test to FILE (JSON lines), for --merge-results.", metavar='FILE')
+    argparser.add_argument('--merge-results', help="Report on the --results of all shards, and update --timings.", metavar='FILE', nargs='+')
+    argparser.add_argument('--ground-cache', help="Do not solve tests again whose ground program passed before.", action='store_true')
+    argparser.add_argument('--model-output', help="Also write all models to this file ('-' for stdout).", metavar='FILE')
+    argparser.add_argument('--cached-facts', help="Load this file with only facts, compiled and cached when that is faster.", metavar='FILE', action='append', default=[])
+    argparser.add_argument('--serve', help="Serve requests from clingo+client on a Unix socket (default in $XDG_RUNTIME_DIR).", metavar='SOCKET', nargs='?', const='')
+    argparser.add_argument('--model-format', help="Format for --model-output.", choices=('ndjson', 'binary'), default='ndjson')
     # we try to make the --help as compatible with Clingo as possible
     argparser.add_argument('-h', '--help', help="Show all info on arguments.", type=int, nargs='?', choices=(1,2,3), const=1, default=None)
     args, unknown = argparser.parse_known_args(argv)
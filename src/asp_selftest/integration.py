@@ -23,10 +23,16 @@ from .plugins import (
     stdin_to_tempfile_plugin,
     compound_context_plugin,
     clingo_reify_plugin,
+    Table,
+    CompoundContext,
+    ContextStats,
+    memoize,
+    bulk,
+    ScriptCache,
 )
 
-import selftest
-test = selftest.get_tester(__name__)
+from .testing import get_tester
+test = get_tester(__name__)
 
 
 def ground_exc(source=None, label=None, files=(),
@@ -34,26 +40,37 @@ def ground_exc(source=None, label=None, files=(),
                observer=None, trace=None,
                session=clingo_session,
                **etc):
-    """ a general pupose one-stop ground function """
-    old_path = os.environ.get('CLINGOPATH', '').split(':')
-    os.environ['CLINGOPATH'] = ':'.join((*old_path, *include_paths))
+    """ a general pupose one-stop ground function; include_paths apply to this call only """
+    control = clingo.Control(arguments=arguments)
+    if observer:
+        control.register_observer(observer)
+    with session(
+        control=control,
+        source=source,
+        label=label,
+        files=files,
+        include_paths=include_paths,
+        arguments=arguments,
+        yield_=True,
+        **etc): # not consuming the result so no solving takes place
+        pass    # closing it leaves control ready to solve
+    return control
+
+
+def run_asp_tests(files=(), keep_going=True, session=clingo_session, **etc):
+    """ Runs the tests in files, and source, without printing; returns a TestResult for each.
+        With keep_going, all tests run and failures are in the results; otherwise the first
+        failure is raised. Errors outside tests, like syntax errors, are always raised.
+    """
+    results = []
     try:
-        control = clingo.Control(arguments=arguments)
-        if observer:
-            control.register_observer(observer)
-        session(
-            control=control,
-            source=source,
-            label=label,
-            files=files,
-            arguments=arguments,
-            yield_=True,
-            **etc) # not consuming the result so no solving takes place
-        return control
-    finally:
-        os.environ.pop('CLINGOPATH')
-        if old_path:
-            os.environ['CLINGOPATH'] = ':'.join(old_path)
+        with session(files=files, on_test=results.append, keep_going=keep_going, quiet=True,
+                     parts=(), yield_=True, **etc): # tests only: nothing is grounded or solved
+            pass
+    except Exception as e:
+        if not keep_going or not any(r.error is e for r in results):
+            raise
+    return results
 
 
 @test
@@ -64,6 +81,34 @@ def ground_simple(stdout):
     test.endswith(stdout.getvalue(), "-string.lp\nTesting base\n  base\n")
 
 
+@test
+def solve_after_ground(stdout):
+    control = ground_exc(source="{a}.", arguments=['0'])
+    with control.solve(yield_=True) as models:
+        test.eq(['', 'a'], sorted(str(m) for m in models))
+
+
+@test
+def run_all_tests_and_collect(tmp_path, stdout):
+    from .plugins.testrunner_plugin import ConstraintError
+    part = write_file(tmp_path/'part.lp', 'p.\n#program test_p(base).\ncannot("no q") :- not q.')
+    main = write_file(tmp_path/'main.lp', f'#include "{part}".\nq :- r.\n#program test_q(base).\n'
+                                           'cannot("no q") :- not q.\n#program test_r(base).\nr.\n')
+    results = run_asp_tests(files=(main,))
+    test.eq([('test_p(base)', part, 2, 'failed'), ('test_q(base)', main, 3, 'failed'),
+             ('test_r(base)', main, 5, 'passed'), ('base', main, '?', 'passed')],
+            [(r.name, r.filename, r.lineno, r.status) for r in results])
+    test.eq(['cannot("no q")'], [str(f) for f in results[0].failures])
+    test.eq(None, results[0].statistics)
+    test.eq(1, results[2].statistics['summary']['models']['enumerated'])
+    test.eq('', stdout.getvalue())
+    test.eq(['failed', 'failed', 'passed', 'passed'], [r.status for r in run_asp_tests(files=(main,), jobs=4)])
+    with test.raises(ConstraintError, 'cannot("no q")'):
+        run_asp_tests(files=(main,), keep_going=False)
+    with test.raises(SyntaxError):
+        run_asp_tests(source='error')
+
+
 @test
 def ground_files(tmp_path, stdout):
     f1 = write_file(tmp_path/'f1', "f(1).")
@@ -110,6 +155,47 @@ def has_reify(stdout):
     test.endswith(stdout.getvalue(), "-string.lp\nTesting base\n  base\n")
 
 
+@test
+def ground_compressed_files(tmp_path, stdout):
+    import gzip
+    f1 = (tmp_path/'f1.lp.gz').as_posix()
+    with gzip.open(f1, 'wt') as f:
+        f.write('f(1).\n#program test_f(base).\ncannot("f") :- not f(1).\n')
+    control = ground_exc(files=(f1,))
+    test.eq(['f(1)'], list_symbols(control))
+    test.contains(stdout.getvalue(), f"Testing {f1}\n  test_f(base)\nTesting base\n  base\n")
+
+
+@test
+def syntaxerror_in_compressed_file(tmp_path, stdout):
+    import lzma
+    f1 = (tmp_path/'f1.lp.xz').as_posix()
+    with lzma.open(f1, 'wt') as f:
+        f.write('a.\nb.\nerror')
+    with test.raises(SyntaxError, "syntax error, unexpected EOF") as e:
+        ground_exc(files=(f1,))
+    test.eq(f1, e.exception.filename)
+    test.eq(4, e.exception.lineno)
+    test.eq('    1 a.\n    2 b.\n    3 error\n      ^ syntax error, unexpected EOF', e.exception.text)
+
+
+@test
+def ground_with_tables(tmp_path, stdout):
+    edges = write_file(tmp_path/'edges.tsv', "a\tb\nb\tc\n")
+    control = ground_exc(
+        source='node(X) :- edge(X, _).  #program test_nodes(base).  cannot("no a") :- not node(a).'
+               '  #program test_alone.  #defined edge/2.  cannot("sees tables") :- edge(_, _).',
+        tables=[Table('edge', edges, ((0, 'constant'), (1, 'constant')))])
+    test.eq(['edge(a,b)', 'edge(b,c)', 'node(a)', 'node(b)'], sorted(list_symbols(control)))
+    test.contains(stdout.getvalue(), "  test_nodes(base)\n  test_alone()\nTesting base\n  base\n")
+
+
+@test
+def ground_with_arrays(stdout):
+    control = ground_exc(source='node(X) :- edge(X, _).', facts={'edge/2': [(1, 2), (3, 4)]})
+    test.eq(['edge(1,2)', 'edge(3,4)', 'node(1)', 'node(3)'], sorted(list_symbols(control)))
+
+
 @test
 def include_path(tmp_path, stdout):
     before = os.environ.get('CLINGOPATH', 'nope')
@@ -123,6 +209,26 @@ def include_path(tmp_path, stdout):
     test.endswith(out, "-string.lp\nTesting base\n  base\n")
 
 
+@test
+def include_paths_per_thread(tmp_path, stdout):
+    import threading
+    for name in 'abcdefgh':
+        (tmp_path/name).mkdir()
+        write_file(tmp_path/name/'inc.lp', f"included({name}).")
+    results = {}
+    def ground(name):
+        barrier.wait()
+        control = ground_exc(source='#include "inc.lp".', include_paths=[(tmp_path/name).as_posix()])
+        results[name] = list_symbols(control)
+    barrier = threading.Barrier(8)
+    threads = [threading.Thread(target=ground, args=(name,)) for name in 'abcdefgh']
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    test.eq({name: [f'included({name})'] for name in 'abcdefgh'}, results)
+
+
 class ContextA:
     def a(self):
         return clingo.String("AA")
@@ -229,3 +335,140 @@ def maybe_session_is_the_problem():
     test.eq(1, models)
 
 
+
+
+@test
+def resolve_context_functions_once():
+    class Counting:
+        lookups = 0
+        def __getattr__(self, name):
+            Counting.lookups += 1
+            if name == 'f':
+                return lambda x: x
+            raise AttributeError(name)
+    context = CompoundContext(Counting())
+    test.eq(1, context.f(1))
+    test.eq(2, context.f(2))
+    test.eq(1, Counting.lookups)
+    context.add_context(ContextA())
+    test.eq(clingo.String("AA"), context.a())
+    test.eq(3, context.f(3))
+    test.eq(3, Counting.lookups)  # a, then f again
+    with test.raises(AttributeError):
+        context.not_there
+
+
+@test
+def memoize_pure_context_functions(stdout):
+    calls = []
+    class Context:
+        @memoize(maxsize=3)
+        def square(self, x):
+            calls.append(x.number)
+            return clingo.Number(x.number * x.number)
+    source = "p(@square(1..3)). q(@square(1..3))."
+    stats = ContextStats()
+    response = clingo_session(source=source, context=Context(), context_stats=stats, yield_=True)
+    test.eq([1, 2, 3], calls)  # once, for the test and for the main program
+    info = Context.square.cache_info()
+    test.eq(3, info.maxsize)
+    test.eq(3, info.currsize)
+    test.gt(info.hits, 0)
+    test.eq(3, info.misses)
+    report = stats.report().splitlines()
+    test.eq("Context functions:", report[0])
+    test.eq("       calls      cached   seconds  function", report[1])
+    calls_, hits, seconds, name = report[2].split()
+    test.eq(('@square', str(info.hits)), (name, hits))
+    test.eq(len(calls) + info.hits, int(calls_))
+    Context.square.cache_clear()
+    test.eq((0, 0, 3, 0), tuple(Context.square.cache_info()))
+
+
+@test
+def memoize_functions():
+    calls = []
+    @memoize
+    def f(a, b):
+        calls.append((a, b))
+        return a + b
+    test.eq(3, f(1, 2))
+    test.eq(3, f(1, 2))
+    test.eq(4, f(2, 2))
+    test.eq([(1, 2), (2, 2)], calls)
+    test.eq((1, 2, 100000, 2), tuple(f.cache_info()))
+
+
+@test
+def bulk_context_functions(stdout):
+    batches = []
+    class Context:
+        @bulk
+        def square(self, xs):
+            batches.append(list(xs))
+            return [x * x for x in xs]
+    source = """
+        node(1..3).
+        square(X, @square(X)) :- node(X).
+        big(X) :- node(X), #count{Y: Y = @square(X), Y > 4} > 0.
+        #program test_square(base).
+        cannot("square of 3") :- not square(3, 9).
+        cannot("big 3") :- not big(3).
+        """
+    response = clingo_session(source=source, context=Context(), yield_=True)
+    models = [str(m) for m in response]
+    test.eq(['big(3) node(1) node(2) node(3) square(1,1) square(2,4) square(3,9)'], [' '.join(sorted(m.split())) for m in models])
+    tables = [sorted(b) for b in batches if len(b) > 1]
+    test.eq([[1, 2, 3]] * len(tables), tables)
+    test.ge(len(tables), 2)  # the test and the main program
+    test.eq({1, 2, 3}, {b[0] for b in batches if len(b) == 1})  # calls inside #count are made one by one
+
+
+@test
+def bulk_context_functions_with_script(tmp_path):
+    import subprocess
+    f = write_file(tmp_path/'f.lp', """\
+#script (python)
+import clingo
+def seven():
+    return clingo.Number(7)
+#end.
+        square(X, @square(X)) :- X = 1..3.
+        seven(@seven()).
+        """)
+    code = f"""if True:
+        from asp_selftest.testing import defer; defer()
+        from asp_selftest.integration import ground_exc, bulk
+        class Context:
+            @bulk
+            def square(self, xs):
+                return [x * x for x in xs]
+        control = ground_exc(files=[{f!r}], context=Context())
+        print(sorted(str(sa.symbol) for sa in control.symbolic_atoms if not sa.symbol.name.startswith('__')))
+        """
+    # a fresh process, as Python is enabled in this one already
+    p = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                       env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    test.eq('', p.stderr)
+    test.eq("['seven(7)', 'square(1,1)', 'square(2,4)', 'square(3,9)']", p.stdout.splitlines()[-1])
+
+
+@test
+def execute_scripts_once_per_run(stdout):
+    source = """
+#script (python)
+import clingo
+def script_once_double(x):
+    return clingo.Number(2 * x.number)
+#end.
+        a(@script_once_double(21)).
+        #program test_a(base).
+        cannot("a") :- not a(42).
+        #program test_b(base).
+        cannot("b") :- a(21).
+        """
+    cache = ScriptCache()
+    response = clingo_session(source=source, script_cache=cache, yield_=True)
+    test.eq(['a(42)'], [str(m) for m in response])
+    test.eq(1, len(cache.executed))
+    test.ge(cache.hits, 3)  # test_a, test_b, base and the main program
@@ -1,18 +1,34 @@
 
 # some exports for other that find them interesting to use
 
-from .integration import ground_exc
+from .integration import ground_exc, run_asp_tests
 from .plugins.misc import format_symbols, write_file
+from .plugins.groundcache import GroundCache
 from .plugins import (
     source_plugin,
+    include_path_plugin,
     clingo_control_plugin,
     clingo_sequencer_plugin,
     insert_plugin_plugin,
     clingo_defaults_plugin,
     clingo_syntaxerror_plugin,
     testrunner_plugin,
+    TestResult,
     stdin_to_tempfile_plugin,
     compound_context_plugin,
+    CompoundContext,
+    ContextStats,
+    memoize,
+    bulk,
     clingo_reify_plugin,
+    table_loader_plugin,
+    Table,
+    model_writer_plugin,
+    fact_cache_plugin,
+    grounding_profile_plugin,
+    script_cache_plugin,
+    ScriptCache,
 )
 from .session2 import session2, clingo_session, clingo_main_session
+from .columnar import ColumnarModel, model_columns
+from .aio import ground_async, solve_async, session_async, SolvedModel
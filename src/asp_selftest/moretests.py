@@ -203,3 +203,100 @@ def bug_read_stdin_and_solve_with_run_tests():
     test.contains(p.stdout, b"Answer: 1 (Time: ")
     test.contains(p.stdout, b"s)\na b c\nSATISFIABLE\n")
     test.eq(b'', p.stderr)
+
+
+@test
+def shards_and_merge_results(tmp_path, argv, stdout, stderr):
+    import json
+    from .plugins.testrunner_plugin import ConstraintError
+    f = tmp_path/'f.lp'
+    f.write_text('a.\n#program test_1(base).\ncannot("one").\n#program test_2(base).\n'
+                 '#program test_3(base).\ncannot(a) :- not a.\n#program test_4(base).\n')
+    timings = (tmp_path/'timings.json').as_posix()
+    def run(*arguments):
+        argv[1:] = [*arguments, '--run-python-tests']
+        clingo_plus()
+    run(f.as_posix(), '--run-asp-tests', '--shard', '1/2', '--results', (tmp_path/'1.jsonl').as_posix(), '--timings', timings)
+    test.contains(stdout.getvalue(), f"Testing {f}\n  test_2(base)\n  test_4(base)\nTesting base\n  base\n")
+    test.comp.truth(os.path.exists(timings))  # only --merge-results updates timings
+    with test.raises(ConstraintError, 'cannot("one")'):
+        run(f.as_posix(), '--run-asp-tests', '--shard', '2/2', '--results', (tmp_path/'2.jsonl').as_posix(), '--keep-going')
+    test.contains(stdout.getvalue(), f"Testing {f}\n  test_1(base)\n  test_3(base)\n")  # went on after test_1
+    with test.raises(SystemExit) as e:
+        run('--merge-results', (tmp_path/'1.jsonl').as_posix(), (tmp_path/'2.jsonl').as_posix(), '--timings', timings)
+    test.eq(1, e.exception.code)
+    test.contains(stdout.getvalue(), "Merged 2 result files: 5 tests, 1 failed, ")
+    test.contains(stdout.getvalue(), f"FAILED test_1(base) in {f}, line 2:\n")
+    test.eq(5, len(json.load(open(timings))))
+    test.comp.contains(stdout.getvalue(), "MISSING")
+    with test.raises(SystemExit) as e:
+        run('--merge-results', (tmp_path/'1.jsonl').as_posix(), '--timings', timings)
+    test.contains(stdout.getvalue(), "MISSING results of shard 2 of 2.\nMISSING 2 tests did not run in any shard.\n")
+
+
+@test
+def failed_tests_first(tmp_path, argv, stdout, stderr):
+    from .plugins.testrunner_plugin import ConstraintError
+    f = tmp_path/'f.lp'
+    f.write_text('#program test_1(base).\n#program test_2(base).\n#program test_3(base).\ncannot("three").\n')
+    timings = (tmp_path/'timings.json').as_posix()
+    def run(*arguments):
+        argv[1:] = [f.as_posix(), '--run-asp-tests', '--run-python-tests', '--timings', timings, *arguments]
+        with test.raises(ConstraintError, 'cannot("three")'):
+            clingo_plus()
+    run('--keep-going')
+    test.contains(stdout.getvalue(), f"Testing {f}\n  test_1(base)\n  test_2(base)\n  test_3(base)\nTesting base\n  base\n")
+    run()
+    test.contains(stdout.getvalue(), f"Testing {f}\n  test_3(base)\n")  # started and failed first
+    test.eq(1, stdout.getvalue().count("test_1(base)"))
+
+
+@test
+def failures_from_forked_workers(tmp_path, stdout):
+    from .integration import run_asp_tests
+    from .plugins.testrunner_plugin import ConstraintError
+    main = tmp_path/'main.lp'
+    main.write_text('#script (python)\nfrom clingo import Number\ndef f(): return Number(1)\n#end.\n'
+                    '#program test_s(base).\na(@f()).\ncannot("s fails") :- a(1).\n')
+    test_s, base = run_asp_tests(files=(main.as_posix(),), jobs=2)
+    test.eq('failed', test_s.status)
+    test.eq(['cannot("s fails")'], test_s.failures)
+    test.isinstance(test_s.error, ConstraintError)
+    test.contains(test_s.error.__notes__[0], f"File {main}, line 5, in test_s(base). Model follows.")
+    test.eq('passed', base.status)
+
+
+@test
+def spans_from_forked_workers(tmp_path, stdout):
+    from .integration import run_asp_tests
+    from .plugins.tracing import trace_file
+    main = tmp_path/'main.lp'
+    main.write_text('#script (python)\nfrom clingo import Number\ndef f(): return Number(1)\n#end.\n'
+                    '#program test_s(base).\na(@f()).\n')
+    with trace_file((tmp_path/'trace.json').as_posix()) as tracer:
+        run_asp_tests(files=(main.as_posix(),), jobs=2)
+    spans = {e['name']: e for e in tracer.events if e['cat'] == 'test'}
+    test.eq({'test_s(base)', 'base'}, set(spans))
+    test.ne(os.getpid(), spans['test_s(base)']['pid'])
+    test.ne(os.getpid(), spans['base']['pid'])
+
+
+@test
+def no_fork_while_other_threads_run(tmp_path, stdout):
+    import threading
+    from .integration import run_asp_tests
+    from .plugins.tracing import trace_file
+    main = tmp_path/'main.lp'
+    main.write_text('#script (python)\nfrom clingo import Number\ndef f(): return Number(1)\n#end.\n'
+                    '#program test_s(base).\na(@f()).\n')
+    stop = threading.Event()
+    other = threading.Thread(target=stop.wait)
+    other.start()
+    try:
+        with trace_file((tmp_path/'trace.json').as_posix()) as tracer:
+            test_s, base = run_asp_tests(files=(main.as_posix(),), jobs=2)
+    finally:
+        stop.set()
+        other.join()
+    test.eq('passed', test_s.status)
+    test.eq({os.getpid()}, {e['pid'] for e in tracer.events if e['cat'] == 'test'})
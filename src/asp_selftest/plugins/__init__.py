@@ -1,13 +1,68 @@
+""" Plugins are imported when first used, not when this package is. That keeps
+    startup short: many plugins are only needed for some options.
+"""
 
-from .clingo_main_plugin import clingo_main_plugin
-from .source_plugin import source_plugin
-from .clingo_control_plugin import clingo_control_plugin
-from .clingo_syntaxerror_plugin import clingo_syntaxerror_plugin
-from .clingo_sequencer_plugin import clingo_sequencer_plugin
-from .clingo_defaults_plugin import clingo_defaults_plugin
-from .testrunner_plugin import testrunner_plugin
-from .clingo_reify_plugin import clingo_reify_plugin, THEORY_PATH
-from .insert_plugin_plugin import insert_plugin_plugin
-from .stdin_to_tempfile_plugin import stdin_to_tempfile_plugin
-from .compound_context_plugin import compound_context_plugin
+import sys
+import types
+import importlib
 
+
+EXPORTS = {
+    'clingo_main_plugin': 'clingo_main_plugin',
+    'source_plugin': 'source_plugin',
+    'include_path_plugin': 'include_path_plugin',
+    'clingo_control_plugin': 'clingo_control_plugin',
+    'clingo_syntaxerror_plugin': 'clingo_syntaxerror_plugin',
+    'clingo_sequencer_plugin': 'clingo_sequencer_plugin',
+    'clingo_defaults_plugin': 'clingo_defaults_plugin',
+    'testrunner_plugin': 'testrunner_plugin',
+    'TestResult': 'testrunner_plugin',
+    'clingo_reify_plugin': 'clingo_reify_plugin',
+    'THEORY_PATH': 'clingo_reify_plugin',
+    'insert_plugin_plugin': 'insert_plugin_plugin',
+    'stdin_to_tempfile_plugin': 'stdin_to_tempfile_plugin',
+    'compound_context_plugin': 'compound_context_plugin',
+    'CompoundContext': 'compound_context_plugin',
+    'ContextStats': 'compound_context_plugin',
+    'memoize': 'compound_context_plugin',
+    'bulk': 'compound_context_plugin',
+    'table_loader_plugin': 'table_loader_plugin',
+    'Table': 'table_loader_plugin',
+    'model_writer_plugin': 'model_writer_plugin',
+    'fact_cache_plugin': 'fact_cache_plugin',
+    'grounding_profile_plugin': 'grounding_profile_plugin',
+    'script_cache_plugin': 'script_cache_plugin',
+    'ScriptCache': 'script_cache_plugin',
+}
+
+
+def import_all():
+    """ Imports all plugins, and modules they import lazily, so that their in-source
+        tests run before those of the code using them.
+    """
+    for name in ('groundcache', 'bulk_functions', 'sharding', *EXPORTS.values()):
+        importlib.import_module(f'.{name}', __name__)
+
+
+class LazyPlugins(types.ModuleType):
+
+    def __getattr__(self, name):
+        if name not in EXPORTS:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(f'.{EXPORTS[name]}', self.__name__), name)
+        super().__setattr__(name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        """ Importing a submodule binds it to its name here, which would hide the
+            plugin of the same name.
+        """
+        if isinstance(value, types.ModuleType) and EXPORTS.get(name) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted({*super().__dir__(), *EXPORTS})
+
+
+sys.modules[__name__].__class__ = LazyPlugins
@@ -0,0 +1,475 @@
+""" Context functions evaluated in bulk, as a table, instead of once per call.
+
+    A context function declared with @bulk receives one sequence per argument,
+    holding the arguments of all calls, and returns a sequence with the result
+    of each call. Rules calling it are rewritten on loading:
+
+        p(@f(X)) :- q(X).
+
+    becomes
+
+        p(__Bulk0) :- q(X), __bulk_f((X,), __Bulk0).
+
+    Before grounding, the arguments of all calls are collected by grounding, in
+    a separate Control, a rule
+
+        __bulk_args_f((X,)) :- q(X).
+
+    for each call, together with only those rules its body depends on. The
+    function is then called once with all these arguments and the results are
+    added as __bulk_f/2 facts, so grounding does not call back into Python.
+    When arguments of calls depend on results of other calls, collecting is
+    repeated until no new arguments turn up.
+
+    Calls inside aggregates, conditions or non-rule statements are left as they
+    are and the function is then called once per call, as a table of one row.
+"""
+
+import collections
+import clingo
+import clingo.ast
+
+from .misc import write_file, create_control, list_symbols
+from .compression import decompressed
+from .grounding_profile_plugin import VariableCollector
+from .table_loader_plugin import add_facts
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+RESULT_PREFIX = '__bulk_'
+ARGUMENTS_PREFIX = '__bulk_args_'
+CALL_VARIABLE = '__Bulk'
+
+
+def to_python(symbol):
+    if symbol.type == clingo.SymbolType.Number:
+        return symbol.number
+    if symbol.type == clingo.SymbolType.String:
+        return symbol.string
+    return symbol
+
+
+def to_symbols(result):
+    """ Converts the result of one call to a list of symbols; a list or tuple gives several. """
+    if isinstance(result, (list, tuple)):
+        return [s for r in result for s in to_symbols(r)]
+    if isinstance(result, clingo.Symbol):
+        return [result]
+    if isinstance(result, int):
+        return [clingo.Number(result)]
+    if isinstance(result, str):
+        return [clingo.String(result)]
+    raise TypeError(f"Unsupported result: {result!r}")
+
+
+def evaluate(name, function, calls):
+    """ Calls function once for calls, a list of argument tuples; returns the results per call. """
+    if not calls[0]:
+        return [to_symbols(function())] * len(calls)
+    columns = [[to_python(a) for a in column] for column in zip(*calls)]
+    results = function(*columns)
+    if hasattr(results, 'tolist'):
+        results = results.tolist()  # numpy: converts all at once
+    if len(results) != len(calls):
+        raise ValueError(f"@{name} returned {len(results)} results for {len(calls)} calls.")
+    return [to_symbols(r) for r in results]
+
+
+def per_call(name, function):
+    """ Calls function as a table of one row, for calls that could not be rewritten. """
+    def call(*args):
+        return evaluate(name, function, [args])[0]
+    return call
+
+
+class CallRewriter(clingo.ast.Transformer):
+    """ Replaces calls to functions in names by variables; records (name, arguments, variable). """
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+
+    def visit_Function(self, function):
+        function = function.update(**self.visit_children(function))
+        if function.external and function.name in self.names:
+            variable = clingo.ast.Variable(function.location, f"{CALL_VARIABLE}{len(self.calls)}")
+            self.calls.append((function.name, function.arguments, variable))
+            return variable
+        return function
+
+
+class SignatureCollector(clingo.ast.Transformer):
+
+    def __init__(self):
+        self.signatures = set()
+
+    def visit_SymbolicAtom(self, atom):
+        symbol, positive = atom.symbol, True
+        if symbol.ast_type == clingo.ast.ASTType.UnaryOperation:
+            symbol, positive = symbol.argument, False
+        for f in symbol.arguments if symbol.ast_type == clingo.ast.ASTType.Pool else [symbol]:
+            if f.ast_type == clingo.ast.ASTType.Function:
+                self.signatures.add((f.name, len(f.arguments), positive))
+        return atom
+
+
+def variables(*asts):
+    collector = VariableCollector()
+    for ast in asts:
+        collector(ast)
+    return set(collector.names)
+
+
+def signatures(*asts):
+    collector = SignatureCollector()
+    for ast in asts:
+        collector(ast)
+    return collector.signatures
+
+
+def predicates(*asts):
+    return {name for name, arity, positive in signatures(*asts)}
+
+
+def bound_variables(body):
+    """ Variables bound by positive literals and by V = term with term bound. """
+    bound = set()
+    comparisons = []
+    for literal in body:
+        if literal.sign != clingo.ast.Sign.NoSign:
+            continue
+        if literal.atom.ast_type == clingo.ast.ASTType.SymbolicAtom:
+            bound |= variables(literal)
+        elif literal.atom.ast_type == clingo.ast.ASTType.Comparison and len(literal.atom.guards) == 1:
+            guard = literal.atom.guards[0]
+            if guard.comparison == clingo.ast.ComparisonOperator.Equal:
+                comparisons.append((literal.atom.term, guard.term))
+                comparisons.append((guard.term, literal.atom.term))
+    changed = True
+    while changed:
+        changed = False
+        for left, right in comparisons:
+            if left.ast_type == clingo.ast.ASTType.Variable and left.name not in bound \
+                    and variables(right) <= bound:
+                bound.add(left.name)
+                changed = True
+    return bound
+
+
+def call_literal(name, arguments, variable):
+    loc = variable.location
+    return clingo.ast.Literal(loc, clingo.ast.Sign.NoSign, clingo.ast.SymbolicAtom(
+        clingo.ast.Function(loc, RESULT_PREFIX + name, [clingo.ast.Function(loc, '', arguments, 0), variable], 0)))
+
+
+def arguments_rule(name, arguments, body):
+    loc = body[0].location if body else clingo.ast.Location(
+        clingo.ast.Position('<bulk>', 0, 0), clingo.ast.Position('<bulk>', 0, 0))
+    head = clingo.ast.Function(loc, ARGUMENTS_PREFIX + name, [clingo.ast.Function(loc, '', arguments, 0)], 0)
+    return clingo.ast.Rule(loc, clingo.ast.Literal(loc, clingo.ast.Sign.NoSign, clingo.ast.SymbolicAtom(head)), body)
+
+
+def rewrite_rule(rule, names):
+    """ Returns (rule, arguments_rules) with calls to names replaced, or None when rule cannot be
+        rewritten: calls in other places than simple literals, or unsafe argument rules.
+    """
+    found = CallRewriter(names)
+    found(rule)
+    if not found.calls:
+        return None
+    rewriter = CallRewriter(names)
+    head = rule.head
+    if head.ast_type == clingo.ast.ASTType.Literal:
+        head = rewriter(head)
+    body = [rewriter(literal)
+            if literal.ast_type == clingo.ast.ASTType.Literal
+               and literal.atom.ast_type in (clingo.ast.ASTType.SymbolicAtom, clingo.ast.ASTType.Comparison)
+            else literal
+            for literal in rule.body]
+    calls = rewriter.calls
+    if len(calls) != len(found.calls):
+        return None
+    call_variables = {variable.name: (name, arguments, variable) for name, arguments, variable in calls}
+    rules = []
+    for name, arguments, variable in calls:
+        needed, todo = set(), variables(*arguments) & call_variables.keys()
+        while todo:
+            needed.add(v := todo.pop())
+            todo |= (variables(*call_variables[v][1]) & call_variables.keys()) - needed
+        arguments_body = [l for l in body if variables(l) & call_variables.keys() <= needed]
+        arguments_body += [call_literal(*call_variables[v]) for v in sorted(needed)]
+        if not variables(*arguments, *arguments_body) <= bound_variables(arguments_body):
+            return None
+        rules.append(arguments_rule(name, arguments, arguments_body))
+    body += [call_literal(*call) for call in calls]
+    return rule.update(head=head, body=body), rules
+
+
+class BulkProgram:
+    """ Program with calls to bulk functions rewritten, and the rules to collect their arguments. """
+
+    def __init__(self, functions):
+        self.functions = functions
+        self.statements = []     # for the Control
+        self.collecting = []     # (statement, head predicates or None), for collecting arguments
+        self.dependencies = collections.defaultdict(set)
+        self.arguments_bodies = set()
+        self.shows = False
+        self.shown = set()       # signatures shown by show()
+        self.show_parts = 0
+        self.evaluated = {}      # (name, arguments) -> result symbols
+        self.rewritten = 0
+
+    def add(self, statement):
+        if statement.ast_type == clingo.ast.ASTType.Rule:
+            if rewritten := rewrite_rule(statement, self.functions):
+                statement, rules = rewritten
+                self.rewritten += 1
+                for rule in rules:
+                    self.collecting.append((rule, None))
+                    self.arguments_bodies |= predicates(*rule.body)
+            heads = predicates(statement.head)
+            for head in heads:
+                self.dependencies[head] |= predicates(*statement.body)
+            self.collecting.append((statement, heads))
+        else:
+            if statement.ast_type in (clingo.ast.ASTType.ShowSignature, clingo.ast.ASTType.ShowTerm):
+                self.shows = True
+            self.collecting.append((statement, None))
+        self.statements.append(statement)
+
+    def collector(self):
+        """ The statements needed to collect arguments: all but the rules that derive
+            nothing the arguments rules depend on.
+        """
+        needed, todo = set(), set(self.arguments_bodies)
+        while todo:
+            needed.add(p := todo.pop())
+            todo |= self.dependencies.get(p, set()) - needed
+        return [statement for statement, heads in self.collecting if heads is None or heads & needed]
+
+    def iterate(self):
+        """ Whether arguments of calls can depend on results of calls. """
+        depends = {RESULT_PREFIX + name for name in self.functions}
+        changed = True
+        while changed:
+            changed = False
+            for head, body in self.dependencies.items():
+                if head not in depends and body & depends:
+                    depends.add(head)
+                    changed = True
+        return bool(self.arguments_bodies & depends)
+
+    def add_to(self, control):
+        with clingo.ast.ProgramBuilder(control) as builder:
+            for statement in self.statements:
+                builder.add(statement)
+
+    def prepare(self, control, parts, context=None, arguments=()):
+        """ Adds the results of all calls as facts to control, before grounding parts. """
+        facts = [sa.symbol for sa in control.symbolic_atoms if sa.is_fact]  # from the backend
+        add_facts(control, self.results(facts, parts, context, arguments))
+
+    def show(self, control):
+        """ Keeps __bulk_name/2 out of models; call after each grounding. Without #show, all
+            atoms are shown, so all signatures grounded so far are shown, including those
+            of rules added by other plugins.
+        """
+        if self.shows:
+            return
+        new = sorted(s for s in control.symbolic_atoms.signatures
+                     if s not in self.shown and not s[0].startswith(RESULT_PREFIX))
+        if new or not self.show_parts:
+            part = f'__bulk_show{self.show_parts}'
+            control.add(part, [], '#show.' + ''.join(
+                f"#show {'' if positive else '-'}{name}/{arity}." for name, arity, positive in new))
+            control.ground([(part, ())])
+            self.shown.update(new)
+            self.show_parts += 1
+
+    def results(self, facts, parts, context=None, arguments=()):
+        """ Collects arguments of all calls, calls the functions and returns the __bulk_name/2
+            facts of calls not evaluated before.
+        """
+        results = self.evaluated
+        before = set(results)
+        iterate = self.iterate()
+        statements = self.collector()
+        while True:
+            collector = create_control(arguments=[*arguments, '--warn', 'none'])
+            with clingo.ast.ProgramBuilder(collector) as builder:
+                for statement in statements:
+                    builder.add(statement)
+            add_facts(collector, [*facts, *result_facts(results)])
+            collector.ground(parts, context=context)
+            new = 0
+            for name, function in self.functions.items():
+                calls = [args for sa in collector.symbolic_atoms.by_signature(ARGUMENTS_PREFIX + name, 1)
+                         if (name, args := tuple(sa.symbol.arguments[0].arguments)) not in results]
+                for arity in sorted({len(args) for args in calls}):
+                    same = [args for args in calls if len(args) == arity]
+                    for args, symbols in zip(same, evaluate(name, function, same)):
+                        results[name, args] = symbols
+                new += len(calls)
+            if not new or not iterate:
+                return list(result_facts(results, before))
+
+
+def result_facts(results, skip=()):
+    for (name, args), symbols in results.items():
+        if (name, args) in skip:
+            continue
+        for symbol in symbols:
+            yield clingo.Function(RESULT_PREFIX + name, [clingo.Tuple_(args), symbol])
+
+
+def bulk_program(files, functions):
+    """ Parses files into a BulkProgram; None when there are no calls to rewrite or on errors,
+        which are then reported by loading the files normally.
+    """
+    program = BulkProgram(functions)
+    try:
+        with decompressed(files) as sources:
+            clingo.ast.parse_files(sources, callback=program.add, logger=lambda code, message: None)
+    except RuntimeError:
+        return None
+    return program if program.rewritten else None
+
+
+def rewritten(source, names=('f',)):
+    rules = []
+    clingo.ast.parse_string(source, rules.append)
+    if result := rewrite_rule(rules[1], set(names)):
+        rule, argument_rules = result
+        return str(rule), [str(r) for r in argument_rules]
+
+
+@test
+def rewrite_calls():
+    test.eq(('p(__Bulk0) :- q(X); __bulk_f((X,),__Bulk0).', ['__bulk_args_f((X,)) :- q(X).']),
+            rewritten("p(@f(X)) :- q(X)."))
+    test.eq(('p(Y) :- q(X); Y = __Bulk0; __bulk_f((X,1),__Bulk0).', ['__bulk_args_f((X,1)) :- q(X).']),
+            rewritten("p(Y) :- q(X), Y = @f(X, 1)."))
+    test.eq(('p(__Bulk0) :- __bulk_f(((1..3),),__Bulk0).', ['__bulk_args_f(((1..3),)).']),
+            rewritten("p(@f(1..3))."))
+    test.eq(('p(__Bulk1) :- q(X); __bulk_f((X,),__Bulk0); __bulk_f((__Bulk0,),__Bulk1).',
+             ['__bulk_args_f((X,)) :- q(X).',
+              '__bulk_args_f((__Bulk0,)) :- q(X); __bulk_f((X,),__Bulk0).']),
+            rewritten("p(@f(@f(X))) :- q(X)."))
+    test.eq(('p(X) :- q(X); not r(__Bulk0); __bulk_f((X,),__Bulk0).', ['__bulk_args_f((X,)) :- q(X).']),
+            rewritten("p(X) :- q(X), not r(@f(X))."))
+
+
+@test
+def leave_calls_that_cannot_be_rewritten():
+    test.eq(None, rewritten("p(@g(X)) :- q(X)."))
+    test.eq(None, rewritten("p :- #count{X: q(X), r(@f(X))} > 1."))
+    test.eq(None, rewritten("p :- r(Y): q(@f(Y))."))
+    test.eq(None, rewritten("{p(@f(1))}."))
+    test.eq(None, rewritten("p :- r(@f(X), Y), q(X), not s(Y)."))  # Y is only bound by r
+
+
+@test
+def bound_by_comparisons():
+    rules = []
+    clingo.ast.parse_string("a :- q(X), Y = X + 1, Z = Y, W < Z, not r(V).", rules.append)
+    test.eq({'X', 'Y', 'Z'}, bound_variables(rules[1].body))
+
+
+@test
+def evaluate_as_table():
+    calls = []
+    def f(xs, ys):
+        calls.append((xs, ys))
+        return [x * y for x, y in zip(xs, ys)]
+    args = [(clingo.Number(2), clingo.Number(3)), (clingo.Number(4), clingo.Number(5))]
+    test.eq([[clingo.Number(6)], [clingo.Number(20)]], evaluate('f', f, args))
+    test.eq([([2, 4], [3, 5])], calls)
+    test.eq([[clingo.String('a'), clingo.Function('b')]], evaluate('g', lambda xs: [('a', clingo.Function('b'))], [(clingo.Number(1),)]))
+    test.eq([[clingo.Number(7)]] * 2, evaluate('h', lambda: 7, [(), ()]))
+    with test.raises(ValueError, "@f returned 1 results for 2 calls."):
+        evaluate('f', lambda xs: [1], [(clingo.Number(1),), (clingo.Number(2),)])
+    with test.raises(TypeError, "Unsupported result: 1.5"):
+        evaluate('f', lambda xs: [1.5], [(clingo.Number(1),)])
+    test.eq([clingo.Number(4)], per_call('f', lambda xs: [x * 2 for x in xs])(clingo.Number(2)))
+
+
+@test
+def ground_without_callbacks(tmp_path):
+    f = write_file(tmp_path/'f.lp', """\
+        node(1..4).
+        square(X, @sq(X)) :- node(X).
+        big(X) :- node(X), @sq(X) > 5.
+        double(Y, @sq(Y)) :- square(_, Y).
+        """)
+    batches = []
+    def sq(xs):
+        batches.append(sorted(xs))
+        return [x * x for x in xs]
+    program = bulk_program([f], {'sq': sq})
+    test.eq(3, program.rewritten)
+    test.truth(program.iterate())
+    control = clingo.Control()
+    program.add_to(control)
+    program.prepare(control, [('base', ())])
+    test.eq([[1, 2, 3, 4], [9, 16]], batches)  # 1 and 4 are known already
+    control.ground([('base', ())])
+    program.show(control)
+    symbols = list_symbols(control)
+    test.eq(['square(1,1)', 'square(2,4)', 'square(3,9)', 'square(4,16)'], sorted(s for s in symbols if s.startswith('square(')))
+    test.eq(['big(3)', 'big(4)'], sorted(s for s in symbols if s.startswith('big(')))
+    test.eq(['double(1,1)', 'double(16,256)', 'double(4,16)', 'double(9,81)'], sorted(s for s in symbols if s.startswith('double(')))
+    test.eq(None, bulk_program([f], {'other': sq}))
+    models = []
+    control.solve(on_model=lambda m: models.append(str(m)))
+    test.comp.contains(models[0], RESULT_PREFIX)
+    test.contains(models[0], 'big(3)')
+
+
+@test
+def show_atoms_of_added_rules(tmp_path):
+    f = write_file(tmp_path/'f.lp', "square(X, @sq(X)) :- X = 1..2.")
+    program = bulk_program([f], {'sq': lambda xs: [x * x for x in xs]})
+    control = clingo.Control()
+    program.add_to(control)
+    control.add('base', [], "derived(1). -neg.")  # as added by other plugins
+    program.prepare(control, [('base', ())])
+    control.ground([('base', ())])
+    program.show(control)
+    models = []
+    control.solve(on_model=lambda m: models.append(sorted(map(str, m.symbols(shown=True)))))
+    test.eq([['-neg', 'derived(1)', 'square(1,1)', 'square(2,4)']], models)
+
+
+@test
+def collect_only_what_arguments_need(tmp_path):
+    f = write_file(tmp_path/'f.lp', """\
+        node(1..3).
+        pair(X, Y) :- node(X), node(Y).
+        square(X, @sq(X)) :- node(X).
+        :- square(X, Y), pair(X, Y), Y > 9.
+        """)
+    program = bulk_program([f], {'sq': lambda xs: [x * x for x in xs]})
+    test.eq(['#program base.', 'node((1..3)).', '__bulk_args_sq((X,)) :- node(X).'],
+            [str(s) for s in program.collector()])
+
+
+@test
+def show_atoms_of_later_groundings(tmp_path):
+    f = write_file(tmp_path/'f.lp', "square(X, @sq(X)) :- X = 1..2.")
+    program = bulk_program([f], {'sq': lambda xs: [x * x for x in xs]})
+    control = clingo.Control()
+    program.add_to(control)
+    program.prepare(control, [('base', ())])
+    control.ground([('base', ())])
+    program.show(control)
+    control.add('later', [], "late(1).")  # multi-shot
+    control.ground([('later', ())])
+    program.show(control)
+    program.show(control)  # nothing new
+    test.eq(2, program.show_parts)
+    models = []
+    control.solve(on_model=lambda m: models.append(sorted(map(str, m.symbols(shown=True)))))
+    test.eq([['late(1)', 'square(1,1)', 'square(2,4)']], models)
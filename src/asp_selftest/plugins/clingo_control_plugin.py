@@ -2,8 +2,8 @@
 import sys
 import clingo
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 def clingo_control_plugin(next, control=None, arguments=[], message_limit=20, **etc):
@@ -3,14 +3,11 @@ import sys
 import clingo
 
 
-from clingo.script import enable_python
-enable_python()
-
-
 from .misc import write_file
+from .compression import decompressed
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 def clingo_defaults_plugin(next, **etc):
@@ -20,8 +17,9 @@ def clingo_defaults_plugin(next, **etc):
         print(f"UNHANDLED MESSAGE: code={code}, message: {message!r}", file=sys.stderr)
                 
     def load(control, files=()):
-        for filename in files:
-            control.load(filename)
+        with decompressed(files) as sources:
+            for filename in sources:
+                control.load(filename)
         if not files:
             control.load('-')
 
@@ -53,6 +51,18 @@ def clingo_defaults_plugin_basics(tmp_path, stderr):
     test.eq(['a b'], models)
 
 
+@test
+def clingo_defaults_plugin_compressed(tmp_path):
+    import gzip
+    with gzip.open(tmp_path/'file1.lp.gz', 'wt') as f:
+        f.write('a. b.')
+    control = clingo.Control()
+    _, load, ground, solve = clingo_defaults_plugin(None)
+    load(control, files=((tmp_path/'file1.lp.gz').as_posix(),))
+    ground(control)
+    test.eq(['a', 'b'], [str(a.symbol) for a in control.symbolic_atoms])
+
+
 @test
 def clingo_defaults_plugin_logger(stderr):
     control = clingo.Control()
@@ -1,8 +1,8 @@
 import clingo
 from .misc import write_file, ExitCode
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 VERSION = '.'.join(map(str,clingo.version()))
@@ -3,8 +3,8 @@ import clingo
 import clingo.ast
 import contextlib
 
-import selftest
-test = selftest.get_tester(__name__)
+from ...testing import get_tester
+test = get_tester(__name__)
 
 
 """ This module contains ASP-specific utilities for dealing with various
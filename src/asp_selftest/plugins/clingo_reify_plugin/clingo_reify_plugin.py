@@ -4,9 +4,11 @@ import pathlib
 
 from .asputil import is_tuple, is_function, mk_symbol, mk_theory_atom
 from ..misc import write_file, create_control, list_symbols
+from ..python_profile import profile_phase
+from ..tracing import trace_span
 
-import selftest
-test = selftest.get_tester(__name__)
+from ...testing import get_tester
+test = get_tester(__name__)
 
 
 """ Support for reification of rules in ASP code.
@@ -48,23 +50,27 @@ def clingo_reify_plugin(
     def load(control, files):
         reground = True
         rules_added = set()
+        rounds = 0
+
+        with profile_phase('reify'):
+            while reground:
+                reground = False
+                rounds += 1
+                with trace_span('reify round', round=rounds):
+                    sub_control = create_control(arguments=[*arguments, '--warn', 'no-atom-undefined'], **etc)
+                    _load(sub_control, files)
+
+                    for rule in rules_added:
+                        sub_control.add(rule)
+                    ground(sub_control, parts=parts, context=context)
+
+                    for rule in reified_rules(sub_control):
+                        if rule not in rules_added:
+                            rules_added.add(rule)
+                            sub_control.add(rule)
+                            on_rule(rule)
+                            reground = True
 
-        while reground:
-            reground = False
-            sub_control = create_control(arguments=[*arguments, '--warn', 'no-atom-undefined'], **etc)
-            _load(sub_control, files)
-            
-            for rule in rules_added:
-                sub_control.add(rule)
-            ground(sub_control, parts=parts, context=context)
-                        
-            for rule in reified_rules(sub_control):
-                if rule not in rules_added:
-                    rules_added.add(rule)
-                    sub_control.add(rule)
-                    on_rule(rule)
-                    reground = True
-                                
         _load(control, files)
                     
         for rule in rules_added:
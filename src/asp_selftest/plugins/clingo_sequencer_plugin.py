@@ -2,10 +2,11 @@
 
 
 from .misc import write_file
+from .python_profile import profile_phase
 
-import selftest
+from ..testing import get_tester
 
-test = selftest.get_tester(__name__)
+test = get_tester(__name__)
 
 
 def clingo_sequencer_plugin(
@@ -19,12 +20,13 @@ def clingo_sequencer_plugin(
         **etc):
     """ Breaks down main into Clingo-specific steps. """
     
-    logger, load, ground, solve = next(parts=parts, **etc)
+    logger, load, ground, solve = next(parts=parts, context=context, **etc)
             
     def main():
         load(control, files=files)
         ground(control, parts=parts, context=context)
-        return solve(control, on_model=on_model, yield_=yield_)
+        with profile_phase('solve'):
+            return solve(control, on_model=on_model, yield_=yield_)
             
     return logger, main
 
@@ -75,6 +77,7 @@ def sequencer_plugin_basics(tmp_path):
 
     main()
 
+    test.isinstance(trace[0].pop('context'), MyContext)  # for tests, see testrunner_plugin
     test.eq({'parts': (('part_a', ()), ('part_b', ())), 'more': 'better'}, trace[0])
     test.eq((file1,), trace[1])
     test.eq((('part_a', ()), ('part_b', ())), trace[2])
@@ -105,7 +108,7 @@ def test_defaults():
 
     main()
 
-    test.eq({'parts': (('base', ()),)}, trace[0])
+    test.eq({'parts': (('base', ()),), 'context': None}, trace[0])
     test.eq((), trace[1])
     test.eq((('base', ()),), trace[2])
     test.eq(None, trace[3])
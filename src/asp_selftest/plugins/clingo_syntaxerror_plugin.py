@@ -5,8 +5,8 @@ import clingo
 from .messageparser import warn2raise
 from .misc import write_file
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 def msg2exc(code, message):
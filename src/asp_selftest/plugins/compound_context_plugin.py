@@ -1,41 +1,177 @@
 import sys
+import time
+import weakref
+import threading
+import functools
+import collections
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+MEMO_SIZE = 100000
 
 
 class CompoundContext:
     """ Clingo looks up functions in __main__ OR in context; we need both.
         (Functions defined in #script land in __main__)
+        Resolved functions are cached per name, in the instance itself.
     """
 
-    def __init__(self, *contexts):
+    def __init__(self, *contexts, stats=None):
         self._contexts = list(contexts)
+        self._stats = stats
+        self._resolved = set()
 
 
     def add_context(self, *context):
         self._contexts += context
+        for name in self._resolved:
+            del self.__dict__[name]
+        self._resolved.clear()
         return self
 
 
     def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
         for c in self._contexts:
             if f := getattr(c, name, None):
-                return f
-        return getattr(sys.modules['__main__'], name)
+                break
+        else:
+            f = getattr(sys.modules['__main__'], name)
+        if getattr(f, 'bulk', False):
+            from .bulk_functions import per_call
+            f = per_call(name, f)
+        if self._stats is not None:
+            f = self._stats.measured(name, f)
+        self.__dict__[name] = f
+        self._resolved.add(name)
+        return f
+
+
+    def bulk_functions(self):
+        """ Returns {name: function} for all functions declared with @bulk. """
+        functions = {}
+        for c in reversed(self._contexts):
+            for name in dir(c):
+                if not name.startswith('__') and getattr(getattr(c, name, None), 'bulk', False):
+                    functions[name] = getattr(c, name)
+        return functions
+
+
+class ContextStats:
+    """ Number of calls and time spent per context function. """
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        self.functions = {}
+
+    def measured(self, name, f):
+        calls = self.calls
+        seconds = self.seconds
+        self.functions[name] = f
+        @functools.wraps(f)
+        def measure(*args):
+            t0 = time.perf_counter()
+            try:
+                return f(*args)
+            finally:
+                seconds[name] += time.perf_counter() - t0
+                calls[name] += 1
+        return measure
+
+    def report(self):
+        lines = ["Context functions:", f"  {'calls':>10}  {'cached':>10}  {'seconds':>8}  function"]
+        for name, seconds in self.seconds.most_common():
+            info = getattr(self.functions[name], 'cache_info', None)
+            hits = info().hits if info else '-'
+            lines.append(f"  {self.calls[name]:10}  {hits:>10}  {seconds:8.3f}  @{name}")
+        return '\n'.join(lines)
+
+
+def memoize(function=None, maxsize=MEMO_SIZE):
+    """ Decorator for pure context functions: remembers the results for the last maxsize
+        argument tuples. The cache lives as long as the function, so all tests in a run
+        share it. For methods, self is not part of the key.
+    """
+    if function is None:
+        return functools.partial(memoize, maxsize=maxsize)
+    import inspect
+    parameters = list(inspect.signature(function).parameters)
+    skip = 1 if parameters[:1] == ['self'] else 0
+    cache = collections.OrderedDict()
+    lock = threading.Lock()
+    hits = misses = 0
 
+    @functools.wraps(function)
+    def memoized(*args):
+        nonlocal hits, misses
+        key = args[skip:]
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                hits += 1
+                return cache[key]
+        result = function(*args)
+        with lock:
+            misses += 1
+            cache[key] = result
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+        return result
 
-def compound_context_plugin(next, **etc):
+    def cache_info():
+        return functools._CacheInfo(hits, misses, maxsize, len(cache))
 
-    logger, load, _ground, solve = next(**etc)
+    def cache_clear():
+        nonlocal hits, misses
+        with lock:
+            cache.clear()
+            hits = misses = 0
+
+    memoized.cache_info = cache_info
+    memoized.cache_clear = cache_clear
+    return memoized
+
+
+def bulk(function):
+    """ Declares a context function as a table: it is called once per grounding with a sequence
+        per argument, holding the arguments of all calls, and returns a sequence with the result
+        for each call. See bulk_functions.py.
+    """
+    function.bulk = True
+    return function
+
+
+def compound_context_plugin(next, context=None, context_stats=None, arguments=(), **etc):
+
+    logger, _load, _ground, solve = next(context=context, arguments=arguments, **etc)
+
+    functions = CompoundContext(context).bulk_functions() if context else {}
+    programs = weakref.WeakKeyDictionary()
+    if functions:
+        from .bulk_functions import bulk_program
+
+    def load(control, files):
+        if functions and files and (program := bulk_program(files, functions)):
+            programs[control] = program
+            program.add_to(control)
+        else:
+            _load(control, files)
 
     def ground(control, parts=(('base', ()),), context=None):
-        compound_context = CompoundContext()
+        compound_context = CompoundContext(stats=context_stats)
         if context:
             compound_context.add_context(context)
+        if program := programs.get(control):
+            program.prepare(control, parts, compound_context, arguments)
         _ground(control, parts=parts, context=compound_context)
+        if program:
+            program.show(control)
 
     return logger, load, ground, solve
-    
-    
+
+
 # tests in integration.py
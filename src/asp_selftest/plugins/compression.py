@@ -0,0 +1,218 @@
+""" Transparent reading of compressed ASP files (.gz, .xz, .zst).
+
+    Clingo only reads files by name. Instead of decompressing to disk, we give
+    it a named pipe (FIFO) that a thread feeds with the decompressed content.
+    Clingo reports line numbers in the decompressed content, and original_name()
+    maps the pipe back to the compressed file it came from.
+"""
+
+import os
+import io
+import gzip
+import lzma
+import shutil
+import tempfile
+import threading
+import contextlib
+
+from .misc import write_file
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+def open_zstd(filename, mode='rb'):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Reading {filename} requires the 'zstandard' package.") from None
+    return zstandard.open(filename, mode)
+
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+    '.zst': open_zstd,
+}
+
+
+def compression_of(filename):
+    """ Returns the compression suffix of filename, or None. """
+    _, suffix = os.path.splitext(filename)
+    if suffix in OPENERS:
+        return suffix
+
+
+def open_source(filename):
+    """ Opens filename as text, decompressing on the fly when needed. """
+    if suffix := compression_of(filename):
+        return io.TextIOWrapper(OPENERS[suffix](filename, 'rb'))
+    return open(filename)
+
+
+_originals = {}
+
+def original_name(filename):
+    """ Maps a pipe created by decompressed(), or a copy made with copies_of(), back to its source. """
+    return _originals.get(filename, filename)
+
+
+@contextlib.contextmanager
+def copies_of(originals):
+    """ While active, original_name() maps each copy in {copy: original} to its original.
+        Copies must have the same lines as their originals.
+    """
+    _originals.update(originals)
+    try:
+        yield
+    finally:
+        for copy in originals:
+            _originals.pop(copy, None)
+
+
+def _feed(src, pipe, errors, chunk_size=1 << 20):
+    try:
+        with src, open(pipe, 'wb') as dst:
+            shutil.copyfileobj(src, dst, chunk_size)
+    except BrokenPipeError:
+        pass  # reader stopped early, for example on a syntax error
+    except Exception as e:
+        errors.append(e)  # the pipe closes; a truncated program must not pass silently
+
+
+@contextlib.contextmanager
+def decompressed(files):
+    """ Yields files with compressed ones replaced by named pipes streaming their content.
+        Errors in opening or decompressing a file are raised here, not in Clingo.
+    """
+    if not any(compression_of(f) for f in files):
+        yield files
+        return
+    sources = {}
+    try:
+        for f in files:
+            if suffix := compression_of(f):
+                sources[f] = OPENERS[suffix](f, 'rb')
+    except BaseException:
+        for src in sources.values():
+            src.close()
+        raise
+    tmpdir = tempfile.mkdtemp(prefix='asp-')
+    pipes = []
+    result = []
+    errors = []
+    originals = {}
+    for f in files:
+        if f in sources:
+            pipe = os.path.join(tmpdir, f"{len(pipes)}-{os.path.basename(f).removesuffix(compression_of(f))}")
+            os.mkfifo(pipe)
+            originals[pipe] = f
+            thread = threading.Thread(target=_feed, args=(sources[f], pipe, errors), daemon=True)
+            thread.start()
+            pipes.append((pipe, thread))
+            result.append(pipe)
+        else:
+            result.append(f)
+    try:
+        with copies_of(originals):
+            yield result
+    finally:
+        for pipe, thread in pipes:
+            while thread.is_alive():
+                # unblock a writer still waiting for a reader or writing to a gone reader;
+                # the reader stays open until the writer had time to open its end
+                reader = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+                thread.join(0.01)
+                os.close(reader)
+                thread.join(0.01)
+            os.unlink(pipe)
+        os.rmdir(tmpdir)
+        if errors:
+            raise errors[0]
+
+
+@test
+def recognize_compressed_files():
+    test.eq('.gz', compression_of('a.lp.gz'))
+    test.eq('.xz', compression_of('/x/a.lp.xz'))
+    test.eq('.zst', compression_of('a.zst'))
+    test.eq(None, compression_of('a.lp'))
+    test.eq(None, compression_of('gz'))
+
+
+@test
+def read_compressed_source(tmp_path):
+    with gzip.open(tmp_path/'a.lp.gz', 'wt') as f:
+        f.write("a.\nb.\n")
+    with lzma.open(tmp_path/'b.lp.xz', 'wt') as f:
+        f.write("c.\n")
+    write_file(tmp_path/'c.lp', "d.\n")
+    test.eq(['a.\n', 'b.\n'], open_source(tmp_path/'a.lp.gz').readlines())
+    test.eq('c.\n', open_source(tmp_path/'b.lp.xz').read())
+    test.eq('d.\n', open_source(tmp_path/'c.lp').read())
+
+
+@test
+def stream_through_pipe(tmp_path):
+    import clingo
+    plain = write_file(tmp_path/'plain.lp', "p.")
+    packed = (tmp_path/'packed.lp.gz').as_posix()
+    with gzip.open(packed, 'wt') as f:
+        f.write("q(1..3).")
+    control = clingo.Control()
+    with decompressed((plain, packed)) as files:
+        test.eq(plain, files[0])
+        test.endswith(files[1], '-packed.lp')
+        test.eq(packed, original_name(files[1]))
+        for f in files:
+            control.load(f)
+    test.comp.truth(os.path.exists(files[1]))
+    test.eq(files[1], original_name(files[1]))  # forgotten, for long running processes
+    control.ground()
+    test.eq(['p', 'q(1)', 'q(2)', 'q(3)'], sorted(str(a.symbol) for a in control.symbolic_atoms))
+
+
+@test
+def unread_pipes_do_not_hang(tmp_path):
+    packed = (tmp_path/'packed.lp.xz').as_posix()
+    with lzma.open(packed, 'wt') as f:
+        f.write("q. " * 100000)
+    threads = threading.active_count()
+    for _ in range(20):
+        with decompressed((packed,)) as files:
+            pass
+    with decompressed((packed,)) as files:
+        with open(files[0]) as f:
+            test.eq('q. q. ', f.read(6))
+    test.comp.truth(os.path.exists(files[0]))
+    test.eq(threads, threading.active_count())  # no writer left behind
+
+
+@test
+def plain_files_pass_unchanged():
+    with decompressed(('a.lp', 'b.lp')) as files:
+        test.eq(('a.lp', 'b.lp'), files)
+
+
+@test
+def missing_file_raises(tmp_path):
+    with test.raises(FileNotFoundError):
+        with decompressed(((tmp_path/'missing.lp.gz').as_posix(),)):
+            pass
+    import importlib.util
+    with test.raises(FileNotFoundError if importlib.util.find_spec('zstandard') else ImportError):
+        with decompressed(((tmp_path/'missing.lp.zst').as_posix(),)):
+            pass
+
+
+@test
+def truncated_file_raises(tmp_path):
+    import clingo
+    packed = tmp_path/'packed.lp.gz'
+    with gzip.open(packed, 'wt') as f:
+        f.write("q. " * 100000)
+    packed.write_bytes(packed.read_bytes()[:-100])
+    control = clingo.Control()
+    with test.raises(EOFError):
+        with decompressed((packed.as_posix(),)) as files:
+            control.load(files[0])
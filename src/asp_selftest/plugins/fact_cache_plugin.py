@@ -0,0 +1,255 @@
+""" Caches designated pure-fact files as ASPIF, keyed by their content.
+
+    Parsing huge fact files can dominate a run. The designated files are
+    grounded once, written as ASPIF and loaded with Control.load_aspif()
+    later on. Clingo accepts only one ASPIF program per Control, so all fact
+    files of one load are compiled together. On compilation, both ways of
+    loading are timed; the cache is only used when it is actually faster.
+    Cache files are written under a temporary name and then renamed, so an
+    interrupted or concurrent run never leaves a half-written entry.
+"""
+
+import os
+import gc
+import json
+import time
+import threading
+import contextlib
+import clingo
+import clingo.ast
+
+from .misc import write_file, cache_dir
+from .compression import decompressed
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+VERSION = '.'.join(map(str, clingo.version()))
+
+
+def content_key(files, chunk_size=1 << 20):
+    """ Hash over the contents of files, in order, and the clingo version. """
+    import hashlib
+    h = hashlib.sha256(VERSION.encode())
+    for filename in files:
+        with open(filename, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                h.update(chunk)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def is_fact(ast):
+    if ast.ast_type == clingo.ast.ASTType.Program:
+        return ast.name == 'base' and not ast.parameters
+    return ast.ast_type == clingo.ast.ASTType.Rule and not ast.body and \
+           ast.head.ast_type == clingo.ast.ASTType.Literal
+
+
+def is_pure_facts(files):
+    """ Checks if files contain nothing but facts in the base program. """
+    pure = True
+    def check(ast):
+        nonlocal pure
+        pure = pure and is_fact(ast)
+    with decompressed(files) as sources:
+        clingo.ast.parse_files(sources, callback=check, logger=lambda code, message: None)
+    return pure
+
+
+def load_text(files):
+    control = clingo.Control(['--warn', 'none'])
+    with decompressed(files) as sources:
+        for f in sources:
+            control.load(f)
+    control.ground()
+    return control
+
+
+def load_compiled(aspif):
+    control = clingo.Control(['--warn', 'none'])
+    control.load_aspif([aspif])
+    control.ground()
+    return control
+
+
+def compile_facts(files, aspif):
+    control = clingo.Control(['--warn', 'none'])
+    control.register_backend(clingo.BackendType.Aspif, aspif, replace=True)
+    with decompressed(files) as sources:
+        for f in sources:
+            control.load(f)
+    control.ground()
+    control.solve()  # writes the end of the step
+    del control      # flushes the file
+    gc.collect()
+
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """ Yields a temporary name next to path, which replaces path when all went well. """
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class FactCache:
+    """ Compiled fact files in directory, with a small JSON file with measurements for each. """
+
+    def __init__(self, directory=None, require_faster=True):
+        self.directory = directory or cache_dir()
+        self.require_faster = require_faster
+
+    def compile(self, files, aspif):
+        if not is_pure_facts(files):
+            return {'files': files, 'use': False, 'reason': "not only facts"}
+        text_time = timed(load_text, files)
+        with replacing(aspif) as temporary:
+            compile_facts(files, temporary)
+            aspif_time = timed(load_compiled, temporary)
+        faster = aspif_time < text_time
+        return {'files': files, 'use': faster or not self.require_faster,
+                'text': text_time, 'aspif': aspif_time}
+
+    def lookup(self, files):
+        """ Returns the ASPIF file to use instead of files, or None. """
+        os.makedirs(self.directory, exist_ok=True)
+        key = content_key(files)
+        aspif = os.path.join(self.directory, key + '.aspif')
+        info_file = os.path.join(self.directory, key + '.json')
+        if os.path.exists(info_file):
+            with open(info_file) as f:
+                info = json.load(f)
+        else:
+            info = self.compile(list(files), aspif)
+            with replacing(info_file) as temporary:
+                with open(temporary, 'w') as f:
+                    json.dump(info, f)
+        if info['use'] and os.path.exists(aspif):
+            return aspif
+
+
+def fact_cache_plugin(next, fact_files=(), fact_cache_dir=None, **etc):
+    """ Loads fact_files from compiled ASPIF when that is faster. Must be just before clingo_defaults_plugin. """
+
+    logger, _load, ground, solve = next(**etc)
+
+    if not fact_files:
+        return logger, _load, ground, solve
+
+    cache = FactCache(fact_cache_dir)
+    designated = {os.path.realpath(f) for f in fact_files}
+
+    def load(control, files):
+        facts = [f for f in files if os.path.realpath(f) in designated]
+        if facts and (aspif := cache.lookup(facts)):
+            control.load_aspif([aspif])
+            files = [f for f in files if os.path.realpath(f) not in designated]
+            if not files:
+                return
+        _load(control, files)
+
+    return logger, load, ground, solve
+
+
+@test
+def recognize_pure_facts(tmp_path):
+    f1 = write_file(tmp_path/'f1.lp', 'a. p(1..3). q("x", f(y)). #program base.')
+    test.truth(is_pure_facts([f1]))
+    for code in ('a :- b.', '{a}.', '#program p.', 'a. #const n=1.', ':- a.'):
+        test.comp.truth(is_pure_facts([write_file(tmp_path/'f2.lp', code)]))
+
+
+@test
+def key_on_content(tmp_path):
+    f1 = write_file(tmp_path/'f1.lp', 'a.')
+    f2 = write_file(tmp_path/'f2.lp', 'a.')
+    f3 = write_file(tmp_path/'f3.lp', 'b.')
+    test.eq(content_key([f1]), content_key([f2]))
+    test.ne(content_key([f1]), content_key([f3]))
+    test.ne(content_key([f1, f3]), content_key([f3, f1]))
+
+
+@test
+def compile_and_use_cache(tmp_path):
+    f1 = write_file(tmp_path/'f1.lp', 'p(1..3).')
+    f2 = write_file(tmp_path/'f2.lp', 'q("a").')
+    cache = FactCache(tmp_path/'cache', require_faster=False)
+    aspif = cache.lookup([f1, f2])
+    test.endswith(aspif, '.aspif')
+    info = json.load(open(aspif.replace('.aspif', '.json')))
+    test.eq([f1, f2], info['files'])
+    test.isinstance(info['text'], float)
+    test.isinstance(info['aspif'], float)
+    test.eq(aspif, cache.lookup([f1, f2]))
+    test.eq(sorted([os.path.basename(aspif), os.path.basename(aspif).replace('.aspif', '.json')]),
+            sorted(os.listdir(tmp_path/'cache')))
+    control = load_compiled(aspif)
+    test.eq(['p(1)', 'p(2)', 'p(3)', 'q("a")'], sorted(str(a.symbol) for a in control.symbolic_atoms))
+
+
+@test
+def fall_back_when_not_useful(tmp_path):
+    rule = write_file(tmp_path/'rule.lp', 'a :- b.')
+    test.eq(None, FactCache(tmp_path/'cache').lookup([rule]))
+    info = json.load(open(tmp_path/'cache'/(content_key([rule]) + '.json')))
+    test.eq("not only facts", info['reason'])
+    facts = write_file(tmp_path/'facts.lp', 'a.')
+    cache = FactCache(tmp_path/'cache')
+    cache.compile = lambda files, aspif: {'use': False, 'text': 1.0, 'aspif': 2.0}
+    test.eq(None, cache.lookup([facts]))
+
+
+@test
+def interrupted_compile_leaves_no_entry(tmp_path):
+    facts = write_file(tmp_path/'facts.lp', 'a.')
+    cache = FactCache(tmp_path/'cache', require_faster=False)
+    original = globals()['compile_facts']
+    def interrupted(files, aspif):
+        open(aspif, 'w').write('asp 1 0 0\n1 0 1')  # half written
+        raise KeyboardInterrupt
+    globals()['compile_facts'] = interrupted
+    try:
+        with test.raises(KeyboardInterrupt):
+            cache.lookup([facts])
+    finally:
+        globals()['compile_facts'] = original
+    test.eq([], os.listdir(tmp_path/'cache'))
+    test.endswith(cache.lookup([facts]), '.aspif')
+
+
+@test
+def fact_cache_plugin_basics(tmp_path):
+    facts = write_file(tmp_path/'facts.lp', 'edge(1,2). edge(2,3).')
+    logic = write_file(tmp_path/'logic.lp', 'node(X) :- edge(X, _).')
+    loaded = []
+    def next_plugin(**etc):
+        def load(control, files):
+            loaded.append(files)
+            for f in files:
+                control.load(f)
+        return None, load, None, None
+    _, load, _, _ = fact_cache_plugin(next_plugin, fact_files=[facts], fact_cache_dir=tmp_path/'cache')
+    FactCache(tmp_path/'cache', require_faster=False).lookup([facts])  # force use
+    control = clingo.Control()
+    load(control, [logic, facts])
+    test.eq([[logic]], loaded)
+    control.ground()
+    test.eq(['edge(1,2)', 'edge(2,3)', 'node(1)', 'node(2)'], sorted(str(a.symbol) for a in control.symbolic_atoms))
+    control = clingo.Control()
+    load(control, [facts])
+    test.eq([[logic]], loaded)
+    _, load, _, _ = fact_cache_plugin(next_plugin)
+    test.eq(None, load(control, [logic]))
+    test.eq([[logic], [logic]], loaded)
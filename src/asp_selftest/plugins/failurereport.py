@@ -0,0 +1,284 @@
+""" Reporting of failing models without rendering huge answer sets in full.
+
+    A failing model is kept as the array of symbols clingo gives us. Only when
+    it is rendered, it is turned into text, and then only the atoms relevant
+    to the failing cannots, up to a limit. The full model goes to a file, once.
+    The cannot rules of the test files are parsed once per version of the files.
+
+    Likewise, many failing cannots with the same message are summarized with a
+    count and a few samples, while the full list goes to a file.
+"""
+
+import os
+import tempfile
+import clingo
+import clingo.ast
+
+from .misc import write_file
+from .compression import decompressed
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+MODEL_LIMIT = 100
+FAILURE_SAMPLES = 3
+
+
+def body_signatures(node):
+    """ Yields (name, arity) of all atoms occurring in node, recursively. """
+    if isinstance(node, clingo.ast.AST):
+        if node.ast_type == clingo.ast.ASTType.SymbolicAtom:
+            if node.symbol.ast_type == clingo.ast.ASTType.Function:
+                yield node.symbol.name, len(node.symbol.arguments)
+        for key in node.child_keys:
+            yield from body_signatures(getattr(node, key))
+    elif isinstance(node, (clingo.ast.ASTSequence, list, tuple)):
+        for child in node:
+            yield from body_signatures(child)
+
+
+def cannot_head(ast):
+    """ Returns the head function of a cannot rule, or None. """
+    if ast.ast_type == clingo.ast.ASTType.Rule:
+        head = ast.head
+        if head.ast_type == clingo.ast.ASTType.Literal:
+            atom = head.atom
+            if atom.ast_type == clingo.ast.ASTType.SymbolicAtom:
+                if atom.symbol.ast_type == clingo.ast.ASTType.Function:
+                    if atom.symbol.name == 'cannot':
+                        return atom.symbol
+
+
+def head_matches(head, symbol):
+    """ Checks if a ground cannot could have been derived from head; non constant terms match anything. """
+    if len(head.arguments) != len(symbol.arguments):
+        return False
+    return all(a.symbol == s for a, s in zip(head.arguments, symbol.arguments)
+               if a.ast_type == clingo.ast.ASTType.SymbolicTerm)
+
+
+_cannot_rules = {}
+
+
+def cannot_rules(files):
+    """ Returns the head and the body signatures of each cannot rule in files; cached
+        until one of files changes (files they include are not checked).
+    """
+    if not files:
+        return []  # Clingo would read stdin
+    try:
+        key = tuple((f, (stat := os.stat(f)).st_mtime_ns, stat.st_size) for f in files)
+    except OSError:
+        key = None
+    if key and (rules := _cannot_rules.get(key)) is not None:
+        return rules
+    rules = []
+    def collect(ast):
+        if head := cannot_head(ast):
+            rules.append((head, set(body_signatures(ast.body))))
+    with decompressed(files) as sources:
+        clingo.ast.parse_files(sources, callback=collect, logger=lambda code, message: None)
+    if key:
+        _cannot_rules[key] = rules
+    return rules
+
+
+def relevant_signatures(files, failures):
+    """ Returns the signatures in the bodies of the cannot rules in files that fired. """
+    return set().union(*(signatures for head, signatures in cannot_rules(files)
+                         if any(head_matches(head, f) for f in failures)))
+
+
+class ModelReport:
+    """ Holds the shown symbols of a failing model and renders them on demand; str() renders
+        up to limit atoms, so a report can be an exception note that is rendered only when shown.
+    """
+
+    def __init__(self, symbols, failures=(), files=(), limit=MODEL_LIMIT):
+        self.symbols = symbols
+        self.failures = failures
+        self.files = files
+        self.limit = limit
+        self.count = sum(1 for _ in self.atoms())
+        # files may change or go before rendering
+        self.signatures = relevant_signatures(files, failures) if self.count > limit else None
+        self.dumped = None
+        self.rendered = None
+
+    def atoms(self):
+        return (s for s in self.symbols if s.name != 'cannot' and not s.name.startswith('_'))
+
+    def relevant(self):
+        signatures = self.signatures
+        if signatures is None:
+            signatures = relevant_signatures(self.files, self.failures)
+        return (s for s in self.atoms() if (s.name, len(s.arguments)) in signatures)
+
+    def dump(self, file=None):
+        """ Writes the full model as facts to file (by default a temporary one, written once). """
+        if not file:
+            if not self.dumped:
+                self.dumped = dump_symbols(self.atoms(), '-model.lp')
+            return self.dumped
+        with open(file, 'w') as f:
+            for s in self.atoms():
+                f.write(f"{s}.\n")
+        return file
+
+    def render(self, limit=MODEL_LIMIT):
+        """ Renders at most limit atoms; when there are more, only those relevant to the failures. """
+        if self.count <= limit:
+            return '\n'.join(str(s) for s in self.atoms()) or '<empty model>'
+        lines = []
+        hidden = 0
+        for s in self.relevant():
+            if len(lines) < limit:
+                lines.append(str(s))
+            else:
+                hidden += 1
+        lines.append(f"<{len(lines)} relevant atoms shown, {hidden} more hidden; full model in {self.dump()}>")
+        return '\n'.join(lines)
+
+    def __str__(self):
+        if self.rendered is None:
+            self.rendered = self.render(self.limit)
+        return self.rendered
+
+
+def dump_symbols(symbols, suffix):
+    """ Streams symbols as facts to a new temporary file. """
+    with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+        for s in symbols:
+            f.write(f"{s}.\n")
+    return f.name
+
+
+def summarize_failures(failures, samples=FAILURE_SAMPLES):
+    """ Groups failing cannots by message (first argument). Groups larger than samples are
+        summarized with a count and some sample values; all failures then go to a file.
+    """
+    groups = {}
+    for f in failures:
+        key = f.arguments[0] if f.arguments else None, len(f.arguments)
+        if group := groups.get(key):
+            group[0] += 1
+            if len(group[1]) < samples:
+                group[1].append(f)
+        else:
+            groups[key] = [1, [f]]
+    parts = []
+    for (message, arity), (count, symbols) in groups.items():
+        if count <= samples:
+            parts.extend(str(s) for s in symbols)
+        else:
+            values = ', '.join(','.join(map(str, s.arguments[1:])) for s in symbols)
+            parts.append(f"cannot({message}{',_' * (arity - 1)}) {count} times, e.g. {values}, ...")
+    if len(parts) < len(failures):
+        parts.append(f"all {len(failures)} failures in {dump_symbols(failures, '-failures.lp')}")
+    return ', '.join(parts)
+
+
+def failing_model(source):
+    control = clingo.Control()
+    control.add(source)
+    control.ground()
+    with control.solve(yield_=True) as models:
+        for model in models:
+            return model.symbols(shown=True), [s for s in model.symbols(shown=True) if s.name == 'cannot']
+
+
+@test
+def signatures_in_bodies():
+    sigs = set()
+    def collect(ast):
+        if cannot_head(ast):
+            sigs.update(body_signatures(ast.body))
+    clingo.ast.parse_string('cannot(a) :- p(1), not q(1, 2), #count{ X: r(X) } > 1, s : t(_).  u :- v.', collect)
+    test.eq({('p', 1), ('q', 2), ('r', 1), ('s', 0), ('t', 1)}, sigs)
+
+
+@test
+def match_head_with_constants():
+    def head(code):
+        heads = []
+        clingo.ast.parse_string(code, lambda a: heads.append(cannot_head(a)))
+        return heads[-1]
+    test.truth(head_matches(head('cannot("x", N) :- p(N).'), clingo.parse_term('cannot("x",1)')))
+    test.comp.truth(head_matches(head('cannot("y", N) :- p(N).'), clingo.parse_term('cannot("x",1)')))
+    test.comp.truth(head_matches(head('cannot("x") :- p.'), clingo.parse_term('cannot("x",1)')))
+    test.truth(head_matches(head('cannot(N) :- p(N).'), clingo.parse_term('cannot(2)')))
+    test.eq(None, head('a :- b.'))
+
+
+@test
+def render_small_model_completely():
+    symbols, failures = failing_model('a. b(1). _hidden. cannot(a).')
+    report = ModelReport(symbols, failures)
+    test.eq('a\nb(1)', report.render())
+    test.eq('<empty model>', ModelReport([], failures).render())
+
+
+@test
+def render_large_model_only_relevant_atoms(tmp_path):
+    f = write_file(tmp_path/'big.lp', """
+        noise(1..1000).
+        node(1..5).
+        color(1..2).
+        cannot("no color", N) :- node(N), not color(N).
+        cannot("never") :- noise(0).""")
+    control = clingo.Control()
+    control.load(f)
+    control.ground()
+    with control.solve(yield_=True) as models:
+        model = next(iter(models))
+        symbols = model.symbols(shown=True)
+    failures = [s for s in symbols if s.name == 'cannot']
+    report = ModelReport(symbols, failures, files=(f,))
+    text = report.render(limit=3)
+    lines = text.splitlines()
+    test.eq(['node(1)', 'node(2)', 'node(3)'], lines[:3])
+    test.startswith(lines[3], "<3 relevant atoms shown, 4 more hidden; full model in ")
+    test.endswith(lines[3], "-model.lp>")
+    dumpfile = lines[3].split()[-1][:-1]
+    dumped = open(dumpfile).read().splitlines()
+    test.eq(1007, len(dumped))
+    test.contains(dumped, 'noise(1000).')
+    test.eq(len(dumped), len(open(report.dump(tmp_path/'model.lp')).readlines()))
+    test.eq(dumpfile, report.dump())  # written once
+    test.eq(text, report.render(limit=3))
+    test.eq(1, len([k for k in _cannot_rules if k[0][0] == f]))  # parsed once
+
+
+@test
+def count_only_rendered_atoms():
+    symbols, failures = failing_model('a. b. _c. _d. cannot(x). cannot(y).')
+    report = ModelReport(symbols, failures, limit=2)
+    test.eq('a\nb', str(report))
+    test.startswith(ModelReport(symbols, failures, limit=1).render(1), "<0 relevant atoms shown, 0 more hidden; ")
+    test.is_(str(report), str(report))
+
+
+@test
+def summarize_few_failures():
+    failures = [clingo.parse_term(t) for t in ('cannot(a)', 'cannot("b",1)', 'cannot("b",2)')]
+    test.eq('cannot(a), cannot("b",1), cannot("b",2)', summarize_failures(failures))
+    test.eq('', summarize_failures([]))
+
+
+@test
+def summarize_many_failures():
+    failures = [clingo.parse_term(f'cannot("no color",{n})') for n in range(1000)]
+    failures.append(clingo.parse_term('cannot(other)'))
+    failures.append(clingo.parse_term('cannot("pair",1,2)'))
+    summary = summarize_failures(failures)
+    text, path = summary.rsplit(' ', 1)
+    test.eq('cannot("no color",_) 1000 times, e.g. 0, 1, 2, ..., cannot(other), cannot("pair",1,2), all 1002 failures in',
+            text)
+    test.endswith(path, '-failures.lp')
+    lines = open(path).read().splitlines()
+    test.eq(1002, len(lines))
+    test.eq('cannot("no color",999).', lines[999])
+    test.eq('cannot("pair",1,2).', lines[-1])
+    test.eq('cannot(x,_,_) 2 times, e.g. 1,2, ...', summarize_failures(
+        [clingo.parse_term('cannot(x,1,2)'), clingo.parse_term('cannot(x,3,4)')], samples=1).split(', all')[0])
@@ -0,0 +1,218 @@
+""" Fingerprints of ground programs, to skip solving tests that passed before.
+
+    Many edits (renaming a hidden helper predicate, reordering rules) leave
+    the ground program of a test unchanged. An observer records everything
+    the grounder produces; the fingerprint is a hash over the sorted records,
+    the cannot atoms with their literals, the solve arguments and the clingo
+    version. The records do not name hidden atoms, so without the cannots two
+    tests differing only in which atom is a cannot would share a fingerprint. Tests with a fingerprint
+    that passed before, in this run or, with a file, in an earlier run, need
+    not be solved again. A test whose fingerprint another thread is solving
+    waits for its outcome. Forked workers have their own copy of the cache.
+    The file keeps the MAX_PASSED fingerprints that passed last; it is
+    compacted when it is read.
+"""
+
+import os
+import hashlib
+import threading
+import clingo
+
+from .misc import write_file
+from .fact_cache_plugin import replacing
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+VERSION = '.'.join(map(str, clingo.version()))
+
+MAX_PASSED = 10000
+
+OBSERVED = ('rule', 'weight_rule', 'minimize', 'project', 'output_atom', 'output_term',
+            'external', 'assume', 'heuristic', 'acyc_edge', 'theory_term_number',
+            'theory_term_string', 'theory_term_compound', 'theory_element',
+            'theory_atom', 'theory_atom_with_guard')
+
+
+def _recorder(name):
+    def record(self, *args):
+        self.records.append(f"{name}{args}")
+    return record
+
+
+class GroundHasher:
+    """ Observer collecting the ground program as text records. """
+
+    def __init__(self):
+        self.records = []
+
+    def fingerprint(self, arguments=(), symbolic_atoms=None):
+        h = hashlib.sha256(VERSION.encode())
+        h.update(repr(list(arguments)).encode())
+        records = list(self.records)
+        if symbolic_atoms is not None:
+            records += (f"cannot({a.symbol}, {a.literal})" for n in (1, 2) for a in symbolic_atoms.by_signature('cannot', n))
+        for record in sorted(records):
+            h.update(record.encode())
+            h.update(b'\n')
+        return h.hexdigest()
+
+
+for _name in OBSERVED:
+    setattr(GroundHasher, _name, _recorder(_name))
+
+
+class GroundCache:
+    """ Fingerprints of ground programs of passed tests; kept in filename when given. """
+
+    def __init__(self, filename=None, max_passed=MAX_PASSED):
+        self.filename = filename
+        self.passed = set()
+        self.solving = {}  # fingerprint: Event set when its solver is done
+        self.lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                lines = f.read().split()
+            self.passed.update(lines)
+            if len(lines) > max_passed:
+                self.compact(lines, max_passed)
+
+    def compact(self, lines, max_passed):
+        """ Rewrites the file with the last max_passed different fingerprints, oldest first. """
+        keep = list(dict.fromkeys(reversed(lines)))[:max_passed][::-1]
+        self.passed = set(keep)
+        with replacing(self.filename) as temporary:
+            with open(temporary, 'w') as f:
+                f.writelines(fingerprint + '\n' for fingerprint in keep)
+
+    def observe(self, control):
+        """ Registers a GroundHasher with control; call before grounding. """
+        hasher = GroundHasher()
+        control.register_observer(hasher)
+        return hasher
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.passed
+
+    def claim(self, fingerprint):
+        """ Whether the caller must solve the ground program with fingerprint: not when it passed,
+            which may only become known after waiting for another thread solving it. When it
+            must, the caller calls add() when it passes and release() in any case.
+        """
+        while True:
+            with self.lock:
+                if fingerprint in self.passed:
+                    return False
+                if (solver := self.solving.get(fingerprint)) is None:
+                    self.solving[fingerprint] = threading.Event()
+                    return True
+            solver.wait()
+
+    def release(self, fingerprint):
+        with self.lock:
+            if solver := self.solving.pop(fingerprint, None):
+                solver.set()
+
+    def add(self, fingerprint):
+        with self.lock:
+            if fingerprint in self.passed:
+                return
+            self.passed.add(fingerprint)
+        if self.filename:
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+            with open(self.filename, 'a') as f:
+                f.write(fingerprint + '\n')
+
+
+def ground_fingerprint(program, arguments=()):
+    control = clingo.Control(arguments)
+    hasher = GroundCache().observe(control)
+    control.add(program)
+    control.ground()
+    return hasher.fingerprint(arguments, control.symbolic_atoms)
+
+
+@test
+def same_ground_program_same_fingerprint():
+    a = ground_fingerprint("a. b :- a. c :- not d. {d}. cannot(x) :- b, c. #show cannot/1.")
+    b = ground_fingerprint("helper. b :- helper. c :- not d. {d}. cannot(x) :- b, c. #show cannot/1.")
+    c = ground_fingerprint("{d}. c :- not d. helper. b :- helper. cannot(x) :- b, c. #show cannot/1.")
+    test.eq(a, b)
+    test.eq(a, c)
+
+
+@test
+def different_ground_program_or_arguments():
+    a = ground_fingerprint("{d}. cannot(x) :- d. #show cannot/1.")
+    test.ne(a, ground_fingerprint("{d}. cannot(y) :- d. #show cannot/1."))
+    test.ne(a, ground_fingerprint("{d}. cannot(x) :- not d. #show cannot/1."))
+    test.ne(a, ground_fingerprint("{d}. cannot(x) :- d. #show cannot/1. #show d/0."))
+    test.ne(a, ground_fingerprint("{d}. cannot(x) :- d. #show cannot/1.", ['0']))
+
+
+@test
+def hidden_cannots_count():
+    a = ground_fingerprint("{d}. cannot(x) :- d. #show d/0.")
+    test.ne(a, ground_fingerprint("{d}. helper(x) :- d. #show d/0."))
+    test.ne(a, ground_fingerprint("{d}. cannot(y) :- d. #show d/0."))
+
+
+@test
+def observe_facts_from_backend():
+    control = clingo.Control()
+    hasher = GroundCache().observe(control)
+    with control.backend() as backend:
+        backend.add_rule([backend.add_atom(clingo.Function('q'))])
+    control.ground()
+    test.eq(["rule(False, [1], [])", "output_atom(Function('q', [], True), 0)"], hasher.records)
+
+
+@test
+def remember_passes(tmp_path):
+    filename = (tmp_path/'cache'/'passed').as_posix()
+    cache = GroundCache(filename)
+    test.comp.contains(cache, 'abc')
+    cache.add('abc')
+    cache.add('abc')
+    test.contains(cache, 'abc')
+    test.eq('abc\n', open(filename).read())
+    test.contains(GroundCache(filename), 'abc')
+    test.comp.contains(GroundCache(), 'abc')
+
+
+@test
+def compact_file_on_read(tmp_path):
+    filename = (tmp_path/'passed').as_posix()
+    write_file(tmp_path/'passed', ''.join(f"{f}\n" for f in 'abcadeb'))
+    test.eq({'a', 'b', 'c', 'd', 'e'}, GroundCache(filename, max_passed=7).passed)
+    test.eq('a\nb\nc\na\nd\ne\nb\n', open(filename).read())  # short enough
+    cache = GroundCache(filename, max_passed=3)
+    test.eq({'d', 'e', 'b'}, cache.passed)
+    test.eq('d\ne\nb\n', open(filename).read())
+    cache.add('f')
+    test.eq('d\ne\nb\nf\n', open(filename).read())
+    test.eq(['passed'], os.listdir(tmp_path))
+
+
+@test
+def wait_for_same_fingerprint_in_flight():
+    import concurrent.futures
+    cache = GroundCache()
+    test.truth(cache.claim('abc'))
+    started = threading.Event()
+    def other():
+        started.set()
+        return cache.claim('abc')
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        waiting = pool.submit(other)
+        started.wait()
+        test.truth(cache.claim('xyz'))  # other fingerprints do not wait
+        test.comp.truth(waiting.done())
+        cache.add('abc')
+        cache.release('abc')
+        test.eq(False, waiting.result(timeout=5))  # passed meanwhile: no need to solve
+        failed = pool.submit(cache.claim, 'xyz')
+        cache.release('xyz')  # failed: the waiting one solves it itself
+        test.eq(True, failed.result(timeout=5))
+    test.eq({'xyz'}, set(cache.solving))
@@ -0,0 +1,234 @@
+""" Profiles grounding per source rule, to find the rules responsible for a blow up.
+
+    Next to every rule, the program gets a conditional external with the same body:
+
+        #external __profile_rule(ID, (X, Y)) : body.
+
+    where X, Y are the global variables of the body. The number of ground
+    atoms per ID is the number of ground instances of the rule. Externals are
+    false and occur in no rule, so they do not change the models, and the
+    profile comes from the grounding itself: parts grounded together see each
+    other's atoms, as in the real run.
+"""
+
+import sys
+import time
+import weakref
+import collections
+import clingo
+import clingo.ast
+
+from .misc import write_file, create_control, NA
+from .compression import decompressed, original_name
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+PROFILE_PREDICATE = '__profile_rule'
+RULE_WIDTH = 60
+FALSE = clingo.Function('false')
+
+
+class VariableCollector(clingo.ast.Transformer):
+
+    def __init__(self):
+        self.names = {}
+
+    def visit_Variable(self, variable):
+        if variable.name != '_':
+            self.names.setdefault(variable.name, variable)
+        return variable
+
+
+def global_variables(body):
+    """ Returns the variables of body outside conditions and aggregate elements. """
+    collector = VariableCollector()
+    for literal in body:
+        if literal.ast_type != clingo.ast.ASTType.Literal:
+            continue  # conditional literal: its variables are local
+        atom = literal.atom
+        if atom.ast_type in (clingo.ast.ASTType.BodyAggregate, clingo.ast.ASTType.Aggregate):
+            for guard in (atom.left_guard, atom.right_guard):
+                if guard:
+                    collector(guard.term)
+        elif atom.ast_type in (clingo.ast.ASTType.SymbolicAtom, clingo.ast.ASTType.Comparison):
+            collector(atom)
+    return list(collector.names.values())
+
+
+def counting_rule(rule, rule_id):
+    """ Creates #external __profile_rule(rule_id, (Vars)) : body. """
+    loc = rule.location
+    variables = global_variables(rule.body)
+    head = clingo.ast.Function(loc, PROFILE_PREDICATE, [
+        clingo.ast.SymbolicTerm(loc, clingo.Number(rule_id)),
+        clingo.ast.Function(loc, '', variables, 0)], 0)
+    return clingo.ast.External(loc, clingo.ast.SymbolicAtom(head), rule.body, clingo.ast.SymbolicTerm(loc, FALSE))
+
+
+class GroundingProfile:
+    """ Ground instances per rule and grounding time per call to ground. """
+
+    def __init__(self):
+        self.rules = []                         # rule_id -> (file, line, part, text)
+        self.instances = collections.Counter()  # rule_id -> number of instances
+        self.times = []                         # (parts, seconds)
+
+    def add_counting_rules(self, builder, files, add_rules=False):
+        """ Adds the counting rules for files to builder, in the parts of their rules. """
+        part = 'base'
+        def add(ast):
+            nonlocal part
+            if ast.ast_type == clingo.ast.ASTType.Program:
+                part = ast.name
+                builder.add(ast)
+            elif ast.ast_type == clingo.ast.ASTType.Rule:
+                rule_id = len(self.rules)
+                begin = ast.location.begin
+                self.rules.append((original_name(begin.filename), begin.line, part, str(ast)))
+                builder.add(counting_rule(ast, rule_id))
+            if add_rules and ast.ast_type != clingo.ast.ASTType.Program:
+                builder.add(ast)
+        with decompressed(files) as sources:
+            clingo.ast.parse_files(sources, callback=add, logger=lambda code, message: None)
+
+    def ground(self, ground, control, parts, context=None):
+        """ Calls ground and counts the instances of each rule in control. """
+        t0 = time.perf_counter()
+        result = ground(control, parts=parts, context=context)
+        self.times.append((', '.join(name for name, _ in parts), time.perf_counter() - t0))
+        self.instances = collections.Counter(sa.symbol.arguments[0].number
+                                             for sa in control.symbolic_atoms.by_signature(PROFILE_PREDICATE, 2))
+        return result
+
+    def hot_rules(self, top=10):
+        for rule_id, count in self.instances.most_common(top):
+            yield count, *self.rules[rule_id]
+
+    def report(self, top=10, label=None):
+        lines = [f"Grounding profile{f' of {label}' if label else ''}:"]
+        for parts, seconds in self.times:
+            lines.append(f"  {seconds:8.3f} s  #program {parts}")
+        lines.append(f"  {'instances':>10}  rule")
+        for count, file, line, part, text in self.hot_rules(top):
+            if len(text) > RULE_WIDTH:
+                text = text[:RULE_WIDTH - 3] + '...'
+            lines.append(f"  {count:10}  {file}:{line}  {text}")
+        return '\n'.join(lines)
+
+
+def grounding_profile(files, parts=(('base', ()),), context=None, arguments=()):
+    """ Loads files with a counting rule for each rule, grounds parts and returns a GroundingProfile. """
+    profile = GroundingProfile()
+    control = create_control(arguments=[*arguments, '--warn', 'none'])
+    with clingo.ast.ProgramBuilder(control) as builder:
+        profile.add_counting_rules(builder, files, add_rules=True)
+    profile.ground(lambda control, parts, context: control.ground(parts, context=context), control, parts, context)
+    return profile
+
+
+def grounding_profile_plugin(next, profile_grounding=0, **etc):
+    """ Prints the profile_grounding hottest rules to stderr, for each grounding. """
+
+    logger, _load, _ground, solve = next(**etc)
+
+    if not profile_grounding:
+        return logger, _load, _ground, solve
+
+    profiles = weakref.WeakKeyDictionary()
+
+    def load(control, files):
+        _load(control, files)
+        profile = profiles.setdefault(control, GroundingProfile())
+        with clingo.ast.ProgramBuilder(control) as builder:
+            profile.add_counting_rules(builder, files)
+
+    def ground(control, parts=(('base', ()),), context=None):
+        if (profile := profiles.get(control)) is None:
+            return _ground(control, parts=parts, context=context)
+        result = profile.ground(_ground, control, parts, context)
+        print(profile.report(profile_grounding, profile.times[-1][0]), file=sys.stderr, flush=True)
+        return result
+
+    return logger, load, ground, solve
+
+
+@test
+def variables_of_body():
+    def names(rule):
+        rules = []
+        clingo.ast.parse_string(rule, rules.append)
+        return [v.name for v in global_variables(rules[1].body)]
+    test.eq(['X', 'Y'], names("a :- p(X), not q(X, Y), Y < 3, r(_)."))
+    test.eq(['X'], names("a :- p(X); s(Y): q(Y); #count{Z: r(Z)} > X."))
+    test.eq(['N'], names("a :- N = #count{Z: r(Z)}."))
+    test.eq([], names("a."))
+
+
+@test
+def count_rule_instances(tmp_path):
+    f = write_file(tmp_path/'f.lp', """\
+        node(1..10).
+        edge(X, Y) :- node(X), node(Y), X < Y.
+        {in(X)} :- node(X).
+        :- in(X), in(Y), edge(X, Y), X < 3.
+        #program other.
+        size(N) :- N = #count{X: node(X)}.
+        """)
+    profile = grounding_profile([f], (('base', ()), ('other', ())))
+    test.eq([('base', f, 1), ('base', f, 2), ('base', f, 3), ('base', f, 4), ('other', f, 6)],
+            [(part, file, line) for file, line, part, _ in profile.rules])
+    test.eq({0: 1, 1: 45, 2: 10, 3: 17, 4: 1}, dict(profile.instances))
+    test.eq(['base, other'], [parts for parts, _ in profile.times])
+    (count, file, line, part, text), *_ = profile.hot_rules(1)
+    test.eq((45, 2, 'edge(X,Y) :- node(X); node(Y); X < Y.'), (count, line, text))
+    report = profile.report(2, 'main').splitlines()
+    test.eq("Grounding profile of main:", report[0])
+    test.endswith(report[1], " s  #program base, other")
+    test.eq("   instances  rule", report[2])
+    test.eq(f"          45  {f}:2  edge(X,Y) :- node(X); node(Y); X < Y.", report[3])
+    test.eq(5, len(report))
+
+
+@test
+def grounding_profile_plugin_basics(tmp_path, stderr):
+    f = write_file(tmp_path/'f.lp', "#program test_a(base). b(X) :- a(X). #program base. a(1..3).")
+    def next_plugin(**etc):
+        def load(control, files):
+            for file in files:
+                control.load(file)
+        def ground(control, parts, context=None):
+            control.ground(parts, context=context)
+        return None, load, ground, None
+    _, load, ground, _ = grounding_profile_plugin(next_plugin, profile_grounding=1)
+    control = clingo.Control()
+    load(control, [f])
+    ground(control, (('test_a', [NA]), ('base', ())))
+    test.eq(6, len([sa for sa in control.symbolic_atoms if sa.symbol.name != PROFILE_PREDICATE]))
+    with control.solve(yield_=True) as handle:
+        test.eq(['a(1)', 'a(2)', 'a(3)', 'b(1)', 'b(2)', 'b(3)'], sorted(str(s) for s in next(iter(handle)).symbols(shown=True)))
+    report = stderr.getvalue().splitlines()
+    test.eq("Grounding profile of test_a, base:", report[0])
+    test.endswith(report[1], " s  #program test_a, base")
+    test.eq(f"           3  {f}:1  b(X) :- a(X).", report[3])
+    test.eq(4, len(report))
+    test.eq((None, 'l', 'g', 's'), grounding_profile_plugin(lambda **etc: (None, 'l', 'g', 's')))
+
+
+@test
+def rules_see_atoms_of_tests(tmp_path, stderr):
+    f = write_file(tmp_path/'f.lp', "edge(X, Y) :- node(X), node(Y), X < Y.\n#program test_many(base). node(1..100).")
+    def next_plugin(**etc):
+        def load(control, files):
+            for file in files:
+                control.load(file)
+        def ground(control, parts, context=None):
+            control.ground(parts, context=context)
+        return None, load, ground, None
+    _, load, ground, _ = grounding_profile_plugin(next_plugin, profile_grounding=1)
+    control = clingo.Control()
+    load(control, [f])
+    ground(control, (('test_many', [NA]), ('base', ())))
+    test.eq(4950, len(list(control.symbolic_atoms.by_signature('edge', 2))))
+    test.eq(f"        4950  {f}:1  edge(X,Y) :- node(X); node(Y); X < Y.", stderr.getvalue().splitlines()[3])
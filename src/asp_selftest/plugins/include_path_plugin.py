@@ -0,0 +1,141 @@
+""" Include paths per session, without changing CLINGOPATH for the whole process.
+
+    Clingo looks for an #include relative to the working directory, then to
+    the including file, then in CLINGOPATH. Setting CLINGOPATH for one session
+    breaks sessions running in other threads. Instead, files with includes
+    that are only found in include_paths get a copy in which those includes,
+    and the relative ones, are absolute. Included files are treated the same,
+    so their copies are included instead. Copies keep the lines of their
+    originals; original_name() maps them back for tests and messages.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+from .compression import compression_of, copies_of
+from .misc import write_file
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+INCLUDE = re.compile(r'(#include\s*)"([^"\n]*)"')
+
+
+class IncludeResolver:
+    """ Makes copies of files, with includes resolved against include_paths, in tmpdir. """
+
+    def __init__(self, include_paths, tmpdir):
+        clingopath = [p for p in os.environ.get('CLINGOPATH', '').split(':') if p]
+        self.search = [*clingopath, *include_paths]
+        self.tmpdir = tmpdir
+        self.copies = {}     # copy -> original
+        self.resolved = {}   # original -> file to use instead
+
+    def find(self, name, including):
+        if os.path.isabs(name):
+            return name if os.path.isfile(name) else None
+        for directory in ('.', os.path.dirname(including), *self.search):
+            if os.path.isfile(path := os.path.join(directory, name)):
+                return os.path.abspath(path)
+
+    def resolve(self, filename):
+        """ Returns filename, or a copy of it when its includes need include_paths. """
+        if filename in self.resolved:
+            return self.resolved[filename]
+        self.resolved[filename] = filename  # included in a cycle: as is
+        if compression_of(filename) or not os.path.isfile(filename):
+            return filename
+        with open(filename) as f:
+            text = f.read()
+        if '#include' not in text:
+            return filename
+        needs_copy = False
+        def rewrite(match):
+            nonlocal needs_copy
+            prefix, name = match.groups()
+            if not (found := self.find(name, filename)):
+                return match.group(0)  # let Clingo report it
+            if (use := self.resolve(found)) != found or not self._found_by_clingo(name, filename):
+                needs_copy = True
+            return f'{prefix}"{use}"'
+        copied = INCLUDE.sub(rewrite, text)
+        if needs_copy:
+            copy = os.path.join(self.tmpdir, f"{len(self.copies)}-{os.path.basename(filename)}")
+            with open(copy, 'w') as f:
+                f.write(copied)
+            self.copies[copy] = filename
+            self.resolved[filename] = copy
+        return self.resolved[filename]
+
+    def _found_by_clingo(self, name, including):
+        if os.path.isabs(name):
+            return True
+        return any(os.path.isfile(os.path.join(d, name)) for d in ('.', os.path.dirname(including)))
+
+
+def include_path_plugin(next, files=(), include_paths=(), **etc):
+    """ Resolves includes in files against include_paths, for this session only. """
+
+    if not include_paths:
+        return next(files=files, **etc)
+
+    tmpdir = tempfile.mkdtemp(prefix='asp-include-')
+    resolver = IncludeResolver(include_paths, tmpdir)
+    files = tuple(resolver.resolve(f) for f in files)
+
+    _main = next(files=files, **etc)
+
+    def main():
+        try:
+            with copies_of(resolver.copies):
+                return _main()
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return main
+
+
+@test
+def copy_only_what_needs_include_paths(tmp_path):
+    lib = tmp_path/'lib'
+    lib.mkdir()
+    write_file(lib/'inc.lp', 'inc.')
+    write_file(tmp_path/'near.lp', 'near.')
+    plain = write_file(tmp_path/'plain.lp', '#include "near.lp".')
+    main = write_file(tmp_path/'main.lp', '#include "near.lp".\n#include "inc.lp".\n#include <incmode>.')
+    outer = write_file(tmp_path/'outer.lp', '#include "main.lp".')
+    resolver = IncludeResolver([lib.as_posix()], tmp_path.as_posix())
+    test.eq(plain, resolver.resolve(plain))
+    copy = resolver.resolve(outer)
+    test.ne(outer, copy)
+    copied_main = resolver.resolved[main]
+    test.eq(f'#include "{copied_main}".', open(copy).read())
+    test.eq(f'#include "{tmp_path}/near.lp".\n#include "{lib}/inc.lp".\n#include <incmode>.', open(copied_main).read())
+    test.eq({copied_main: main, copy: outer}, resolver.copies)
+    test.eq('#include "missing.lp".', open(resolver.resolve(write_file(tmp_path/'m.lp', '#include "missing.lp".'))).read())
+
+
+@test
+def include_path_plugin_basics(tmp_path):
+    from .compression import original_name
+    (tmp_path/'inc.lp').write_text('inc.')
+    (tmp_path/'sub').mkdir()
+    main = write_file(tmp_path/'sub'/'main.lp', '#include "inc.lp".')
+    test.eq('main', include_path_plugin(lambda **etc: 'main', files=(main,)))
+    trace = []
+    def next_plugin(files=(), **etc):
+        trace.append((files, etc))
+        def main():
+            trace.append([original_name(f) for f in files])
+            return open(files[0]).read()
+        return main
+    run = include_path_plugin(next_plugin, files=(main,), include_paths=(tmp_path.as_posix(),), other=42)
+    (files, etc), = trace
+    test.eq({'other': 42}, etc)
+    test.eq(f'#include "{tmp_path}/inc.lp".', run())
+    test.eq([main], trace[1])
+    test.eq(files[0], original_name(files[0]))
+    test.comp.truth(os.path.exists(files[0]))
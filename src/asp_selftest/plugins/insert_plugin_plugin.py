@@ -2,9 +2,10 @@ import functools
 import importlib
 import clingo
 from .misc import write_file, is_plugin_instruction
+from .compression import decompressed
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 def insert_plugin_plugin(next, **etc):
@@ -23,7 +24,8 @@ def insert_plugin_plugin(next, **etc):
                 plugin_function = getattr(module, functionname)
                 next_plugin = functools.partial(plugin_function, next_plugin)
    
-        clingo.ast.parse_files(files, callback=get_inserts, logger=logger)
+        with decompressed(files) as sources:
+            clingo.ast.parse_files(sources, callback=get_inserts, logger=logger)
 
         nonlocal _logger, _load, _ground, _solve
         _logger, _load, _ground, _solve = next_plugin(**etc)
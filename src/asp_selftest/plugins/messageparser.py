@@ -2,12 +2,13 @@ import traceback
 import re
 import os
 import math
-import pathlib
 
 import clingo
 
-import selftest
-test = selftest.get_tester(__name__)
+from .compression import original_name, open_source
+
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 CR = '\n' # trick to support old python versions that do not accecpt \ in f-strings
@@ -79,11 +80,12 @@ def warn2raise(lines, label, code, msg):
         file, line, start, end, key, msg, more = messages[0]
         name = label if label else '<asp code>'
         srclines = lines if lines else []
+        file = original_name(file)
         if file == '<block>':
             srclines = lines if lines else []
-        elif pathlib.Path(file).exists():
+        elif os.path.exists(file):
             name = file
-            srclines = [l.removesuffix('\n') for l in open(file).readlines()]
+            srclines = [l.removesuffix('\n') for l in open_source(file).readlines()]
         w = 1
         max_lineno = len(srclines)
         nr_width = 1 + int(math.log10(max_lineno)) if max_lineno > 0 else 0
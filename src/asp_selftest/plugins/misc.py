@@ -1,12 +1,12 @@
+import os
 import shutil
 import enum
 import itertools
 import tempfile
-from unittest import mock
 import clingo
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 NA = clingo.String("N/A")
@@ -35,6 +35,31 @@ def write_tempfile(suffix, data):
     return f
 
 
+TMPFS = '/dev/shm'
+
+
+def cache_dir():
+    """ Read when used: clingo+ --serve runs requests with the environment of the client. """
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'asp-selftest')
+
+
+def spool_dir():
+    """ Prefer tmpfs for spooling data, when available. """
+    if os.path.isdir(TMPFS) and os.access(TMPFS, os.W_OK):
+        return TMPFS
+
+
+def spool_stdin(suffix='-stdin.lp', chunk_size=1 << 20):
+    """ Copies stdin in chunks into a new temporary file. It is gone when closed; sessions
+        pass it on to their plugins as stdin_spool.
+    """
+    f = tempfile.NamedTemporaryFile('wb', suffix=suffix, dir=spool_dir())
+    with open(os.dup(0), 'rb') as stdin:  # leaves fd 0 open for others
+        shutil.copyfileobj(stdin, f, chunk_size)
+    f.flush()
+    return f
+
+
 def list_symbols(control):
     return [str(a.symbol) for a in control.symbolic_atoms]
 
@@ -84,6 +109,7 @@ def format_symbols(symbols):
 
 @test
 def format_symbols_basic():
+    from unittest import mock
     test.eq('a', format_symbols(['a']))
     test.eq('a  b  c  d', format_symbols(['a', 'b', 'c', 'd']))
     test.eq('a  b  c  d', format_symbols([' a  ', '\tb', '\nc\n', '  d '])) # strip
@@ -0,0 +1,193 @@
+""" Writes models in batches on a background thread, as newline delimited JSON or binary records.
+
+    Binary records are: uint32 model number, uint32 number of symbols, then per symbol
+    uint32 length and the symbol in clingo syntax as UTF-8. All little endian.
+"""
+
+import sys
+import json
+import queue
+import struct
+import threading
+import clingo
+
+from .misc import write_file
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+BATCH_SIZE = 100
+MAX_BATCHES = 16
+
+
+def encode_ndjson(number, symbols):
+    return json.dumps({'number': number, 'symbols': symbols}).encode() + b'\n'
+
+
+def encode_binary(number, symbols):
+    encoded = [s.encode() for s in symbols]
+    return b''.join([struct.pack('<II', number, len(encoded)),
+                     *(struct.pack('<I', len(e)) + e for e in encoded)])
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'binary': encode_binary,
+}
+
+
+def read_binary(f):
+    """ Yields (number, symbols) from a file with binary records. """
+    while header := f.read(8):
+        number, n = struct.unpack('<II', header)
+        symbols = []
+        for _ in range(n):
+            length, = struct.unpack('<I', f.read(4))
+            symbols.append(f.read(length).decode())
+        yield number, symbols
+
+
+class ModelWriter:
+    """ Collects models in batches and writes them to file on a background thread, started with the first batch.
+        At most max_batches batches are buffered; beyond that, on_model waits.
+    """
+
+    def __init__(self, file, format='ndjson', batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        self.file = file
+        self.encode = ENCODERS[format]
+        self.batch_size = batch_size
+        self.batch = []
+        self.queue = queue.Queue(maxsize=max_batches)
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+
+    def put(self, batch):
+        if self.thread.ident is None:
+            self.thread.start()  # only now: forking for --jobs is safe while no thread runs
+        self.queue.put(batch)
+
+    def on_model(self, model):
+        self.batch.append((model.number, [str(s) for s in model.symbols(shown=True)]))
+        if len(self.batch) >= self.batch_size:
+            self.put(self.batch)
+            self.batch = []
+
+    def drain(self):
+        encode = self.encode
+        try:
+            while (batch := self.queue.get()) is not None:
+                self.file.write(b''.join(encode(n, symbols) for n, symbols in batch))
+            self.file.flush()
+        except Exception as e:
+            self.error = e
+            while self.queue.get() is not None:  # keep the solver going
+                pass
+
+    def close(self):
+        if self.batch:
+            self.put(self.batch)
+            self.batch = []
+        self.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def model_writer_plugin(next, model_output=None, model_format='ndjson', on_model=None, **etc):
+    """ Writes all models found by the main solve to model_output ('-' for stdout). """
+
+    if not model_output:
+        return next(on_model=on_model, **etc)
+
+    file = sys.stdout.buffer if model_output == '-' else open(model_output, 'wb')
+    writer = ModelWriter(file, model_format)
+
+    def write_model(model):
+        writer.on_model(model)
+        if on_model:
+            return on_model(model)
+
+    logger, _main = next(on_model=write_model, **etc)
+
+    def main():
+        try:
+            return _main()
+        finally:
+            try:
+                writer.close()
+            finally:
+                if file is not sys.stdout.buffer:
+                    file.close()
+
+    return logger, main
+
+
+def solve_all(source, on_model):
+    control = clingo.Control(['0'])
+    control.add(source)
+    control.ground()
+    control.solve(on_model=on_model)
+
+
+@test
+def encode_records():
+    test.eq(b'{"number": 1, "symbols": ["a", "b(\\"x\\")"]}\n', encode_ndjson(1, ['a', 'b("x")']))
+    import io
+    data = encode_binary(2, ['a', 'p(1)']) + encode_binary(3, [])
+    test.eq([(2, ['a', 'p(1)']), (3, [])], list(read_binary(io.BytesIO(data))))
+
+
+@test
+def write_models_in_batches(tmp_path):
+    f = open(tmp_path/'models.ndjson', 'wb')
+    writer = ModelWriter(f, batch_size=2, max_batches=1)
+    test.eq(None, writer.thread.ident)
+    solve_all("{a; b; c}.", writer.on_model)
+    writer.close()
+    f.close()
+    records = [json.loads(l) for l in open(tmp_path/'models.ndjson')]
+    test.eq(8, len(records))
+    test.eq(list(range(1, 9)), [r['number'] for r in records])
+    test.eq({(), ('a',), ('b',), ('c',), ('a', 'b'), ('a', 'c'), ('b', 'c'), ('a', 'b', 'c')},
+            {tuple(sorted(r['symbols'])) for r in records})
+
+
+@test
+def write_errors_are_raised_on_close():
+    class BrokenFile:
+        def write(self, data):
+            raise OSError("disk full")
+    writer = ModelWriter(BrokenFile(), batch_size=1, max_batches=1)
+    solve_all("{a; b}.", writer.on_model)
+    with test.raises(OSError, "disk full"):
+        writer.close()
+
+
+@test
+def model_writer_plugin_basics(tmp_path):
+    trace = []
+    def next_plugin(on_model=None, **etc):
+        trace.append(etc)
+        def main():
+            solve_all("{a}.", on_model)
+            return 'done'
+        return None, main
+    logger, main = model_writer_plugin(
+        next_plugin,
+        model_output=(tmp_path/'models.bin').as_posix(),
+        model_format='binary',
+        on_model=lambda m: trace.append(m.number),
+        more='yes')
+    test.eq('done', main())
+    test.eq([{'more': 'yes'}, 1, 2], trace)
+    models = list(read_binary(open(tmp_path/'models.bin', 'rb')))
+    test.eq([1, 2], [n for n, _ in models])
+    test.eq([[], ['a']], sorted(symbols for _, symbols in models))
+
+
+@test
+def model_writer_plugin_without_output():
+    def next_plugin(on_model=None):
+        return 'logger', on_model
+    test.eq(('logger', None), model_writer_plugin(next_plugin))
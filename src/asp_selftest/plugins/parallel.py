@@ -0,0 +1,269 @@
+""" Runs tests concurrently, in threads where possible (--jobs N).
+
+    Clingo grounds and solves in C++ without holding the GIL, so tests
+    without Python callbacks run in parallel in threads, sharing everything
+    loaded in this process. Tests whose files call @functions or contain
+    #script need the GIL for every callback; they run in forked processes
+    instead. On free-threaded Python (3.13t) all tests run in threads.
+
+    Forking copies only the calling thread: a lock held by another thread
+    stays locked in the child. The workers are therefore forked before any
+    thread of the run starts, and when other threads are alive already,
+    tests with Python run in threads too. The model writer only starts its
+    thread with the first models, after the tests ran.
+
+    Whether tests use Python is found by parsing their files, once per set
+    of files: all tests of a file share one parse. Each test parses its files
+    again when it loads them into its own Control, as the plugins read them
+    there in their own way (syntax errors, tables, reification); a parse
+    cannot be handed to them.
+
+    Tests start in the order given, see sharding.order_units(), while
+    output is reported in the order of the tests, as when running them one
+    by one. A failure that stops the run is reported as soon as it happens;
+    it cancels the tests not yet started.
+"""
+
+import sys
+import itertools
+import functools
+import threading
+import clingo.ast
+
+from .compression import decompressed
+from .tracing import worker_events, add_events
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+class Unit:
+    """ One test: its name, the files it loads, a function running it and where it is defined. """
+
+    def __init__(self, name, files, run, lineno=None):
+        self.name = name
+        self.files = files
+        self.run = run
+        self.lineno = lineno
+
+
+def free_threaded():
+    return not getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+class _Found(Exception):
+    pass
+
+
+def calls_function(ast):
+    """ Whether ast contains an external @function call. """
+    if ast.ast_type == clingo.ast.ASTType.Function and ast.external:
+        return True
+    for key in ast.child_keys:
+        child = getattr(ast, key)
+        if isinstance(child, clingo.ast.AST):
+            if calls_function(child):
+                return True
+        elif child is not None and not isinstance(child, (str, int)):
+            if any(calls_function(c) for c in child):
+                return True
+    return False
+
+
+def uses_python(files):
+    """ Whether files, or files they include, contain #script or call @functions. """
+    def check(ast):
+        if ast.ast_type == clingo.ast.ASTType.Script or '@' in str(ast) and calls_function(ast):
+            raise _Found
+    if not files:
+        return False  # Clingo would read stdin
+    try:
+        with decompressed(files) as sources:
+            clingo.ast.parse_files(sources, callback=check, logger=lambda code, message: None)
+    except _Found:
+        return True
+    except RuntimeError:
+        return True  # syntax errors are reported when the test runs
+    return False
+
+
+_pending = {}  # units of a run, inherited by forked workers
+_runs = itertools.count()
+
+
+def _run_pending(run, index):
+    """ Runs in a forked worker; returns the result with the trace events of the unit. """
+    with worker_events() as events:
+        result = _pending[run][index].run()
+    portable = getattr(result, 'portable', None)  # Symbols cannot be pickled
+    return (portable() if portable else result), events
+
+
+class Report:
+    """ Prints the plan and calls done for each unit, in the order of plan, as far as units are done. """
+
+    def __init__(self, plan, done, quiet):
+        self.plan = plan
+        self.done = done
+        self.quiet = quiet
+        self.position = 0
+        self.started = None  # unit whose name is printed, waiting for its result
+        self.results = {}
+
+    def print(self, *args, **kwargs):
+        if not self.quiet:
+            print(*args, **kwargs, flush=True)
+
+    def next_unit(self):
+        while self.position < len(self.plan):
+            item = self.plan[self.position]
+            if isinstance(item, Unit):
+                return item
+            self.print(item)
+            self.position += 1
+
+    def running(self, unit):
+        """ Shows unit as running when it is the next one to report. """
+        if self.next_unit() is unit:
+            self.print(" ", unit.name, end='')
+            self.started = unit
+
+    def add(self, unit, result, stop=False):
+        """ Reports the units done so far; with stop, reports unit right away. """
+        if stop:
+            if self.started is not unit:
+                self.print(" ", unit.name, end='')
+            self.print()
+            self.started = None
+            self.done(unit, result)
+            return
+        self.results[unit] = result
+        while (item := self.next_unit()) is not None and item in self.results:
+            if self.started is not item:
+                self.print(" ", item.name, end='')
+            self.print()
+            self.started = None
+            self.position += 1
+            self.done(item, self.results.pop(item))
+
+    def abort(self):
+        if self.started:
+            self.print()
+
+
+def run_units(plan, jobs, done=lambda unit, result: None, quiet=False, order=None, stop=lambda result: False):
+    """ Runs the units in plan, jobs at the same time, started in order (default: that of plan);
+        plan also holds headers (str) to print in between. Calls done with the result of each unit,
+        in the order of plan, or right away for a result for which stop is true.
+    """
+    units = [u for u in plan if isinstance(u, Unit)] if order is None else order
+    report = Report(plan, done, quiet)
+    if jobs == 1:
+        try:
+            for unit in units:
+                report.running(unit)
+                result = unit.run()
+                report.add(unit, result, stop(result))
+        except BaseException:
+            report.abort()
+            raise
+        return
+    import concurrent.futures
+    in_process = []
+    if not free_threaded() and threading.active_count() == 1:  # see above
+        python = functools.cache(uses_python)  # parse each set of files once
+        in_process = [u for u in units if python(tuple(u.files))]
+    run = next(_runs)
+    _pending[run] = in_process
+    processes = threads = None
+    futures = {}
+    try:
+        if in_process:
+            import multiprocessing
+            processes = concurrent.futures.ProcessPoolExecutor(
+                min(jobs, len(in_process)), mp_context=multiprocessing.get_context('fork'))
+            for i, unit in enumerate(in_process):  # forks all workers before any thread starts
+                futures[processes.submit(_run_pending, run, i)] = unit
+        threads = concurrent.futures.ThreadPoolExecutor(jobs)
+        forked = set(in_process)
+        for unit in units:
+            if unit not in forked:
+                futures[threads.submit(unit.run)] = unit
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if futures[future] in forked:
+                result, events = result
+                add_events(events)
+            report.add(futures[future], result, stop(result))
+    finally:
+        for executor in (threads, processes):
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        del _pending[run]
+
+
+@test
+def detect_python(tmp_path):
+    from .misc import write_file
+    plain = write_file(tmp_path/'plain.lp', 'a. b :- a. c("@home").')
+    call = write_file(tmp_path/'call.lp', 'a(@f(1)).')
+    script = write_file(tmp_path/'script.lp', '#script (python)\ndef f(): pass\n#end.')
+    include = write_file(tmp_path/'include.lp', f'#include "{call}".')
+    test.comp.truth(uses_python([plain]))
+    test.truth(uses_python([call]))
+    test.truth(uses_python([script]))
+    test.truth(uses_python([include]))
+    test.truth(uses_python([plain, call]))
+    test.comp.truth(uses_python([]))
+
+
+@test
+def report_in_order(stdout):
+    import time
+    trace = []
+    def unit(name, delay, error=None):
+        def run():
+            time.sleep(delay)
+            trace.append(name)
+            if error:
+                raise error
+        return Unit(name, (), run)
+    run_units(["Testing x", unit('a', 0.05), unit('b', 0), "Testing y", unit('c', 0)], jobs=3)
+    test.eq("Testing x\n  a\n  b\nTesting y\n  c\n", stdout.getvalue())
+    test.eq('a', trace[-1])  # ran concurrently
+    results = []
+    run_units(["Testing z", unit('a', 0.05), unit('b', 0)], jobs=2, done=lambda u, r: results.append(u.name), quiet=True)
+    test.eq(['a', 'b'], results)
+    test.eq("Testing x\n  a\n  b\nTesting y\n  c\n", stdout.getvalue())
+    with test.raises(ValueError, "b failed"):
+        run_units([unit('a', 0), unit('b', 0, ValueError("b failed")), unit('c', 0)], jobs=1)
+    test.eq({}, _pending)
+
+
+@test
+def start_in_given_order(stdout):
+    import time
+    trace = []
+    def unit(name, delay=0, error=None):
+        def run():
+            time.sleep(delay)
+            trace.append(name)
+            return error
+        return Unit(name, (), run)
+    a, b, c = unit('a'), unit('b'), unit('c')
+    run_units(["Testing x", a, b, c], jobs=1, order=[c, a, b])
+    test.eq(['c', 'a', 'b'], trace)
+    test.eq("Testing x\n  a\n  b\n  c\n", stdout.getvalue())
+    reported = []
+    def done(unit, error):
+        reported.append(unit.name)
+        if error:
+            raise error
+    fails = unit('f', error=ValueError("f failed"))
+    with test.raises(ValueError, "f failed"):
+        run_units(["Testing y", a, fails], jobs=1, order=[fails, a], done=done, stop=bool)
+    test.eq(['f'], reported)  # right away, before a ran
+    test.eq("Testing x\n  a\n  b\n  c\nTesting y\n  f\n", stdout.getvalue())
+    with test.raises(ValueError, "f failed"):
+        run_units([unit('slow', 0.2), fails], jobs=2, done=done, stop=bool, quiet=True)
+    test.eq(['f', 'f'], reported)
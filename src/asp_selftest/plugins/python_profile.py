@@ -0,0 +1,272 @@
+""" Profiling of the Python side of a run: plugins, context @functions and #script code.
+
+    python_profile() profiles the whole run or only one phase. Plugins mark
+    their phases with profile_phase(); that costs next to nothing when no
+    profile is active. Phases are:
+
+        run          everything
+        discovery    parsing files to find tests
+        reify        reifying rules, for the main program and all tests
+        solve        the main solve
+        test:NAME    running one test, e.g. test:test_edges or test:base
+
+    Output is a pstats file, for snakeviz or pstats, and a file with
+    collapsed stacks for flame graph tools. cProfile only records callers,
+    not full stacks, so the time of a function is divided over its callers
+    in proportion to the time spent on each, and the stack above a caller
+    follows the callers that spent the most time.
+"""
+
+import os
+import sys
+import contextlib
+import collections
+import clingo
+
+from .misc import write_file
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+PHASES = ('run', 'discovery', 'reify', 'solve', 'test:NAME')
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLINGO_DIR = os.path.dirname(os.path.abspath(clingo.__file__))
+MAX_DEPTH = 64
+GROUND_CALLBACKS = ('_pyclingo_ground_callback', 'call')  # clingo functions calling @functions
+
+
+_active = None   # (profiler, phase) while python_profile() is active
+
+
+def profiling():
+    return _active is not None
+
+
+@contextlib.contextmanager
+def profile_phase(name, detail=None):
+    """ Marks a phase; profiles it when it was selected. """
+    if _active is None or _active[1] not in (name, f"{name}:{detail}"):
+        yield
+        return
+    profiler = _active[0]
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+
+@contextlib.contextmanager
+def python_profile(filename, phase='run', report=sys.stderr):
+    """ Activates profiling of phase; writes filename and filename.collapsed at the end. """
+    global _active
+    if not filename:
+        yield
+        return
+    import pstats
+    import cProfile
+    profiler = cProfile.Profile()
+    _active = profiler, phase
+    try:
+        with profile_phase('run'):
+            yield profiler
+    finally:
+        _active = None
+        profiler.create_stats()
+        if not profiler.stats:
+            print(f"Python profile: phase {phase!r} did not occur.", file=report)
+            return
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(filename)
+        with open(filename + '.collapsed', 'w') as f:
+            for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+                f.write(f"{stack} {microseconds}\n")
+        print(format_categories(categories(stats), phase, filename), file=report)
+
+
+def category(func):
+    filename, line, name = func
+    if filename == '<string>':
+        return '#script'
+    if filename.startswith(PACKAGE_DIR):
+        return 'plugins'
+    if filename.startswith(CLINGO_DIR):
+        return 'clingo API'
+    if filename == '~':
+        return 'builtins'
+    return 'other'
+
+
+def categories(stats):
+    """ Own time per category of function, and the total time of @functions and #script code.
+        Context @functions are functions outside clingo that clingo calls while grounding.
+    """
+    own = collections.Counter()
+    called = collections.Counter()
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        kind = category(func)
+        if kind == '#script' and not any(c[0] == '<string>' or c[2] in GROUND_CALLBACKS for c in callers):
+            kind = 'clingo API'  # clingo itself also compiles some code from strings
+        own[kind] += tt
+        if kind not in ('clingo API', 'builtins') and any(category(c) == 'clingo API' for c in callers):
+            if kind == '#script':
+                called['#script code'] += ct
+            elif any(c[2] in GROUND_CALLBACKS for c in callers):
+                called['context @functions'] += ct
+    return own, called
+
+
+def format_categories(own_and_called, phase, filename):
+    own, called = own_and_called
+    lines = [f"Python profile of {phase}, written to {filename} and {filename}.collapsed:"]
+    for kind, seconds in own.most_common():
+        lines.append(f"  {seconds:8.3f} s  own time in {kind}")
+    for kind, seconds in called.most_common():
+        lines.append(f"  {seconds:8.3f} s  total time in {kind}")
+    return '\n'.join(lines)
+
+
+def frame_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed_stacks(stats, max_depth=MAX_DEPTH):
+    """ Approximates stacks from the caller graph: {'root;...;caller;func': microseconds}.
+        Own time of func is divided over its direct callers; above those, a stack follows
+        the heaviest caller of each function, so there is one stack per edge, not per path.
+    """
+    entries = stats.stats
+    heaviest = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        weights = {c: v[3] for c, v in callers.items() if c in entries and c != func}
+        if weights and max(weights.values()) > 0:
+            heaviest[func] = max(weights, key=weights.get)
+
+    stacks = {}
+    def stack_of(func):
+        path = []
+        while func is not None and func not in stacks and func not in path and len(path) < max_depth:
+            path.append(func)
+            func = heaviest.get(func)
+        stack = stacks.get(func, ())
+        for f in reversed(path):
+            stack = stacks[f] = (stack + (frame_label(f),))[-max_depth:]
+        return stacks[path[0]] if path else stack
+
+    result = collections.Counter()
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        if tt <= 0:
+            continue
+        callers = {c: v[3] for c, v in callers.items() if c in entries and c != func}
+        total = sum(callers.values())
+        if total <= 0:
+            result[';'.join(stack_of(func))] += tt
+            continue
+        label = frame_label(func)
+        for caller, t in callers.items():
+            result[';'.join(stack_of(caller)[1 - max_depth:] + (label,))] += tt * t / total
+    return collections.Counter({s: round(t * 1e6) for s, t in result.items() if round(t * 1e6) > 0})
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+@test
+def phases_are_selected():
+    import cProfile
+    global _active
+    profiler = cProfile.Profile()
+    _active = profiler, 'test:test_a'
+    try:
+        with profile_phase('test', 'test_b'):
+            busy(100)
+        with profile_phase('test', 'test_a'):
+            busy(1000)
+        with profile_phase('discovery'):
+            busy(100)
+    finally:
+        _active = None
+    profiler.create_stats()
+    test.eq(1, sum(nc for (f, l, name), (cc, nc, *_) in profiler.stats.items() if name == 'busy'))
+    with profile_phase('test', 'test_a'):  # inactive
+        pass
+
+
+@test
+def profile_whole_run(tmp_path):
+    import io
+    import pstats
+    filename = (tmp_path/'run.prof').as_posix()
+    report = io.StringIO()
+    with python_profile(filename, report=report):
+        busy(10000)
+    stats = pstats.Stats(filename)
+    test.truth(any(name == 'busy' for _, _, name in stats.stats))
+    stacks = open(filename + '.collapsed').read().splitlines()
+    test.truth(any(line.startswith('busy (python_profile.py:') for line in stacks))
+    stack, microseconds = stacks[0].rsplit(' ', 1)
+    test.truth(int(microseconds) > 0)
+    test.startswith(report.getvalue(), f"Python profile of run, written to {filename} and {filename}.collapsed:\n")
+    test.contains(report.getvalue(), " s  own time in plugins\n")
+
+
+@test
+def stacks_of_shared_callees():
+    from types import SimpleNamespace
+    def f(name):
+        return ('m.py', 1, name)
+    entries = {f('main'): (1, 1, 0.0, 30.0, {})}
+    layer = [f('main')]
+    for depth in range(40):  # every function calls both of the next layer: 2**40 paths
+        nxt = [f(f'a{depth}'), f(f'b{depth}')]
+        for func in nxt:  # b calls take more time than a calls
+            entries[func] = (2, 2, 0.25, 1.0, {c: (1, 1, 0.1, 0.5 + j) for j, c in enumerate(layer)})
+        layer = nxt
+    stacks = collapsed_stacks(SimpleNamespace(stats=entries))
+    test.eq(2 + 39 * 4, len(stacks))  # one per edge
+    test.eq(20_000_000, sum(stacks.values()))
+    test.eq(187_500, stacks['main (m.py:1);b0 (m.py:1);a1 (m.py:1)'])  # 0.25 s * 1.5 / 2
+    test.truth(all(s.startswith('main (m.py:1);b0 (m.py:1);b1 (m.py:1);') for s in stacks if s.count(';') > 3))
+    test.eq(41, max(s.count(';') + 1 for s in stacks))
+    test.eq(10, max(s.count(';') + 1 for s in collapsed_stacks(SimpleNamespace(stats=entries), max_depth=10)))
+
+
+@test
+def phase_that_does_not_occur(tmp_path):
+    import io
+    report = io.StringIO()
+    with python_profile((tmp_path/'x.prof').as_posix(), 'reify', report=report):
+        busy(100)
+    test.eq("Python profile: phase 'reify' did not occur.\n", report.getvalue())
+    test.comp.truth(os.path.exists(tmp_path/'x.prof'))
+    with python_profile(None) as nothing:
+        test.eq(None, nothing)
+
+
+@test
+def separate_script_and_context_functions():
+    import pstats
+    import cProfile
+    from .compound_context_plugin import CompoundContext
+    from .script_cache_plugin import enable_python
+    enable_python()
+    class Context:
+        def double(self, x):
+            busy(1000)
+            return clingo.Number(x.number * 2)
+    control = clingo.Control()
+    control.add("#script (python)\nimport clingo\ndef triple(x):\n    return clingo.Number(x.number * 3)\n#end.\n"
+                "p(@double(1..50)). q(@triple(1..50)).")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    control.ground(context=CompoundContext(Context()))
+    profiler.disable()
+    own, called = categories(pstats.Stats(profiler))
+    test.gt(called['context @functions'], 0)
+    test.gt(called['#script code'], 0)
+    test.gt(own['clingo API'], 0)
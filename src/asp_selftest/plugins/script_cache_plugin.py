@@ -0,0 +1,187 @@
+""" Executes #script (python) blocks once per run instead of once for every Control.
+
+    Every test, reify round and the main program get a fresh Control, which
+    executes the #script blocks of the files again, imports and set up code
+    included. Instead of Clingo's own, enable_python() registers a Python
+    script that behaves the same, except that while a ScriptCache is active,
+    blocks executed before are skipped. Like with Clingo, blocks are executed
+    in __main__, where the functions they define stay available to later
+    Controls, with or without a context.
+
+    Clingo executes a block with every script registered for Python, so
+    clingo.script.enable_python() must not be called as well.
+
+    Blocks with side effects that must happen for every Control, like reading
+    a file that changes between tests, should not be cached; therefore it is
+    off by default.
+"""
+
+import sys
+import mmap
+import __main__
+
+from .misc import write_file
+from .compression import compression_of
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+class PythonScript:
+    """ Clingo's Python script, skipping blocks executed before while a cache is active.
+        Implements clingo.script.Script, without importing it before it is needed.
+    """
+
+    def __init__(self):
+        self.cache = None
+
+    def execute(self, location, code):
+        if (cache := self.cache) is not None:
+            if code in cache.executed:
+                cache.hits += 1
+                return
+            cache.executed.add(code)
+        exec(code, __main__.__dict__, __main__.__dict__)
+
+    def call(self, location, name, arguments):
+        return getattr(__main__, name)(*arguments)
+
+    def callable(self, name):
+        return name in __main__.__dict__ and callable(__main__.__dict__[name])
+
+    def main(self, control):
+        __main__.main(control)
+
+
+_python_script = PythonScript()
+_enabled = False
+
+
+def enable_python():
+    """ Enables #script (python), once. """
+    global _enabled
+    if not _enabled:
+        from clingo.script import register_script
+        register_script('python', _python_script, '.'.join(map(str, sys.version_info[:3])))
+        _enabled = True
+
+
+def python_enabled():
+    return _enabled
+
+
+SCRIPT_MARKERS = (b'#script', b'#include')
+
+
+def may_contain_scripts(files):
+    """ Searches plain files for #script, or #include of a file that might; other files,
+        like stdin or compressed ones, are assumed to contain scripts.
+    """
+    for name in files:
+        if name == '-' or compression_of(name):
+            return True
+        try:
+            with open(name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if any(data.find(marker) >= 0 for marker in SCRIPT_MARKERS):
+                    return True
+        except ValueError:
+            continue  # empty
+        except OSError:
+            return True  # let Clingo report it
+    return False
+
+
+class ScriptCache:
+    """ Blocks executed during a run; active while entered. """
+
+    def __init__(self):
+        self.executed = set()
+        self.hits = 0
+        self._previous = []
+
+    def __enter__(self):
+        self._previous.append(_python_script.cache)
+        _python_script.cache = self
+        return self
+
+    def __exit__(self, *exc):
+        _python_script.cache = self._previous.pop()
+
+
+def script_cache_plugin(next, script_cache=None, files=(), **etc):
+    """ Enables Python when the files of the session may contain #script, before any plugin
+        adds them to a Control. Activates script_cache during the whole run.
+    """
+
+    if not python_enabled() and may_contain_scripts(files or ('-',)):
+        enable_python()
+
+    logger, _main = next(files=files, **etc)
+
+    if script_cache is None:
+        return logger, _main
+
+    def main():
+        with script_cache:
+            return _main()
+
+    return logger, main
+
+
+@test
+def execute_blocks_once():
+    import clingo
+    program = """
+#script (python)
+import clingo
+script_cache_executions = globals().get('script_cache_executions', 0) + 1
+def script_cache_f():
+    return clingo.Number(script_cache_executions)
+#end.
+        a(@script_cache_f()).
+        """
+    enable_python()
+    cache = ScriptCache()
+    with cache:
+        for _ in range(3):
+            control = clingo.Control()
+            control.add(program)
+            control.ground()
+            test.eq(['a(1)'], [str(a.symbol) for a in control.symbolic_atoms])
+        with cache:
+            control = clingo.Control()
+            control.add(program)
+        test.eq(3, cache.hits)
+    control = clingo.Control()
+    control.add(program)
+    control.ground()
+    test.eq(['a(2)'], [str(a.symbol) for a in control.symbolic_atoms])
+    test.eq(3, cache.hits)
+
+
+@test
+def script_cache_plugin_basics():
+    def next_plugin(**etc):
+        return 'logger', lambda: 42
+    test.eq(('logger', 'main'), script_cache_plugin(lambda **etc: ('logger', 'main')))
+    cache = ScriptCache()
+    logger, main = script_cache_plugin(next_plugin, script_cache=cache)
+    test.eq('logger', logger)
+    test.eq(42, main())
+    test.eq([], cache._previous)
+
+
+@test
+def find_scripts(tmp_path):
+    import gzip
+    plain = write_file(tmp_path/'plain.lp', "a. b :- a.")
+    script = write_file(tmp_path/'script.lp', "a.\n#script (python)\n#end.")
+    include = write_file(tmp_path/'include.lp', '#include "plain.lp".')
+    empty = write_file(tmp_path/'empty.lp', "")
+    (tmp_path/'c.lp.gz').write_bytes(gzip.compress(b"a."))
+    test.comp.truth(may_contain_scripts([plain, empty]))
+    test.truth(may_contain_scripts([plain, script]))
+    test.truth(may_contain_scripts([include]))
+    test.truth(may_contain_scripts(['-']))
+    test.truth(may_contain_scripts([(tmp_path/'c.lp.gz').as_posix()]))
+    test.truth(may_contain_scripts([(tmp_path/'missing.lp').as_posix()]))
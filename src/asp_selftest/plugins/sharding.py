@@ -0,0 +1,265 @@
+""" Splitting the tests over machines (--shard I/N) and ordering them, by how they did before.
+
+    Tests are known by file and name. A timings file holds their durations
+    and failures from earlier runs. Each shard computes the split by itself,
+    so all shards must use the same timings file, for instance one restored
+    from a CI cache; without one, all tests weigh the same. The slowest tests
+    are divided first, each to the shard with the least work so far.
+
+    With a timings file, tests that failed in the last RECENT_RUNS runs start
+    first, the latest failures first, for fast feedback; then the slowest, so
+    that no long test is left running at the end while other jobs are idle.
+
+    Each shard writes its results to a file (--results), headed by its index
+    and the number of tests of all shards. merge_results() combines those into
+    one report, checks that every test ran exactly once, and records the new
+    durations. Shards do not update the timings themselves: a shard started
+    after another one saved would compute a different split.
+"""
+
+import os
+import json
+import statistics
+
+
+RECENT_RUNS = 3
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+def test_key(filename, name):
+    return f"{filename}::{name}"
+
+
+def unit_key(unit):
+    return test_key(','.join(unit.files), unit.name)
+
+
+class Timings:
+    """ Durations of tests in earlier runs, kept in a JSON file. """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def seconds(self, key):
+        return self.entries.get(key, {}).get('seconds')
+
+    def runs_since_failure(self, key):
+        """ 0 when the test failed in the last run, None when not in the last RECENT_RUNS runs. """
+        return self.entries.get(key, {}).get('runs_since_failure')
+
+    def record(self, key, seconds, failed=False):
+        entry = self.entries.setdefault(key, {})
+        entry['seconds'] = round(seconds, 6)
+        if failed:
+            entry['runs_since_failure'] = 0
+        elif 'runs_since_failure' in entry:
+            entry['runs_since_failure'] += 1
+            if entry['runs_since_failure'] >= RECENT_RUNS:
+                del entry['runs_since_failure']
+
+    def update(self, results):
+        for result in results:
+            self.record(test_key(result.filename, result.name), result.seconds, result.status != 'passed')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}"
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+def weigh(keys, timings):
+    """ Seconds per key; unknown tests take the median, or all 1.0 without timings. """
+    seconds = [timings and timings.seconds(k) for k in keys]
+    known = [s for s in seconds if s is not None]
+    guess = statistics.median(known) if known else 1.0
+    return [guess if s is None else s for s in seconds]
+
+
+def shard_units(units, shard, shards, timings=None):
+    """ Returns the units of shard (1..shards), in their original order. """
+    keys = [unit_key(u) for u in units]
+    weights = weigh(keys, timings)
+    loads = [0.0] * shards
+    chosen = set()
+    for weight, key, i in sorted(zip(weights, keys, range(len(units))), key=lambda t: (-t[0], t[1])):
+        least = min(range(shards), key=lambda s: (loads[s], s))
+        loads[least] += weight
+        if least == shard - 1:
+            chosen.add(i)
+    return [u for i, u in enumerate(units) if i in chosen]
+
+
+def order_units(units, timings):
+    """ Returns units in the order to start them: recently failed ones first, then the slowest. """
+    keys = [unit_key(u) for u in units]
+    weights = weigh(keys, timings)
+    def recent(key):
+        n = timings.runs_since_failure(key)
+        return RECENT_RUNS if n is None else n
+    order = sorted(range(len(units)), key=lambda i: (recent(keys[i]), -weights[i], keys[i]))
+    return [units[i] for i in order]
+
+
+def result_record(result):
+    import traceback
+    return {
+        'name': result.name,
+        'filename': result.filename,
+        'lineno': result.lineno,
+        'status': result.status,
+        'seconds': round(result.seconds, 6),
+        'failures': [str(f) for f in result.failures],
+        'error': ''.join(traceback.format_exception_only(result.error)) if result.error else None,
+    }
+
+
+def write_results(path, results, shard=(1, 1), tests=None):
+    """ Writes a header with shard (I, N) and the number of tests of all shards,
+        then a JSON line per TestResult, for merge_results().
+    """
+    with open(path, 'w') as f:
+        f.write(json.dumps({'shard': shard[0], 'shards': shard[1], 'tests': tests}) + '\n')
+        for result in results:
+            f.write(json.dumps(result_record(result)) + '\n')
+
+
+def merge_results(paths, timings=None):
+    """ Combines the result files of shards into one report; returns it and the number
+        of failed tests plus the number of problems with the shards.
+    """
+    records = {}
+    headers = []
+    problems = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'shard' in record:
+                    headers.append(record)
+                    continue
+                key = test_key(record['filename'], record['name'])
+                if key in records:
+                    problems.append(f"DUPLICATE {record['name']} in {record['filename']} ran in more than one shard.")
+                records[key] = record
+    shards = {h['shards'] for h in headers}
+    if len(shards) > 1:
+        problems.append(f"MISMATCH result files are of {', '.join(map(str, sorted(shards)))} shards.")
+    for n in shards:
+        seen = [h['shard'] for h in headers if h['shards'] == n]
+        for i in range(1, n + 1):
+            if seen.count(i) != 1:
+                problems.append(f"MISSING results of shard {i} of {n}." if i not in seen else f"DUPLICATE results of shard {i} of {n}.")
+    counts = {h['tests'] for h in headers if h['tests'] is not None}
+    if len(counts) > 1:
+        problems.append(f"MISMATCH shards found {', '.join(map(str, sorted(counts)))} tests.")
+    elif counts and (missing := counts.pop() - len(records)) > 0:
+        problems.append(f"MISSING {missing} tests did not run in any shard.")
+    failed = [r for r in records.values() if r['status'] != 'passed']
+    seconds = sum(r['seconds'] for r in records.values())
+    lines = [f"Merged {len(paths)} result files: {len(records)} tests, {len(failed)} failed, {seconds:.3f} s in total."]
+    lines.extend(problems)
+    for r in failed:
+        lines.append(f"{r['status'].upper()} {r['name']} in {r['filename']}, line {r['lineno']}:")
+        lines.extend(f"    {line}" for line in r['error'].rstrip('\n').split('\n'))
+    if timings:
+        for key, record in records.items():
+            timings.record(key, record['seconds'], record['status'] != 'passed')
+        timings.save()
+    return '\n'.join(lines), len(failed) + len(problems)
+
+
+class _Unit:
+    def __init__(self, name, files):
+        self.name = name
+        self.files = files
+
+
+@test
+def balance_by_durations(tmp_path):
+    units = [_Unit(n, ('a.lp',)) for n in ('t1', 't2', 't3', 't4', 't5')]
+    test.eq([['t1', 't3', 't5'], ['t2', 't4']], [[u.name for u in shard_units(units, s, 2)] for s in (1, 2)])
+    timings = Timings((tmp_path/'timings.json').as_posix())
+    timings.record('a.lp::t1', 10.0)
+    timings.record('a.lp::t2', 4.0)
+    timings.record('a.lp::t3', 3.0)
+    timings.record('a.lp::t4', 2.0)  # t5 is new: takes the median, 3.5
+    timings.save()
+    timings = Timings(timings.path)
+    test.eq(10.0, timings.seconds('a.lp::t1'))
+    shards = [[u.name for u in shard_units(units, s, 2, timings)] for s in (1, 2)]
+    test.eq([['t1', 't4'], ['t2', 't3', 't5']], shards)  # 12 and 10.5 s
+    test.eq([['t1'], ['t2', 't4'], ['t3', 't5']], [[u.name for u in shard_units(units, s, 3, timings)] for s in (1, 2, 3)])
+    test.eq([], shard_units(units[:1], 2, 2, timings))
+
+
+@test
+def merge_shard_results(tmp_path):
+    from .testrunner_plugin import TestResult, ConstraintError
+    passed = TestResult('test_a(base)', 'a.lp', 2)
+    passed.seconds = 0.25
+    failed = TestResult('test_b()', 'a.lp', 5)
+    failed.seconds = 0.5
+    e = ConstraintError('cannot("b")')
+    e.failures = ['cannot("b")']
+    e.add_note("File a.lp, line 5, in test_b(). Model follows.")
+    failed.fail(e)
+    write_results(tmp_path/'1.jsonl', [passed], (1, 2), 2)
+    write_results(tmp_path/'2.jsonl', [failed], (2, 2), 2)
+    timings = Timings((tmp_path/'timings.json').as_posix())
+    report, count = merge_results([tmp_path/'1.jsonl', tmp_path/'2.jsonl'], timings)
+    test.eq(1, count)
+    test.eq("Merged 2 result files: 2 tests, 1 failed, 0.750 s in total.\n"
+            "FAILED test_b() in a.lp, line 5:\n"
+            "    asp_selftest.plugins.testrunner_plugin.ConstraintError: cannot(\"b\")\n"
+            "    File a.lp, line 5, in test_b(). Model follows.", report)
+    test.eq({'a.lp::test_a(base)': {'seconds': 0.25}, 'a.lp::test_b()': {'seconds': 0.5, 'runs_since_failure': 0}},
+            json.load(open(timings.path)))
+    test.eq(['cannot("b")'], json.loads(open(tmp_path/'2.jsonl').readlines()[1])['failures'])
+
+
+@test
+def detect_missing_and_duplicate_tests(tmp_path):
+    from .testrunner_plugin import TestResult
+    a, b = TestResult('test_a()', 'a.lp', 1), TestResult('test_b()', 'a.lp', 2)
+    write_results(tmp_path/'1.jsonl', [a], (1, 3), 4)
+    write_results(tmp_path/'3.jsonl', [a, b], (3, 3), 4)
+    report, count = merge_results([tmp_path/'1.jsonl', tmp_path/'3.jsonl'])
+    test.eq(3, count)
+    test.eq("Merged 2 result files: 2 tests, 0 failed, 0.000 s in total.\n"
+            "DUPLICATE test_a() in a.lp ran in more than one shard.\n"
+            "MISSING results of shard 2 of 3.\n"
+            "MISSING 2 tests did not run in any shard.", report)
+    write_results(tmp_path/'2.jsonl', [b], (2, 2), 3)
+    report, count = merge_results([tmp_path/'1.jsonl', tmp_path/'2.jsonl'])
+    test.contains(report, "MISMATCH result files are of 2, 3 shards.")
+    test.contains(report, "MISMATCH shards found 3, 4 tests.")
+
+
+@test
+def failed_first_then_longest(tmp_path):
+    units = [_Unit(n, ('a.lp',)) for n in ('t1', 't2', 't3', 't4', 't5')]
+    timings = Timings((tmp_path/'history'/'timings.json').as_posix())
+    test.eq(['t1', 't2', 't3', 't4', 't5'], [u.name for u in order_units(units, timings)])
+    timings.record('a.lp::t1', 1.0)
+    timings.record('a.lp::t2', 4.0)
+    timings.record('a.lp::t3', 2.0, failed=True)
+    timings.record('a.lp::t4', 0.5, failed=True)
+    test.eq(['t3', 't4', 't2', 't5', 't1'], [u.name for u in order_units(units, timings)])  # t5: median 1.5
+    timings.record('a.lp::t3', 2.0)
+    test.eq(1, timings.runs_since_failure('a.lp::t3'))
+    test.eq(['t4', 't3', 't2', 't5', 't1'], [u.name for u in order_units(units, timings)])
+    timings.record('a.lp::t3', 2.0)
+    timings.record('a.lp::t3', 2.0)
+    test.eq(None, timings.runs_since_failure('a.lp::t3'))
+    test.eq(['t4', 't2', 't3', 't5', 't1'], [u.name for u in order_units(units, timings)])
+    timings.save()
+    test.eq(0, Timings(timings.path).runs_since_failure('a.lp::t4'))
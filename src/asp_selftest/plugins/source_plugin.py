@@ -1,9 +1,9 @@
 
+import os
 import tempfile
-import pathlib
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 from .misc import write_tempfile
 
@@ -52,12 +52,12 @@ def source_plugin_basics():
     test.eq('fortytwo', trace[1])
     filename = trace[0][1]
     test.endswith(filename, "-my-logic.lp")
-    test.truth(pathlib.Path(filename).exists())
+    test.truth(os.path.exists(filename))
     test.eq("one(1).", open(filename).read())
     test.eq(2, len(trace))
 
     main()
-    test.comp.truth(pathlib.Path(filename).exists())
+    test.comp.truth(os.path.exists(filename))
     test.eq('next_main', trace[2])
     test.eq(3, len(trace))
 
@@ -1,36 +1,37 @@
 import os
-import subprocess
 import tempfile
-import pathlib
 
-from .misc import write_tempfile
+from .misc import spool_stdin, spool_dir
 
-import selftest
-test = selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
 
 def stdin_to_tempfile_plugin(next, files=(), **etc):
-    """ Writes stdin to a temporary file so it can be read by multiple plugins """
+    """ Spools stdin to a temporary file so it can be read by multiple plugins, for this session only. """
 
     stdinput_file = None
 
     if not files:
-        stdinput = open(os.dup(0)).read()
-        stdinput_file = write_tempfile('-stdin.lp', stdinput)
+        stdinput_file = spool_stdin()
         files = [stdinput_file.name]
 
-    logger, _main = next(files=files, **etc)
+    logger, _main = next(files=files, stdin_spool=stdinput_file, **etc)
 
     def main():
-        stdinput_file   # keep save from GC
-        return _main()
+        try:
+            return _main()
+        finally:
+            if stdinput_file:
+                stdinput_file.close()
 
     return logger, main
 
 
 def run_test():
     # NB: runs in another process!
-    def next_plugin(files=(), **etc):
+    def next_plugin(files=(), stdin_spool=None, **etc):
+        assert stdin_spool.name == files[0]
         def main():
             data = open(files[0]).read()
             return files, data
@@ -41,11 +42,14 @@ def run_test():
     for f in files:
         print(f)
     print(data)
+    print(os.path.exists(files[0]))  # gone with the session
 
 
 @test
 def turn_stdin_into_tempfile():
     # test in another process since we cannot mock stdin when read from Clingo's C++ runtime
+    import pathlib
+    import subprocess
     path = pathlib.Path(__file__).parent
     p = subprocess.run(
         ["python", "-c", f"from asp_selftest.plugins.stdin_to_tempfile_plugin import run_test; run_test()"],
@@ -54,8 +58,9 @@ def turn_stdin_into_tempfile():
         capture_output=True)
     test.eq(b'', p.stderr)
     output_lines = p.stdout.splitlines()
-    test.startswith(output_lines[0], tempfile.gettempdir().encode())
+    test.startswith(output_lines[0], (spool_dir() or tempfile.gettempdir()).encode())
     test.endswith(output_lines[0], b"-stdin.lp")
     test.eq(b"asp. is. nice.", output_lines[1])
-    test.eq(2, len(output_lines))
+    test.eq(b"False", output_lines[2])
+    test.eq(3, len(output_lines))
 
@@ -0,0 +1,268 @@
+""" Loads facts from tabular files (CSV, TSV, JSONL) or from arrays (NumPy or
+    sequences) directly into the Backend, bypassing the text parser.
+"""
+
+import os
+import json
+import weakref
+import collections
+import clingo
+
+from .misc import write_file, batched, list_symbols
+from .compression import open_source, compression_of
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+BATCH_SIZE = 10000
+
+
+def to_number(value):
+    if isinstance(value, (float, bool)):
+        raise ValueError(f"not an integer: {value!r}")
+    return clingo.Number(int(value))
+
+
+CONVERTERS = {
+    'number':   to_number,
+    'string':   lambda v: clingo.String(str(v)),
+    'constant': lambda v: clingo.Function(str(v)),
+    'term':     lambda v: clingo.parse_term(str(v)),
+}
+
+
+class Table(collections.namedtuple('Table', ['predicate', 'file', 'columns', 'format', 'header'],
+                                   defaults=(None, False))):
+    """ Declares that rows of file become facts predicate(col0, ..., colN).
+        columns: sequence of (column, type); column is an index, or a name for JSONL and
+                 CSV/TSV with header; type is one of CONVERTERS.
+        format:  'csv', 'tsv' or 'jsonl'; by default derived from the file name.
+    """
+
+
+def table_format(table):
+    if table.format:
+        return table.format
+    name = table.file
+    if suffix := compression_of(name):
+        name = name.removesuffix(suffix)
+    return os.path.splitext(name)[1][1:].lower()
+
+
+def read_rows(table):
+    """ Yields rows of table.file as sequences (CSV/TSV) or dicts (JSONL, CSV/TSV with header). """
+    fmt = table_format(table)
+    if fmt not in ('csv', 'tsv', 'jsonl'):
+        raise ValueError(f"Unknown table format {fmt!r} for {table.file}.")
+    with open_source(table.file) as f:
+        if fmt == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            import csv
+            delimiter = '\t' if fmt == 'tsv' else ','
+            reader = csv.DictReader(f, delimiter=delimiter) if table.header else csv.reader(f, delimiter=delimiter)
+            yield from reader
+
+
+def table_symbols(table):
+    """ Yields a symbol for every row in table. """
+    getters = [(column, CONVERTERS[type]) for column, type in table.columns]
+    for lineno, row in enumerate(read_rows(table), 1):
+        try:
+            yield clingo.Function(table.predicate, [convert(row[column]) for column, convert in getters])
+        except (LookupError, ValueError, RuntimeError) as e:
+            raise ValueError(f"{table.file}, row {lineno}: {e!r}") from e
+
+
+def array_symbols(signature, rows, batch_size=BATCH_SIZE):
+    """ Yields a symbol name(col0, ..., colN) for every row in rows, given signature 'name/N'.
+        Rows is a 2-D array (1-D for arity 1); integers become numbers, symbols are kept
+        and anything else but floats and booleans becomes an interned string.
+    """
+    name, arity = signature.rsplit('/', 1)
+    arity = int(arity)
+    interned = {}
+    def convert(value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return clingo.Number(value)
+        if isinstance(value, clingo.Symbol):
+            return value
+        if isinstance(value, (float, bool)):
+            raise TypeError(f"{signature}: {type(value).__name__}s are not supported: {value!r}")
+        if (symbol := interned.get(value)) is None:
+            symbol = interned[value] = clingo.String(str(value))
+        return symbol
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if hasattr(batch, 'tolist'):
+            batch = batch.tolist()  # numpy: converts the whole batch at once
+        for n, row in enumerate(batch, start + 1):
+            if arity == 1 and not isinstance(row, (list, tuple)):
+                row = (row,)
+            if len(row) != arity:
+                raise ValueError(f"{signature}: row {n} has {len(row)} columns: {row!r}")
+            yield clingo.Function(name, [convert(v) for v in row])
+
+
+def add_facts(control, symbols, batch_size=BATCH_SIZE):
+    """ Adds symbols as facts through the backend, in batches. """
+    for batch in batched(symbols, batch_size):
+        with control.backend() as backend:
+            for symbol in batch:
+                backend.add_rule([backend.add_atom(symbol)])
+
+
+def table_loader_plugin(next, tables=(), facts=None, batch_size=BATCH_SIZE, **etc):
+    """ Adds facts from tables and from facts, a mapping of signature to array, to controls
+        grounding base, like the facts of the files. Tests not depending on base do not see them.
+    """
+
+    logger, _load, _ground, solve = next(**etc)
+    loaded = weakref.WeakKeyDictionary()  # controls still to get the facts
+
+    def load(control, files):
+        _load(control, files)
+        if tables or facts:
+            loaded[control] = True
+
+    def ground(control, parts=(('base', ()),), context=None):
+        if loaded.pop(control, False) and any(name == 'base' for name, _ in parts):
+            for table in tables:
+                add_facts(control, table_symbols(table), batch_size)
+            for signature, rows in (facts or {}).items():
+                add_facts(control, array_symbols(signature, rows, batch_size), batch_size)
+        _ground(control, parts=parts, context=context)
+
+    return logger, load, ground, solve
+
+
+@test
+def table_formats():
+    test.eq('csv', table_format(Table('p', 'a.csv', ())))
+    test.eq('tsv', table_format(Table('p', 'a.TSV', ())))
+    test.eq('jsonl', table_format(Table('p', 'a.jsonl.gz', ())))
+    test.eq('csv', table_format(Table('p', 'a.txt', (), 'csv')))
+
+
+@test
+def read_csv_tsv_jsonl(tmp_path):
+    csv_file = write_file(tmp_path/'e.csv', 'a,1,x y\nb,2,"z,w"\n')
+    test.eq(['edge(a,1,"x y")', 'edge(b,2,"z,w")'], [str(s) for s in table_symbols(
+        Table('edge', csv_file, ((0, 'constant'), (1, 'number'), (2, 'string'))))])
+    tsv_file = write_file(tmp_path/'e.tsv', 'from\tto\nf(1)\t3\n')
+    test.eq(['edge(3,f(1))'], [str(s) for s in table_symbols(
+        Table('edge', tsv_file, (('to', 'number'), ('from', 'term')), header=True))])
+    jsonl_file = write_file(tmp_path/'e.jsonl', '{"n": 1, "s": "een"}\n\n{"n": 2, "s": "twee"}\n')
+    test.eq(['name(1,"een")', 'name(2,"twee")'], [str(s) for s in table_symbols(
+        Table('name', jsonl_file, (('n', 'number'), ('s', 'string'))))])
+
+
+@test
+def report_bad_rows(tmp_path):
+    csv_file = write_file(tmp_path/'e.csv', '1\nx\n')
+    with test.raises(ValueError) as e:
+        list(table_symbols(Table('p', csv_file, ((0, 'number'),))))
+    test.startswith(str(e.exception), f"{csv_file}, row 2: ValueError(")
+    jsonl_file = write_file(tmp_path/'e.jsonl', '{"n": 1}\n{"n": 1.5}\n')
+    with test.raises(ValueError, f"{jsonl_file}, row 2: ValueError('not an integer: 1.5')"):
+        list(table_symbols(Table('p', jsonl_file, (('n', 'number'),))))
+    jsonl_file = write_file(tmp_path/'b.jsonl', '{"n": true}\n')
+    with test.raises(ValueError, f"{jsonl_file}, row 1: ValueError('not an integer: True')"):
+        list(table_symbols(Table('p', jsonl_file, (('n', 'number'),))))
+    with test.raises(ValueError, f"Unknown table format 'txt' for {csv_file[:-3]}txt."):
+        list(table_symbols(Table('p', csv_file[:-3] + 'txt', ())))
+
+
+@test
+def load_tables_through_backend(tmp_path):
+    csv_file = write_file(tmp_path/'e.csv', '\n'.join(f"{i},{i+1}" for i in range(25)))
+    code = write_file(tmp_path/'code.lp', 'node(X) :- edge(X, _). node(Y) :- edge(_, Y).')
+    def next_plugin(**etc):
+        def load(control, files):
+            for f in files:
+                control.load(f)
+        def ground(control, parts, context):
+            control.ground(parts, context=context)
+        return None, load, ground, None
+    _, load, ground, _ = table_loader_plugin(
+        next_plugin, tables=[Table('edge', csv_file, ((0, 'number'), (1, 'number')))], batch_size=10)
+    control = clingo.Control()
+    load(control, (code,))
+    ground(control)
+    symbols = list_symbols(control)
+    test.eq(25, sum(1 for s in symbols if s.startswith('edge(')))
+    test.eq(26, sum(1 for s in symbols if s.startswith('node(')))
+    isolated = clingo.Control()
+    load(isolated, (code,))
+    ground(isolated, parts=[('test_x', ())])  # a test not depending on base
+    test.eq([], list_symbols(isolated))
+
+
+@test
+def symbols_from_sequences():
+    test.eq(['edge(1,2)', 'edge(2,3)'], [str(s) for s in array_symbols('edge/2', [(1, 2), [2, 3]], batch_size=1)])
+    test.eq(['node("a")', 'node(1)', 'node(b)'],
+            [str(s) for s in array_symbols('node/1', ['a', 1, clingo.Function('b')])])
+    with test.raises(ValueError, "edge/2: row 2 has 1 columns: (3,)"):
+        list(array_symbols('edge/2', [(1, 2), (3,)]))
+    with test.raises(TypeError, "p/1: floats are not supported: 1.5"):
+        list(array_symbols('p/1', [1.5]))
+    with test.raises(TypeError, "p/1: bools are not supported: True"):
+        list(array_symbols('p/1', [True]))
+
+
+@test
+def intern_strings():
+    a, b = array_symbols('p/1', ['x', 'x'])
+    test.eq(a, b)
+
+
+@test
+def symbols_from_numpy_arrays():
+    try:
+        import numpy
+    except ImportError:  # optional dependency
+        return
+    edges = numpy.arange(10, dtype=numpy.int64).reshape(5, 2)
+    test.eq(['e(0,1)', 'e(2,3)', 'e(4,5)', 'e(6,7)', 'e(8,9)'], [str(s) for s in array_symbols('e/2', edges, 2)])
+    names = numpy.array(['een', 'twee'])
+    test.eq(['n("een")', 'n("twee")'], [str(s) for s in array_symbols('n/1', names)])
+
+
+@test
+def load_arrays_through_backend():
+    def next_plugin(**etc):
+        def load(control, files):
+            control.add('node(X) :- edge(X, _).')
+        def ground(control, parts, context):
+            control.ground(parts, context=context)
+        return None, load, ground, None
+    _, load, ground, _ = table_loader_plugin(next_plugin, facts={'edge/2': [(1, 2), (2, 3)], 'label/1': ['x']})
+    control = clingo.Control()
+    load(control, ())
+    ground(control)
+    test.eq(['edge(1,2)', 'edge(2,3)', 'label("x")', 'node(1)', 'node(2)'], sorted(list_symbols(control)))
+
+
+@test
+def forget_collected_controls():
+    def next_plugin(**etc):
+        def load(control, files):
+            pass
+        def ground(control, parts, context):
+            control.ground(parts, context=context)
+        return None, load, ground, None
+    _, load, ground, _ = table_loader_plugin(next_plugin, facts={'label/1': ['x']})
+    control = clingo.Control()
+    load(control, ())
+    old = id(control)
+    del control
+    for _ in range(100):  # a new Control may well get the same id
+        control = clingo.Control()
+        if id(control) == old:
+            break
+    ground(control)
+    test.eq([], list_symbols(control))
@@ -4,12 +4,18 @@ import tempfile
 import timeit
 import collections
 import itertools
+import functools
 import clingo.ast
 
-import selftest
-test =  selftest.get_tester(__name__)
+from ..testing import get_tester
+test = get_tester(__name__)
 
-from .misc import NA, write_file, format_symbols
+from .misc import NA, write_file, format_symbols, spool_stdin
+from .compression import decompressed, original_name
+from .failurereport import ModelReport, MODEL_LIMIT, summarize_failures
+from .python_profile import profile_phase, profiling
+from .parallel import Unit, run_units
+from .tracing import trace_span
 
 
 class ConstraintError(Exception):
@@ -26,7 +32,7 @@ def gather_tests(files, logger):
     all_tests = collections.defaultdict(dict)
 
     def _filter_program(ast):
-        filename = ast.location.begin.filename
+        filename = original_name(ast.location.begin.filename)
         tests = all_tests[filename]
         if program := is_testprogram(ast):
             name, dependencies = program
@@ -38,71 +44,214 @@ def gather_tests(files, logger):
         if code != clingo.MessageCode.FileIncluded:
             logger(code, message)
 
-    clingo.ast.parse_files(files, callback=_filter_program, logger=_logger)
+    with decompressed(files) as sources:
+        clingo.ast.parse_files(sources, callback=_filter_program, logger=_logger)
     return reversed(all_tests.items())
 
 
-def prepare_test_files(files):
-    """Prepare test files, reading from stdin if no files are provided."""
+def file_stamps(filenames):
+    """ Modification time and size per file; None when a file is gone. """
+    stamps = []
+    for name in filenames:
+        try:
+            stat = os.stat(name)
+        except OSError:
+            return None
+        stamps.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+class DiscoveryCache:
+    """ Tests found in a list of files, valid while none of the files parsed, the
+        included ones too, changed. Meant for long running processes (--serve).
+        Entries found since the last call of take_added() can be passed to another
+        process, which merges them with update().
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.added = {}
+        self.hits = 0
+
+    def gather_tests(self, files, logger):
+        key = tuple(files)
+        if (entry := self.entries.get(key)) and file_stamps(s[0] for s in entry[0]) == entry[0]:
+            self.hits += 1
+            return entry[1]
+        all_tests = list(gather_tests(files, logger))
+        if not any(f.endswith('-stdin.lp') for f in files):  # spooled stdin is never read again
+            if stamps := file_stamps(dict.fromkeys([*files, *(f for f, _ in all_tests)])):
+                self.entries[key] = self.added[key] = (stamps, all_tests)
+        return all_tests
+
+    def take_added(self):
+        added, self.added = self.added, {}
+        return added
+
+    def update(self, entries):
+        self.entries.update(entries)
+
+
+class TestResult:
+    """ Outcome of one test, as given to on_test. Status is 'passed', 'failed' when
+        cannots hold (see failures) or 'error' for any other exception (see error).
+        Statistics are those of Clingo, when the test was solved.
+    """
+
+    def __init__(self, name, filename, lineno):
+        self.name = name
+        self.filename = filename
+        self.lineno = lineno
+        self.status = 'passed'
+        self.failures = []
+        self.error = None
+        self.seconds = 0.0
+        self.statistics = None
+
+    def fail(self, error):
+        self.status = 'failed' if isinstance(error, ConstraintError) else 'error'
+        self.failures = getattr(error, 'failures', [])
+        self.error = error
+
+    def portable(self):
+        """ A copy that can be pickled, for results from forked workers: failures become
+            strings and the error one of the same kind, with the same message and notes.
+        """
+        copy = TestResult(self.name, self.filename, self.lineno)
+        copy.__dict__.update(self.__dict__, failures=[str(f) for f in self.failures])
+        if isinstance(self.error, ConstraintError):
+            copy.error = ConstraintError(str(self.error))
+            copy.error.failures = copy.failures
+        elif self.error:
+            import pickle
+            try:
+                pickle.dumps(self.error)
+                return copy
+            except Exception:
+                copy.error = RuntimeError(f"{type(self.error).__name__}: {self.error}")
+        if self.error:
+            copy.error.__notes__ = [str(note) for note in getattr(self.error, '__notes__', ())]
+        return copy
+
+    def __repr__(self):
+        return f"TestResult({self.name!r}, {self.filename!r}, {self.lineno!r}, {self.status!r}, {self.seconds:.3f})"
+
+
+def prepare_test_files(files, stdin_spool):
+    """Prepare test files, using the spooled stdin if no files are provided."""
     if not files:
-        with open(os.dup(0)) as f:  # read from stdin without removing the data
-            asp_code = f.read()
-        with tempfile.NamedTemporaryFile('w', suffix='-stdin.lp') as stdin_data:
-            print(asp_code, file=stdin_data, flush=True)
-            return [stdin_data.name]
+        return [stdin_spool.name]
     return files
 
 
-def check_model(model, errornote):
+def check_model(model, errornote, files=(), model_limit=MODEL_LIMIT):
     by_signature = model.context.symbolic_atoms.by_signature
     cannots = (s for n in [1, 2] for s in by_signature('cannot', n))
-    if failures := [s for s in cannots if model.is_true(s.literal)]: # TODO find test for is_true!
-        e = ConstraintError(', '.join(str(f.symbol) for f in failures))
+    if failures := [s.symbol for s in cannots if model.is_true(s.literal)]: # TODO find test for is_true!
+        e = ConstraintError(summarize_failures(failures))
+        e.failures = failures
         e.add_note(f"{errornote}. Model follows.")
-        symbols = '\n'.join(
-                str(s) for s in model.symbols(shown=True)
-                if s.name != 'cannot' and not s.name.startswith('_'))
-        e.add_note(symbols or '<empty model>')
+        e.model = ModelReport(model.symbols(shown=True), failures, files, model_limit)
+        e.__notes__.append(e.model)  # rendered when shown
         raise e
 
 
-def testrunner_plugin(next, run_tests=True, logger=None, arguments=(), context=None, **etc):
-    """ Runs all tests in every file separately, during loading. """
+def testrunner_plugin(next, run_tests=True, logger=None, arguments=(), context=None, model_limit=MODEL_LIMIT, fact_files=(), ground_cache=None, discovery_cache=None, jobs=1, on_test=None, keep_going=False, quiet=False, schedule=None, stdin_spool=None, **etc):
+    """ Runs all tests in every file separately, during loading. Fact files contain no tests and are not parsed.
+        With a GroundCache, tests whose ground program passed before are not solved again.
+        With a DiscoveryCache, files that did not change are not parsed again to find tests.
+        With jobs > 1, tests run concurrently, see parallel.py.
+        With on_test, each test is also reported as a TestResult, failed ones too. With keep_going,
+        failing tests do not stop the others; the first failure is raised after all tests ran.
+        With quiet, nothing is printed. With schedule, only the tests (Units) it returns run, started in
+        the order it returns them; they are reported in their usual order.
+    """
 
     next_logger, _load, ground, solve = next(
         logger=logger,
         arguments=arguments,
         context=context,
+        fact_files=fact_files,
         **etc)
 
+    facts = {os.path.realpath(f) for f in fact_files}
+
     new_args=list(itertools.dropwhile(lambda p: not p.startswith('--'), arguments))
 
     def load(control, files):
-        files = prepare_test_files(files)
+        nonlocal stdin_spool
+        if not files and not stdin_spool:
+            stdin_spool = spool_stdin()  # kept for this session
+        files = prepare_test_files(files, stdin_spool)
 
         def verify_cannots(filenames, fulltestname, parts, lineno):
-            sub_logger, sub_load, sub_ground, sub_solve = next(logger=logger, arguments=new_args, context=context, **etc)
+            sub_logger, sub_load, sub_ground, sub_solve = next(logger=logger, arguments=new_args, context=context, fact_files=fact_files, **etc)
             sub_control = clingo.Control(arguments=new_args, logger=logger)
-            print(" ", fulltestname, end='', flush=True)
+            hasher = ground_cache.observe(sub_control) if ground_cache else None
+            result = TestResult(fulltestname, ','.join(filenames), lineno)
+            start = timeit.default_timer()
             try:
-                sub_load(sub_control, files=filenames)
-                sub_ground(sub_control, parts=parts, context=context)
-                with sub_solve(sub_control, yield_=True) as models:
-                    for model in models:
-                        errornote = f"File {','.join(filenames)}, line {lineno}, in {fulltestname}"
-                        check_model(model, errornote)
+                with profile_phase('test', parts[0][0]), trace_span(fulltestname, 'test', file=','.join(filenames)):
+                    sub_load(sub_control, files=filenames)
+                    sub_ground(sub_control, parts=parts, context=context)
+                    if hasher:
+                        fingerprint = hasher.fingerprint(new_args, sub_control.symbolic_atoms)
+                        if not ground_cache.claim(fingerprint):
+                            return result
+                    try:
+                        with sub_solve(sub_control, yield_=True) as models:
+                            for model in models:
+                                errornote = f"File {','.join(filenames)}, line {lineno}, in {fulltestname}"
+                                check_model(model, errornote, filenames, model_limit)
+                        if hasher:
+                            ground_cache.add(fingerprint)
+                    finally:
+                        if hasher:
+                            ground_cache.release(fingerprint)
+                    if on_test:
+                        result.statistics = sub_control.statistics
+            except Exception as e:
+                result.fail(e)
             finally:
-                print(flush=True)
-            
-        for filename, tests in gather_tests(files, logger):
-            print("Testing", 'stdin' if filename.endswith('-stdin.lp') else filename)
+                result.seconds = timeit.default_timer() - start
+            return result
+
+        def unit(filenames, fulltestname, parts, lineno):
+            return Unit(fulltestname, filenames, functools.partial(verify_cannots, filenames, fulltestname, parts, lineno), lineno)
+
+        failed = []
+        def done(unit, result):
+            if on_test:
+                on_test(result)
+            if result.error:
+                if not keep_going:
+                    raise result.error
+                failed.append(result)
+
+        sources = [f for f in files if os.path.realpath(f) not in facts]
+        with profile_phase('discovery'), trace_span('discovery'):
+            find = discovery_cache.gather_tests if discovery_cache else gather_tests
+            all_tests = list(find(sources, logger)) if sources else ()
+        plan = []
+        for filename, tests in all_tests:
+            plan.append(f"Testing {'stdin' if filename.endswith('-stdin.lp') else filename}")
             for testname, (dependencies, lineno) in tests.items():
                 parts = [(testname, [NA for _ in dependencies]), *((d, []) for d in dependencies)]
                 fulltestname = f"{testname}({', '.join(dependencies)})"
-                verify_cannots((filename,), fulltestname, parts, lineno)
+                plan.append(unit((filename,), fulltestname, parts, lineno))
+
+        plan.append("Testing base")
+        plan.append(unit(files, 'base', (('base', ()),), '?')) # TODO locate failing cannot: file/lineno??
+        order = None
+        if schedule:
+            order = list(schedule([item for item in plan if isinstance(item, Unit)]))
+            chosen = set(order)
+            plan = [item for item in plan if not isinstance(item, Unit) or item in chosen]
+            plan = [item for item, after in zip(plan, plan[1:] + [None]) if isinstance(item, Unit) or isinstance(after, Unit)]
 
-        print("Testing base")
-        verify_cannots(files, 'base', (('base', ()),), '?') # TODO locate failing cannot: file/lineno??
+        run_units(plan, 1 if profiling() else jobs, done, quiet, order, stop=lambda result: result.error and not keep_going)
+        if failed:
+            raise failed[0].error
 
         _load(control, files)
 
@@ -232,7 +381,7 @@ def use_arguments_for_testing(stdout):
         asp_program,
         arguments=['--const', 'a=42'],
         trace=trace.append)
-    test.eq({'logger': None, 'arguments': ['--const', 'a=42'], 'context': None}, trace[0])
+    test.eq({'logger': None, 'arguments': ['--const', 'a=42'], 'context': None, 'fact_files': ()}, trace[0])
     with test.raises(ConstraintError, "cannot(99)"):
         parse_and_run_tests(
             asp_program,
@@ -291,7 +440,7 @@ def format_empty_model(stderr, stdout):
     notes = e.exception.__notes__
     test.startswith(notes[0], "File ")
     test.endswith(notes[0], ", line 2, in test_model_formatting(). Model follows.")
-    test.eq(notes[1], "<empty model>")
+    test.eq(str(notes[1]), "<empty model>")
 
 
 @test
@@ -306,7 +455,7 @@ def format_model_small(stderr, stdout):
     notes = e.exception.__notes__
     test.startswith(notes[0], "File ")
     test.endswith(notes[0], ", line 2, in test_model_formatting(). Model follows.")
-    test.eq(notes[1], """this_is_a_fact(1)\nthis_is_a_fact(2)""")
+    test.eq(str(notes[1]), """this_is_a_fact(1)\nthis_is_a_fact(2)""")
 
 
 @test
@@ -321,7 +470,23 @@ def format_model_wide(stderr, stdout):
     notes = e.exception.__notes__
     test.startswith(notes[0], "File ")
     test.endswith(notes[0], ", line 2, in test_model_formatting(). Model follows.")
-    test.eq(notes[1], """this_is_a_fact(1)\nthis_is_a_fact(2)\nthis_is_a_fact(3)""")
+    test.eq(str(notes[1]), """this_is_a_fact(1)\nthis_is_a_fact(2)\nthis_is_a_fact(3)""")
+
+
+@test
+def format_model_huge(stderr, stdout):
+    with test.raises(ConstraintError) as e:
+        parse_and_run_tests("""
+            #program test_model_formatting.
+            noise(1..3).
+            this_is_a_fact(1..3).
+            #external what.
+            cannot(test) :- not what, this_is_a_fact(2).
+        """, model_limit=2)
+    notes = e.exception.__notes__
+    test.endswith(notes[0], ", line 2, in test_model_formatting(). Model follows.")
+    test.startswith(str(notes[1]), "this_is_a_fact(1)\nthis_is_a_fact(2)\n<2 relevant atoms shown, 1 more hidden; full model in ")
+    test.eq(6, len(list(e.exception.model.atoms())))
 
 
 @test
@@ -376,6 +541,15 @@ def cannot_with_more_args():
         parse_and_run_tests(code, run_tests=True)
 
 
+@test
+def cannot_with_many_failures():
+    code = 'p(1..100).  cannot("message:", A)  :-  p(A).'
+    with test.raises(ConstraintError) as e:
+        parse_and_run_tests(code, run_tests=True)
+    test.startswith(str(e.exception), 'cannot("message:",_) 100 times, e.g. 1, 2, 3, ..., all 100 failures in ')
+    test.eq(100, len(e.exception.failures))
+
+
 @test
 def test_aspif_generation(tmp_path):
     asp_program = 'a. #program b. b1.'
@@ -440,3 +614,113 @@ def test_aspif_performance_gain(tmp_path):
     print("TIME:", t/n * 1000, 'ms')
         
         
+
+
+@test
+def skip_solving_passed_ground_programs(tmp_path, stdout, stderr):
+    from .groundcache import GroundCache
+    code = """#show cannot/1.
+        #program test_a(base). helper_a. cannot(a) :- not helper_a.
+        #program test_b(base). helper_b. cannot(b) :- not helper_b.
+    """
+    filename = (tmp_path/'passed').as_posix()
+    trace = []
+    def solves():
+        n = trace.count(True)
+        trace.clear()
+        return n
+    parse_and_run_tests(code, trace.append, ground_cache=GroundCache(filename))
+    test.eq(2, solves())  # test_b shares the solve of test_a
+    parse_and_run_tests(code, trace.append, ground_cache=GroundCache(filename))
+    test.eq(0, solves())
+    parse_and_run_tests(code, trace.append)
+    test.eq(3, solves())
+    failing = code + "#program test_c(base). cannot(c)."
+    for _ in range(2):
+        with test.raises(ConstraintError, "cannot(c)"):
+            parse_and_run_tests(failing, trace.append, ground_cache=GroundCache(filename))
+        test.eq(1, solves())
+    hidden = """#show.
+        #program test_a(base). d. helper(x) :- d.
+        #program test_b(base). d. cannot(x) :- d.
+    """
+    with test.raises(ConstraintError, "cannot(x)"):  # same structure, but the cannot is hidden
+        parse_and_run_tests(hidden, trace.append, ground_cache=GroundCache())
+
+
+@test
+def solve_same_ground_program_once_with_jobs(stdout, stderr):
+    from .groundcache import GroundCache
+    code = "#show cannot/1.\n" + ''.join(
+        f"#program test_{i}(base). helper_{i}. cannot({i}) :- not helper_{i}.\n" for i in range(8))
+    trace = []
+    parse_and_run_tests(code, trace.append, ground_cache=GroundCache(), jobs=4)
+    test.eq(2, trace.count(True))  # one for all tests, one for base
+
+
+@test
+def discovery_cache_follows_changes(tmp_path, stdout):
+    part = write_file(tmp_path/'part.lp', "#program test_a.")
+    main = write_file(tmp_path/'main.lp', f'#include "{part}". #program test_b.')
+    cache = DiscoveryCache()
+    found = cache.gather_tests([main], None)
+    test.eq([(part, {'test_a': ([], 1)}), (main, {'test_b': ([], 1)})], found)
+    test.eq(found, cache.gather_tests([main], None))
+    test.eq(1, cache.hits)
+    test.eq([(main,)], list(cache.take_added()))
+    test.eq({}, cache.take_added())
+    write_file(tmp_path/'part.lp', "#program test_c.  ")
+    test.eq({'test_c': ([], 1)}, cache.gather_tests([main], None)[0][1])
+    test.eq(1, cache.hits)
+    other = DiscoveryCache()
+    other.update(cache.take_added())
+    other.gather_tests([main], None)
+    test.eq(1, other.hits)
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), discovery_cache=other)
+    load(clingo.Control(), files=(main,))
+    test.eq(2, other.hits)
+    test.contains(stdout.getvalue(), "  test_c()\n")
+
+
+@test
+def run_tests_concurrently(tmp_path, stdout):
+    part = write_file(tmp_path/'part.lp', "p. #program test_p(base). cannot(p) :- not p.")
+    main = write_file(tmp_path/'main.lp', f'#include "{part}". a. #program test_a(base). cannot(a) :- not a.'
+                                          ' #program test_b(base). cannot("b fails").')
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), jobs=4)
+    with test.raises(ConstraintError, 'cannot("b fails")'):
+        load(clingo.Control(), files=(main,))
+    test.endswith(stdout.getvalue(), "  test_b(base)\n")  # reported as soon as it fails
+    stdout.truncate(0)
+    stdout.seek(0)
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), jobs=4, keep_going=True)
+    with test.raises(ConstraintError, 'cannot("b fails")'):
+        load(clingo.Control(), files=(main,))
+    test.eq(f"Testing {part}\n  test_p(base)\nTesting {main}\n  test_a(base)\n  test_b(base)\nTesting base\n  base\n",
+            stdout.getvalue())
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), jobs=4)
+    load(clingo.Control(), files=(part,))
+    test.endswith(stdout.getvalue(), f"Testing {part}\n  test_p(base)\nTesting base\n  base\n")
+
+
+@test
+def report_passed_tests(tmp_path, stdout):
+    main = write_file(tmp_path/'main.lp', 'a.\n#program test_a(base).\ncannot(a) :- not a.')
+    results = []
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), on_test=results.append)
+    load(clingo.Control(), files=(main,))
+    test_a, base = results
+    test.eq(('test_a(base)', main, 2), (test_a.name, test_a.filename, test_a.lineno))
+    test.eq(('base', main, '?'), (base.name, base.filename, base.lineno))
+    test.gt(test_a.seconds, 0)
+    test.startswith(repr(base), f"TestResult('base', '{main}', '?', 'passed', ")
+    test.eq(1, test_a.statistics['summary']['models']['enumerated'])
+
+
+@test
+def schedule_tests(tmp_path, stdout):
+    part = write_file(tmp_path/'part.lp', '#program test_p.')
+    main = write_file(tmp_path/'main.lp', f'#include "{part}".\n#program test_a.\n#program test_b.')
+    _, load, _, _ = testrunner_plugin(tracing_clingo_plugin(), schedule=lambda units: [u for u in units if u.name in ('test_b()', 'base')])
+    load(clingo.Control(), files=(main,))
+    test.eq(f"Testing {main}\n  test_b()\nTesting base\n  base\n", stdout.getvalue())
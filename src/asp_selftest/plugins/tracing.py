@@ -0,0 +1,266 @@
+""" Timeline of a run in Chrome trace event format, for chrome://tracing or ui.perfetto.dev.
+
+    While trace_file() is active, session2 wraps the functions every plugin
+    returns (load, ground, solve, main) and records each call as a span.
+    Tests and reify rounds add their own spans with trace_span(). Spans
+    carry process and thread ids, so parallel workers get their own rows;
+    forked workers send their spans back with each result, see
+    worker_events(). Solving with yield_=True happens while the models are
+    taken, so its span lasts until the handle is exhausted or closed.
+    When no trace is active, nothing is wrapped and trace_span() does nothing.
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+
+import clingo
+
+from ..testing import get_tester
+test = get_tester(__name__)
+
+
+class Tracer:
+
+    def __init__(self):
+        self.events = []
+        self.start = time.perf_counter_ns()
+
+    def now(self):
+        return (time.perf_counter_ns() - self.start) // 1000
+
+    def add(self, name, category, begin, end, args):
+        self.events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': begin, 'dur': end - begin,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            **({'args': args} if args else {})})
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+_tracer = None
+
+
+def tracing():
+    return _tracer is not None
+
+
+@contextlib.contextmanager
+def trace_span(name, category='asp', **args):
+    """ Records the enclosed code as one span, when a trace is active. """
+    if (tracer := _tracer) is None:
+        yield
+        return
+    begin = tracer.now()
+    try:
+        yield
+    finally:
+        tracer.add(name, category, begin, tracer.now(), args)
+
+
+@contextlib.contextmanager
+def trace_file(filename):
+    """ Records a trace of the enclosed code and writes it to filename. """
+    global _tracer
+    if not filename:
+        yield
+        return
+    tracer = _tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        _tracer = None
+        tracer.write(filename)
+
+
+@contextlib.contextmanager
+def worker_events():
+    """ In a forked worker, collects the events the enclosed code records into the
+        tracer inherited from the parent, to send them back with the result.
+    """
+    events = []
+    if (tracer := _tracer) is None:
+        yield events
+        return
+    begin = len(tracer.events)
+    try:
+        yield events
+    finally:
+        events.extend(tracer.events[begin:])
+        del tracer.events[begin:]
+
+
+def add_events(events):
+    """ Adds the events of a forked worker; they carry the pid of the worker. """
+    if (tracer := _tracer) is not None:
+        tracer.events.extend(events)
+
+
+class TracedHandle:
+    """ SolveHandle that calls end once it is exhausted or closed. """
+
+    def __init__(self, handle, end):
+        self._handle = handle
+        self._end = end
+
+    def _ended(self):
+        if end := self._end:
+            self._end = None
+            end()
+
+    def __getattr__(self, name):
+        return getattr(self._handle, name)
+
+    def __iter__(self):
+        yield from self._handle
+        self._ended()
+
+    def __enter__(self):
+        self._handle.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            return self._handle.__exit__(*exc)
+        finally:
+            self._ended()
+
+    def get(self):
+        try:
+            return self._handle.get()
+        finally:
+            self._ended()
+
+    def close(self):
+        try:
+            self._handle.close()
+        finally:
+            self._ended()
+
+
+def traced(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if (tracer := _tracer) is None:
+            return func(*args, **kwargs)
+        begin = tracer.now()
+        end = lambda: tracer.add(name, 'plugin', begin, tracer.now(), None)
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            end()
+            raise
+        if isinstance(result, (clingo.SolveHandle, TracedHandle)):
+            return TracedHandle(result, end)
+        end()
+        return result
+    wrapper.traced = True
+    return wrapper
+
+
+def trace_plugin(plugin_name, result):
+    """ Wraps the functions a plugin returns. The first of a tuple is the logger and is left
+        alone, as are functions passed on unchanged from the next plugin.
+    """
+    def wrap(f):
+        if callable(f) and not getattr(f, 'traced', False):
+            return traced(f"{plugin_name}.{getattr(f, '__name__', 'call')}", f)
+        return f
+    if isinstance(result, tuple):
+        return result[:1] + tuple(wrap(f) for f in result[1:])
+    return wrap(result)
+
+
+@test
+def no_spans_without_trace():
+    test.comp.truth(tracing())
+    with trace_span('nothing'):
+        pass
+
+
+@test
+def record_spans(tmp_path):
+    filename = (tmp_path/'trace.json').as_posix()
+    with trace_file(filename) as tracer:
+        test.truth(tracing())
+        with trace_span('outer', 'test', file='a.lp'):
+            with trace_span('inner'):
+                time.sleep(0.001)
+    test.comp.truth(tracing())
+    events = json.load(open(filename))['traceEvents']
+    inner, outer = events
+    test.eq('inner', inner['name'])
+    test.eq('asp', inner['cat'])
+    test.eq('X', inner['ph'])
+    test.eq({'file': 'a.lp'}, outer['args'])
+    test.eq(os.getpid(), outer['pid'])
+    test.eq(threading.get_ident(), outer['tid'])
+    test.ge(inner['ts'], outer['ts'])
+    test.ge(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+    test.ge(inner['dur'], 1000)
+
+
+@test
+def wrap_plugin_functions(tmp_path):
+    def logger(code, message):
+        pass
+    def load(control, files):
+        return files
+    def main():
+        return 42
+    with trace_file((tmp_path/'trace.json').as_posix()) as tracer:
+        l, ld = trace_plugin('my_plugin', (logger, load))
+        test.eq(logger, l)
+        test.eq(['a.lp'], ld(None, files=['a.lp']))
+        test.eq(42, trace_plugin('main_plugin', main)())
+        test.eq((None, 1), trace_plugin('x', (None, 1)))
+        _, ld2 = trace_plugin('other_plugin', (logger, ld))
+        test.eq(ld, ld2)
+    test.eq(['my_plugin.load', 'main_plugin.main'], [e['name'] for e in tracer.events])
+
+
+@test
+def solve_span_lasts_until_handle_is_closed(tmp_path):
+    def solve(control, yield_):
+        return control.solve(yield_=yield_)
+    _, inner = trace_plugin('inner', (None, solve))
+    def solve(control, yield_):
+        return inner(control, yield_=yield_)
+    control = clingo.Control(['0'])
+    control.add('a. b; c.')
+    control.ground()
+    with trace_file((tmp_path/'trace.json').as_posix()) as tracer:
+        _, outer = trace_plugin('outer', (None, solve))
+        with outer(control, yield_=True) as models:
+            time.sleep(0.002)
+            test.eq([], tracer.events)
+            test.eq(2, len([str(m) for m in models]))
+        test.eq(['inner.solve', 'outer.solve'], [e['name'] for e in tracer.events])
+        test.ge(tracer.events[0]['dur'], 2000)
+        test.ge(tracer.events[1]['dur'], tracer.events[0]['dur'])
+        result = outer(control, yield_=False)
+        test.truth(result.satisfiable)
+        test.eq(4, len(tracer.events))
+
+
+@test
+def collect_events_of_worker(tmp_path):
+    with worker_events() as events:
+        pass
+    test.eq([], events)
+    with trace_file((tmp_path/'trace.json').as_posix()) as tracer:
+        with trace_span('before fork'):
+            pass
+        with worker_events() as events:
+            with trace_span('in worker'):
+                pass
+        test.eq(['before fork'], [e['name'] for e in tracer.events])
+        test.eq(['in worker'], [e['name'] for e in events])
+        add_events(events)
+        test.eq(['before fork', 'in worker'], [e['name'] for e in tracer.events])
@@ -0,0 +1,114 @@
+""" Collects the tests in ASP files as pytest items.
+
+    Each #program test_* becomes an item named after the program, located at
+    the file and line of the program, plus an item 'base' per file that checks
+    the cannots of the file with what it includes. Tests are found in files
+    matching the asp_files ini option, or in all *.lp files with --asp. A test
+    in an included file is collected with that file, when it matches.
+
+    Items are plain pytest items, so -k, --lf/--ff and pytest-xdist work on
+    them as on any other test. pytest loads this plugin through its entry
+    point, or with -p asp_selftest.pytest_plugin.
+"""
+
+import os
+
+from .testing import defer, get_tester
+defer()  # loaded in every pytest run; the tests below run with alltests.py
+test = get_tester(__name__)
+
+import pytest
+
+
+_discovery = None
+
+
+def discovery_cache():
+    """ Parses each file once, for collecting and for running all of its tests. """
+    global _discovery
+    if _discovery is None:
+        from .plugins.testrunner_plugin import DiscoveryCache
+        _discovery = DiscoveryCache()
+    return _discovery
+
+
+def ignore(code, message):
+    pass  # reported when the test runs
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('asp-selftest')
+    group.addoption('--asp', action='store_true', help="collect tests from all *.lp files")
+    parser.addini('asp_files', type='args', default=[], help="glob patterns of ASP files to collect tests from")
+
+
+def pytest_collect_file(file_path, parent):
+    config = parent.config
+    patterns = config.getini('asp_files') or (['*.lp'] if config.getoption('asp') else [])
+    if any(file_path.match(pattern) for pattern in patterns):
+        return AspFile.from_parent(parent, path=file_path)
+
+
+class AspFile(pytest.File):
+
+    def collect(self):
+        filename = str(self.path)
+        for found, tests in discovery_cache().gather_tests([filename], ignore):
+            if os.path.realpath(found) == os.path.realpath(filename):
+                for name, (dependencies, lineno) in tests.items():
+                    yield AspItem.from_parent(self, name=name, fullname=f"{name}({', '.join(dependencies)})", lineno=lineno)
+        yield AspItem.from_parent(self, name='base', fullname='base', lineno=None)
+
+
+class AspItem(pytest.Item):
+    """ One test in an ASP file; runs it like clingo+ --run-asp-tests does. """
+
+    def __init__(self, *, fullname, lineno, **kwargs):
+        super().__init__(**kwargs)
+        self.fullname = fullname
+        self.lineno = lineno
+
+    def runtest(self):
+        from .integration import run_asp_tests
+        filename = str(self.path)
+        run_asp_tests(
+            files=(filename,),
+            keep_going=False,
+            discovery_cache=discovery_cache(),
+            schedule=lambda units: [u for u in units if (u.name, tuple(u.files)) == (self.fullname, (filename,))])
+
+    def repr_failure(self, excinfo):
+        from .plugins.testrunner_plugin import ConstraintError
+        if isinstance(excinfo.value, (ConstraintError, SyntaxError)):
+            e = excinfo.value
+            return '\n'.join([f"{type(e).__name__}: {e}", *map(str, getattr(e, '__notes__', ())), *filter(None, [getattr(e, 'text', None)])])
+        return super().repr_failure(excinfo)
+
+    def reportinfo(self):
+        return self.path, self.lineno - 1 if self.lineno else None, self.fullname
+
+
+@test
+def collect_and_run_asp_tests(tmp_path):
+    import sys
+    import subprocess
+    (tmp_path/'pytest.ini').write_text("[pytest]\nasp_files = *.lp\n")
+    (tmp_path/'part.lp').write_text('p.\n#program test_p(base).\ncannot("no p") :- not p.\n')
+    (tmp_path/'main.lp').write_text('#include "part.lp".\nq :- r.\n#program test_q(base).\n'
+                                    'cannot("no q") :- not q.\n#program test_r(base).\nr.\n')
+    (tmp_path/'notes.txt').write_text('#program test_n.')
+    def pytest(*args):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+        return subprocess.run([sys.executable, '-m', 'pytest', '-p', 'asp_selftest.pytest_plugin', '-p', 'no:randomly', *args],
+                              cwd=tmp_path, env=env, capture_output=True, text=True).stdout
+    out = pytest('--collect-only', '-q')
+    test.contains(out, "main.lp::test_q\nmain.lp::test_r\nmain.lp::base\npart.lp::test_p\npart.lp::base\n")
+    out = pytest('-rA')
+    test.contains(out, "PASSED main.lp::test_r\n")
+    test.contains(out, "PASSED part.lp::test_p\n")
+    test.contains(out, "FAILED main.lp::test_q - ConstraintError: cannot(\"no q\")")
+    test.contains(out, "1 failed, 4 passed")
+    test.contains(out, f"File {tmp_path}/main.lp, line 3, in test_q(base). Model follows.")
+    out = pytest('--lf', '-q', '-k', 'test_q or test_p')
+    test.contains(out, "1 failed")
+    test.comp.contains(out, "passed")
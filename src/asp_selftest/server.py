@@ -0,0 +1,341 @@
+""" A clingo+ that stays running, for editors and hooks that call it many times a minute.
+
+    `clingo+ --serve` imports everything once and listens on a Unix socket.
+    `clingo+client` (see __main__.py) sends its arguments, working directory, environment and
+    its stdin, stdout and stderr (as file descriptors) to it. The server
+    forks for each request, so the child writes straight to the client's
+    terminal and all state of a run, like the #script globals, caches and
+    stats, stays in the child. With --run-python-tests, the child starts a
+    new clingo+ instead, as the server imported everything without tests.
+
+    Tests found in unchanged files are kept in a DiscoveryCache: the child
+    sends what it found back to the server, which hands it to the next
+    children. Parsed programs are not kept: clingo ASTs cannot be sent back
+    to the server, so children parse for themselves.
+
+    As a client sends its environment and stdio, the socket is in a directory
+    that only its user can access, and both ends check the user of the other.
+"""
+
+import os
+import sys
+import json
+import stat
+import struct
+import socket
+import tempfile
+
+from .testing import get_tester
+test = get_tester(__name__)
+
+
+SOCKET_ENV = 'CLINGO_PLUS_SOCKET'
+STDIO = (0, 1, 2)
+FRESH_CLINGO_PLUS = [sys.executable, '-c', 'import sys; from asp_selftest.__main__ import clingo_plus; sys.exit(clingo_plus())']
+
+
+def socket_path(create=False):
+    """ $CLINGO_PLUS_SOCKET, or a socket in $XDG_RUNTIME_DIR, or else in a directory of our own
+        in the temporary directory, created when asked. Others could bind a socket in the
+        temporary directory itself first.
+    """
+    if path := os.environ.get(SOCKET_ENV):
+        return path
+    if runtime := os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(runtime, f'clingo+-{os.getuid()}.sock')
+    directory = os.path.join(tempfile.gettempdir(), f'clingo+-{os.getuid()}')
+    if create:
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(directory)  # FileNotFoundError when no server created it
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not a directory that only user {os.getuid()} can access.")
+    return os.path.join(directory, 'clingo+.sock')
+
+
+def peer_uid(connection):
+    """ The user of the process at the other end of connection; None when the platform does not tell. """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid
+
+
+def check_peer(connection):
+    if (uid := peer_uid(connection)) not in (None, os.getuid()):
+        raise PermissionError(f"clingo+ socket is used by user {uid}, not by {os.getuid()}.")
+
+
+def read_line(connection, data=b''):
+    while not data.endswith(b'\n'):
+        if not (chunk := connection.recv(1 << 16)):
+            raise ConnectionError("connection closed before end of message")
+        data += chunk
+    return json.loads(data)
+
+
+def request(path, argv, fds=STDIO, cwd=None, env=None):
+    """ Lets the server at path run clingo+ with argv; returns its exit code. """
+    with socket.socket(socket.AF_UNIX) as connection:
+        connection.connect(path)
+        check_peer(connection)  # before sending our environment
+        message = {'argv': list(argv), 'cwd': cwd or os.getcwd(), 'env': dict(os.environ if env is None else env)}
+        socket.send_fds(connection, [json.dumps(message).encode() + b'\n'], list(fds))
+        return read_line(connection)['exitcode']
+
+
+def run_request(message, fds, discovery_cache):
+    """ Runs in the child: makes the client's stdio ours and runs clingo+. """
+    for fd, target in zip(fds, STDIO):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False)
+    os.chdir(message['cwd'])
+    os.environ.clear()
+    os.environ.update(message['env'])
+    from .__main__ import run_plus
+    from .arguments import silent
+    args, argv = silent.parse_known_args(message['argv'])  # as maybe_silence_tester(), the tester is ours
+    try:
+        if args.run_python_tests:
+            # we imported all modules with their tests deferred: run them in a new process
+            os.execv(FRESH_CLINGO_PLUS[0], FRESH_CLINGO_PLUS + message['argv'])
+        run_plus(argv, discovery_cache=discovery_cache)
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        import ctypes
+        ctypes.CDLL(None).fflush(None)  # what Clingo wrote
+
+
+class Server:
+    """ Forks a child per request and answers with its exit code when it is done.
+        Everything a run needs is imported up front, once.
+    """
+
+    def __init__(self, path, discovery_cache=None):
+        from .plugins import import_all
+        from .plugins.script_cache_plugin import enable_python
+        from .plugins.testrunner_plugin import DiscoveryCache
+        from . import session2, arguments
+        import_all()
+        enable_python()
+        self.path = path
+        self.discovery_cache = DiscoveryCache() if discovery_cache is None else discovery_cache
+        self.listener = socket.socket(socket.AF_UNIX)
+        if os.path.exists(path):
+            try:
+                self.listener.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)  # left behind by a server that died
+            else:
+                self.listener.close()
+                raise FileExistsError(f"clingo+ already serving on {path}")
+        self.listener.bind(path)
+        self.listener.listen()
+        self.requests = 0
+
+    def start(self, connection):
+        import pickle
+        import signal
+        data, fds, _, _ = socket.recv_fds(connection, 1 << 16, len(STDIO))
+        message = read_line(connection, data)
+        results, child_end = os.pipe()
+        if (pid := os.fork()) == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(results)
+            self.listener.close()
+            connection.close()
+            self.discovery_cache.hits = 0
+            exitcode = run_request(message, fds, self.discovery_cache)
+            with open(child_end, 'wb') as f:
+                pickle.dump((self.discovery_cache.take_added(), self.discovery_cache.hits), f)
+            os._exit(exitcode)
+        os.close(child_end)
+        for fd in fds:
+            os.close(fd)
+        return pid, results
+
+    def finish(self, connection, pid, results):
+        """ Reads what the child found, waits for it and tells the client. """
+        import pickle
+        with open(results, 'rb') as f:
+            try:
+                added, hits = pickle.load(f)
+                self.discovery_cache.update(added)
+                self.discovery_cache.hits += hits
+            except EOFError:
+                pass  # child died
+        _, status = os.waitpid(pid, 0)
+        try:
+            connection.sendall(json.dumps({'exitcode': os.waitstatus_to_exitcode(status)}).encode() + b'\n')
+        except OSError:
+            pass  # client went away
+        connection.close()
+        self.requests += 1
+
+    def serve(self, max_requests=None):
+        """ Handles requests until interrupted, or until max_requests are done. """
+        import signal
+        import selectors
+        selector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        running = {}
+        try:
+            while max_requests is None or self.requests < max_requests:
+                for key, _ in selector.select():
+                    if key.fileobj is self.listener:
+                        connection, _ = self.listener.accept()
+                        try:
+                            check_peer(connection)
+                        except PermissionError as e:
+                            print(e, file=sys.stderr, flush=True)
+                            connection.close()
+                            continue
+                        pid, results = self.start(connection)
+                        running[results] = connection, pid
+                        selector.register(results, selectors.EVENT_READ)
+                        selector.register(connection, selectors.EVENT_READ, pid)
+                    elif key.data:  # client closed its end early: stop its child
+                        selector.unregister(key.fileobj)
+                        try:
+                            os.kill(key.data, signal.SIGTERM)
+                        except ProcessLookupError:
+                            pass
+                    else:  # child is done
+                        selector.unregister(key.fd)
+                        connection, pid = running.pop(key.fd)
+                        try:
+                            selector.unregister(connection)
+                        except KeyError:
+                            pass  # closed early
+                        self.finish(connection, pid, key.fd)
+        finally:
+            selector.close()
+            self.close()
+
+    def close(self):
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def serve(path=None):
+    """ Serves until interrupted. """
+    path = path or socket_path(create=True)
+    server = Server(path)
+    print(f"clingo+ serving on {path}", file=sys.stderr, flush=True)
+    import signal
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+@test
+def serve_requests(tmp_path):
+    import threading
+    program = tmp_path/'program.lp'
+    program.write_text("a. #program test_a(base). cannot(a) :- not a.")
+    path = (tmp_path/'clingo+.sock').as_posix()
+    exitcodes = []
+    def clients():
+        for i in (1, 2):
+            with open(tmp_path/f'out{i}', 'w') as out, open(tmp_path/f'err{i}', 'w') as err:
+                exitcodes.append(request(path, [program.as_posix(), '--run-asp-tests'], fds=(0, out.fileno(), err.fileno())))
+    server = Server(path)
+    thread = threading.Thread(target=clients)
+    thread.start()
+    server.serve(max_requests=2)  # forks from the main thread
+    thread.join()
+    test.eq([0, 0], exitcodes)
+    for i in (1, 2):
+        output = (tmp_path/f'out{i}').read_text()
+        test.startswith(output, "clingo+ version")
+        test.contains(output, "  test_a(base)\n")
+        test.contains(output, "\na\nSATISFIABLE\n")
+        test.eq('', (tmp_path/f'err{i}').read_text())
+    test.eq(2, server.requests)
+    test.eq(1, server.discovery_cache.hits)  # the second child used what the first found
+    test.comp.truth(os.path.exists(path))
+    with test.raises(FileNotFoundError):
+        request((tmp_path/'nothing.sock').as_posix(), [])
+
+
+@test
+def requests_use_client_environment_and_python_tests(tmp_path):
+    import threading
+    global FRESH_CLINGO_PLUS
+    program = tmp_path/'program.lp'
+    program.write_text("a. #program test_a(base). cannot(a) :- not a.")
+    path = (tmp_path/'clingo+.sock').as_posix()
+    env = dict(os.environ, XDG_CACHE_HOME=(tmp_path/'cache').as_posix())
+    exitcodes = []
+    def clients():
+        for i, argv in ((1, ['--run-asp-tests', '--ground-cache']), (2, ['--run-python-tests'])):
+            with open(tmp_path/f'out{i}', 'w') as out:
+                exitcodes.append(request(path, [program.as_posix(), *argv], fds=(0, out.fileno(), 2), env=env))
+    fresh = FRESH_CLINGO_PLUS
+    FRESH_CLINGO_PLUS = [sys.executable, '-c', 'import sys; print("fresh", sys.argv[1:])']
+    try:
+        server = Server(path)
+        thread = threading.Thread(target=clients)
+        thread.start()
+        server.serve(max_requests=2)
+        thread.join()
+    finally:
+        FRESH_CLINGO_PLUS = fresh
+    test.eq([0, 0], exitcodes)
+    test.contains((tmp_path/'out1').read_text(), "  test_a(base)\n")
+    test.truth(os.path.exists(tmp_path/'cache/asp-selftest/passed-ground-programs'))
+    test.eq(f"fresh ['{program.as_posix()}', '--run-python-tests']\n", (tmp_path/'out2').read_text())
+
+
+@test
+def private_socket_directory(tmp_path):
+    saved = {k: os.environ.pop(k) for k in (SOCKET_ENV, 'XDG_RUNTIME_DIR') if k in os.environ}
+    tempdir, tempfile.tempdir = tempfile.tempdir, tmp_path.as_posix()
+    try:
+        directory = tmp_path/f'clingo+-{os.getuid()}'
+        with test.raises(FileNotFoundError):
+            socket_path()
+        test.eq((directory/'clingo+.sock').as_posix(), socket_path(create=True))
+        test.eq(0o700, stat.S_IMODE(os.stat(directory).st_mode))
+        test.eq((directory/'clingo+.sock').as_posix(), socket_path())
+        os.chmod(directory, 0o777)
+        with test.raises(PermissionError, f"{directory} is not a directory that only user {os.getuid()} can access."):
+            socket_path(create=True)
+        os.rmdir(directory)
+        os.symlink(tmp_path, directory)
+        with test.raises(PermissionError):
+            socket_path()
+        os.environ['XDG_RUNTIME_DIR'] = '/run/user/x'
+        test.eq(f'/run/user/x/clingo+-{os.getuid()}.sock', socket_path())
+        os.environ[SOCKET_ENV] = '/some/where.sock'
+        test.eq('/some/where.sock', socket_path())
+    finally:
+        tempfile.tempdir = tempdir
+        for k in (SOCKET_ENV, 'XDG_RUNTIME_DIR'):
+            os.environ.pop(k, None)
+        os.environ.update(saved)
+
+
+@test
+def check_user_of_peer():
+    a, b = socket.socketpair(socket.AF_UNIX)
+    with a, b:
+        test.eq(os.getuid() if hasattr(socket, 'SO_PEERCRED') else None, peer_uid(a))
+        check_peer(a)
@@ -9,22 +9,13 @@
 
 """
 
-import selftest
-test = selftest.get_tester(__name__)
+from .testing import get_tester
+test = get_tester(__name__)
 
 from .plugins.misc import write_file, ExitCode
+from .plugins.tracing import tracing, trace_plugin
 
-from .plugins import (
-    clingo_main_plugin,
-    source_plugin,
-    clingo_control_plugin,
-    clingo_syntaxerror_plugin,
-    clingo_sequencer_plugin,
-    clingo_defaults_plugin,
-    testrunner_plugin,
-    clingo_reify_plugin,
-    stdin_to_tempfile_plugin,
-)
+from . import plugins
 
 import clingo
 VERSION = '.'.join(map(str,clingo.version()))
@@ -37,7 +28,10 @@ def session2(plugins=(), **etc):
     def get_plugin_func(i):
         def get_plugin(**etc):
             assert i < len(plugins), f"No more plugins after '{plugins[-1].__name__}'"
-            return plugins[i](get_plugin_func(i+1), **etc)
+            result = plugins[i](get_plugin_func(i+1), **etc)
+            if tracing():
+                return trace_plugin(plugins[i].__name__, result)
+            return result
         return get_plugin
     return get_plugin_func(0)(**etc)()
 
@@ -77,26 +71,39 @@ def test_session2_sequencing():
 
    
 common_plugins = (
-    clingo_syntaxerror_plugin,
-    clingo_sequencer_plugin,
-    testrunner_plugin,
-    clingo_reify_plugin,
-    clingo_defaults_plugin,
+    'clingo_syntaxerror_plugin',
+    'script_cache_plugin',
+    'clingo_sequencer_plugin',
+    'testrunner_plugin',
+    'grounding_profile_plugin',
+    'clingo_reify_plugin',
+    'table_loader_plugin',
+    'fact_cache_plugin',
+    'compound_context_plugin',
+    'clingo_defaults_plugin',
 )
 
+
+def plugins_named(*names):
+    """ Plugins are named rather than imported here, so they load with the first session. """
+    return tuple(getattr(plugins, name) for name in names)
+
+
 def clingo_main_session(**kwargs):
     return session2(
-        plugins=(
-            clingo_main_plugin,
-            stdin_to_tempfile_plugin,
+        plugins=plugins_named(
+            'clingo_main_plugin',
+            'stdin_to_tempfile_plugin',
+            'model_writer_plugin',
             *common_plugins),
         **kwargs)
 
 def clingo_session(**kwargs):
     return session2(
-        plugins=(
-            source_plugin,
-            clingo_control_plugin,
+        plugins=plugins_named(
+            'source_plugin',
+            'include_path_plugin',
+            'clingo_control_plugin',
             *common_plugins),
         **kwargs)
 
@@ -128,6 +135,18 @@ def clingo_main_session_error(tmp_path, stdout, stderr):
     test.endswith(e.exception.text, "    1 error\n      ^ syntax error, unexpected EOF")
 
 
+@test
+def clingo_main_session_model_output(stdout, tmp_path):
+    import json
+    file1 = write_file(tmp_path/'file1.lp', '{a}.')
+    output = tmp_path/'models.ndjson'
+    exitcode = clingo_main_session(arguments=(file1, '0'), model_output=output.as_posix())
+    test.eq(exitcode, ExitCode.SAT | ExitCode.EXHAUST)
+    records = [json.loads(l) for l in output.open()]
+    test.eq([1, 2], [r['number'] for r in records])
+    test.eq([[], ['a']], sorted(r['symbols'] for r in records))
+
+
 @test
 def session_with_source(stderr):
     with test.raises(SyntaxError) as e:
@@ -153,3 +172,33 @@ def session_with_file(tmp_path, stdout):
     solveresult = clingo_session(files=(file1.as_posix(),))
     test.truth(solveresult.satisfiable)
     test.endswith(stdout.getvalue(), "test.lp\nTesting base\n  base\n")
+
+
+@test
+def session_with_cached_facts(tmp_path, stdout):
+    from .plugins.fact_cache_plugin import FactCache
+    facts = write_file(tmp_path/'facts.lp', 'edge(1,2). edge(2,3).')
+    logic = write_file(tmp_path/'logic.lp', 'node(X) :- edge(X, _). cannot("no node 2") :- not node(2).')
+    cache = tmp_path/'cache'
+    FactCache(cache, require_faster=False).lookup([facts])
+    solve_handle = clingo_session(files=(logic, facts), fact_files=(facts,), fact_cache_dir=cache, yield_=True)
+    with solve_handle as result:
+        for model in result:
+            test.eq('edge(1,2) edge(2,3) node(1) node(2)', str(model))
+    test.eq(f"Testing {logic}\nTesting base\n  base\n", stdout.getvalue())
+
+
+@test
+def session_with_trace(tmp_path, stdout):
+    import json
+    from .plugins.tracing import trace_file
+    filename = (tmp_path/'trace.json').as_posix()
+    with trace_file(filename):
+        clingo_session(source="a. #program test_a(base). cannot(a) :- not a.")
+    names = [e['name'] for e in json.load(open(filename))['traceEvents']]
+    test.contains(names, 'discovery')
+    test.contains(names, 'test_a(base)')
+    test.contains(names, 'base')
+    test.contains(names, 'reify round')
+    test.contains(names, 'clingo_defaults_plugin.solve')
+    test.eq('source_plugin.main', names[-1])
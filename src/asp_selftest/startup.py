@@ -0,0 +1,72 @@
+""" Startup time of clingo+, measured with python -X importtime.
+
+    Plugins are imported when a session is built, Python scripting is enabled
+    only when an input file may contain #script, and selftest is not imported
+    unless --run-python-tests is given. benchmark_startup() keeps an eye on it.
+"""
+
+import os
+import sys
+import tempfile
+import subprocess
+
+from .testing import get_tester
+test = get_tester(__name__)
+
+
+STARTUP_BUDGET = 150  # ms, imports only, for a trivial program
+
+
+def parse_importtime(text):
+    """ Returns {module: (self, cumulative)} in microseconds, and the total of the top level imports. """
+    modules = {}
+    total = 0
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(own), int(cumulative)
+        if not name.startswith('   '):  # nested imports are indented two more spaces
+            total += int(cumulative)
+    return modules, total
+
+
+def measure_startup(*arguments):
+    """ Runs clingo+ on a trivial program in a fresh Python and returns parse_importtime() of it. """
+    with tempfile.NamedTemporaryFile('w', suffix='.lp') as f:
+        f.write('a.')
+        f.flush()
+        code = "import sys; from asp_selftest.__main__ import clingo_plus; sys.argv[0] = 'clingo+'; clingo_plus()"
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, f.name, *arguments],
+                           capture_output=True, text=True, env=env)
+    return parse_importtime(p.stderr)
+
+
+def benchmark_startup(budget=STARTUP_BUDGET, top=15):
+    """ Import time of clingo+ (Python 3.11, clingo 5.8), 15 runs on a single core VM:
+            before pickle, inspect, subprocess and concurrent.futures were lazy:  85-110 ms
+            now:                                                                   64-88 ms
+        Other machines measured 109-118 ms before, hence the budget. About 20 ms is clingo itself.
+        Run with: python -c "from asp_selftest.startup import benchmark_startup as b; b()"
+    """
+    modules, total = measure_startup()
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda m: -m[1][0])[:top]:
+        print(f"{own/1000:8.1f} {cumulative/1000:8.1f} ms  {name}")
+    print(f"total: {total/1000:.1f} ms, budget: {budget} ms")
+    assert 'selftest' not in modules, "selftest imported"
+    assert total <= budget * 1000, f"startup {total/1000:.1f} ms exceeds budget of {budget} ms"
+    return total
+
+
+@test
+def parse_importtime_output():
+    modules, total = parse_importtime("""\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       300 |        400 | io
+import time:        50 |         50 | asp_selftest
+something else
+""")
+    test.eq({'_io': (100, 100), 'io': (300, 400), 'asp_selftest': (50, 50)}, modules)
+    test.eq(450, total)
@@ -0,0 +1,41 @@
+""" Defers importing selftest, and with it the registration of in-source tests.
+
+    Importing selftest takes longer than starting Clingo. Modules get their
+    tester from get_tester(), which is selftest's, so tests run on import as
+    usual. When clingo+ runs without --run-python-tests, defer() is called
+    first; get_tester() then returns a DeferredTester, which does not import
+    selftest and skips test functions, like selftest does with run=False.
+"""
+
+import sys
+
+
+_deferred = False
+
+
+def defer():
+    """ Defers selftest, unless it was imported already (and configured) by another app. """
+    global _deferred
+    if 'selftest' not in sys.modules:
+        _deferred = True
+    return _deferred
+
+
+class DeferredTester:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, *functions, **options):
+        return None
+
+    def __getattr__(self, name):
+        import selftest  # assertions outside tests still work
+        return getattr(selftest.get_tester(self.name), name)
+
+
+def get_tester(name):
+    if _deferred:
+        return DeferredTester(name)
+    import selftest
+    return selftest.get_tester(name)